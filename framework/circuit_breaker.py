@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# framework/circuit_breaker.py
+#
+# 每主机的熔断器，所有工作进程共享 (cache/circuit/<host>.json)。
+# 连续 config.CIRCUIT_THRESHOLD 次失败 (连接错误、超时、429/5xx) 后熔断: 冷却期内对该主机的请求
+# 直接抛出 HostUnavailable，而不是每个进程都重复等待超时与重试。冷却期结束后放行请求 (half-open)，
+# 成功则恢复，失败则立即再次熔断，冷却期加倍 (最多 16 倍)；响应带 Retry-After 时冷却期至少为该值。
+# 因熔断而失败的任务与其他失败一样记入 retry_queue，至少等到熔断结束 (HostUnavailable.open_until) 后才重试。
+
+import json
+import os
+import re
+import sys
+import time
+import requests
+import config
+import utils
+
+class HostUnavailable(requests.exceptions.ConnectionError):
+    """
+    主机处于熔断状态，请求未发出。是 RequestException 的子类，调用者按普通下载失败处理即可。
+    """
+    def __init__(self, host, open_until):
+        self.host = host
+        self.open_until = open_until
+        super().__init__(f"{host} is unavailable (circuit open for another {max(0, open_until - time.time()):.0f}s)")
+
+def _state_file(host):
+    return os.path.join(config.CIRCUIT_DIR, f"{re.sub(r'[^A-Za-z0-9.-]', '_', host)}.json")
+
+def _read_state(host):
+    try:
+        with open(_state_file(host), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {'failures': 0, 'opened': 0, 'open_until': 0}
+
+def _write_state(host, state):
+    state_file = _state_file(host)
+    tmp_file = f"{state_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+def check(host):
+    """
+    主机处于熔断冷却期时抛出 HostUnavailable。不加锁，只读取状态文件。
+    """
+    open_until = _read_state(host).get('open_until', 0)
+    if open_until > time.time():
+        raise HostUnavailable(host, open_until)
+
+def record_success(host):
+    """
+    请求成功 (主机有响应，包括 4xx)：清除连续失败计数并关闭熔断器。
+    """
+    if not _read_state(host).get('failures'):
+        return
+    with utils.file_lock(f"{_state_file(host)}.lock"):
+        _write_state(host, {'failures': 0, 'opened': 0, 'open_until': 0})
+
+def record_failure(host, retry_after=None):
+    """
+    记录一次失败。连续失败达到阈值时熔断，返回 True。
+    """
+    os.makedirs(config.CIRCUIT_DIR, exist_ok=True)
+    with utils.file_lock(f"{_state_file(host)}.lock"):
+        now = time.time()
+        state = _read_state(host)
+        state['failures'] = state.get('failures', 0) + 1
+        tripped = state['failures'] >= config.CIRCUIT_THRESHOLD and state.get('open_until', 0) <= now
+        if tripped:
+            cooldown = config.CIRCUIT_COOLDOWN * 2 ** min(state.get('opened', 0), 4)
+            state['open_until'] = now + max(cooldown, retry_after or 0)
+            state['opened'] = state.get('opened', 0) + 1
+        _write_state(host, state)
+
+    if tripped:
+        print(f"  -> Circuit opened for {host} after {state['failures']} consecutive failures. "
+              f"Skipping its requests for {state['open_until'] - now:.0f}s.", file=sys.stderr)
+    return tripped
@@ -1,16 +1,111 @@
 # framework/config.py
 
 import os
+import re
 
 # Key directories
 SCRIPT_DIR = os.path.abspath(os.path.dirname(__file__))
 OUTPUT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', 'bug-mining'))
-CACHE_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, 'cache'))
+# D4J_CACHE_DIR moves every cache below (repositories, issues, HTTP validators, state) elsewhere
+CACHE_DIR = os.path.abspath(os.environ.get('D4J_CACHE_DIR') or os.path.join(SCRIPT_DIR, 'cache'))
 
 # added shared issues directory
 # .../cache/shared_issues/jira_SLING/issues.txt
 SHARED_ISSUES_DIR = os.path.abspath(os.path.join(CACHE_DIR, 'shared_issues'))
 
+# SQLite index of every issues.txt above, queried by vcs_log_xref.py (issue_index.py)
+# .../cache/shared_issues/issues.sqlite3
+ISSUE_INDEX_FILE = os.path.join(SHARED_ISSUES_DIR, 'issues.sqlite3')
+
+# shared bare repositories, one per normalized repository_url
+# .../cache/repos/github.com_apache_cayenne.git
+REPOS_CACHE_DIR = os.path.abspath(os.path.join(CACHE_DIR, 'repos'))
+
+# ETag / Last-Modified validators for conditional HTTP requests, one JSON file per URL
+# .../cache/http/<sha1 of url>.json
+HTTP_CACHE_DIR = os.path.abspath(os.path.join(CACHE_DIR, 'http'))
+
+# Shared token-bucket state for the per-host request rate limit (rate_limiter.py)
+# .../cache/ratelimit/issues.apache.org.state
+RATE_LIMIT_DIR = os.path.abspath(os.path.join(CACHE_DIR, 'ratelimit'))
+
+# Shared per-host circuit breaker state and the reports skipped while a host was unavailable (circuit_breaker.py)
+# .../cache/circuit/issues.apache.org.json
+CIRCUIT_DIR = os.path.abspath(os.path.join(CACHE_DIR, 'circuit'))
+
+# Persistent queue of failed reports, patches and project stages, retried with backoff (retry_queue.py)
+# .../cache/retry/queue.json
+RETRY_DIR = os.path.abspath(os.path.join(CACHE_DIR, 'retry'))
+
+# Optional partial clone filter for the repository cache, e.g. D4J_CLONE_FILTER=blob:none (or tree:0).
+# xref only needs commit metadata; blobs are fetched in batches when the patch stage needs them.
+CLONE_FILTER = os.environ.get('D4J_CLONE_FILTER', '')
+
+# GitHub API tokens shared by all requests (http_client.py): GH_TOKENS may list several tokens
+# separated by commas or whitespace, GH_TOKEN is the single-token form. Requests are spread across
+# the tokens according to their X-RateLimit-Remaining.
+GITHUB_TOKENS = list(dict.fromkeys(
+    token for token in re.split(r'[\s,]+', f"{os.environ.get('GH_TOKENS', '')} {os.environ.get('GH_TOKEN', '')}") if token
+))
+# Hosts treated as the GitHub API by the rate-limit scheduler (host[:port], comma separated),
+# e.g. a local stand-in server for testing.
+GITHUB_API_HOSTS = [host.strip() for host in os.environ.get('D4J_GITHUB_API_HOSTS', 'api.github.com').split(',') if host.strip()]
+
+# Total requests per second to each tracker host, shared by all worker processes (rate_limiter.py).
+# D4J_HOST_RATE_LIMIT applies to every host (default 0: no limit, as before); D4J_HOST_RATE_LIMITS overrides it
+# per host, e.g. "issues.apache.org=2,api.github.com=10". D4J_HOST_RATE_BURST is the number of requests
+# allowed back to back after an idle period (defaults to one second's worth).
+HOST_RATE_LIMIT = float(os.environ.get('D4J_HOST_RATE_LIMIT', '0'))
+HOST_RATE_LIMITS = {
+    host.strip(): float(rate)
+    for host, _, rate in (item.partition('=') for item in os.environ.get('D4J_HOST_RATE_LIMITS', '').split(','))
+    if host.strip() and rate.strip()
+}
+HOST_RATE_BURST = int(os.environ.get('D4J_HOST_RATE_BURST', '0'))
+
+# Retries of a failed request (connection error, timeout, 429/5xx) with exponential backoff starting at
+# D4J_HTTP_BACKOFF seconds; a Retry-After header takes precedence (http_client.py).
+HTTP_RETRIES = int(os.environ.get('D4J_HTTP_RETRIES', '5'))
+HTTP_BACKOFF = float(os.environ.get('D4J_HTTP_BACKOFF', '1'))
+HTTP_BACKOFF_MAX = float(os.environ.get('D4J_HTTP_BACKOFF_MAX', '120'))
+# After D4J_CIRCUIT_THRESHOLD consecutive failures a host is skipped for D4J_CIRCUIT_COOLDOWN seconds
+# (doubled each time it trips again) by every worker process (circuit_breaker.py).
+CIRCUIT_THRESHOLD = int(os.environ.get('D4J_CIRCUIT_THRESHOLD', '5'))
+CIRCUIT_COOLDOWN = float(os.environ.get('D4J_CIRCUIT_COOLDOWN', '60'))
+# Failed work is queued and retried at the end of the run or on a later run, D4J_RETRY_BACKOFF seconds after
+# the first failure and twice as long after every further failure, up to D4J_RETRY_BACKOFF_MAX (retry_queue.py).
+RETRY_BACKOFF = float(os.environ.get('D4J_RETRY_BACKOFF', '60'))
+RETRY_BACKOFF_MAX = float(os.environ.get('D4J_RETRY_BACKOFF_MAX', '21600'))
+
+# Process pools of the stage scheduler in fast_bug_miner_par.py (stage_scheduler.py):
+# network fetches (clone/fetch, issue lists, reports), git-heavy CPU work (git log + xref, patches)
+# and disk-bound writers (splitting reports out of cached tracker pages), each with its own concurrency.
+NETWORK_WORKERS = int(os.environ.get('D4J_NETWORK_WORKERS', '4'))
+CPU_WORKERS = int(os.environ.get('D4J_CPU_WORKERS', str(os.cpu_count() or 1)))
+DISK_WORKERS = int(os.environ.get('D4J_DISK_WORKERS', '2'))
+
+# Maximum concurrent report downloads per tracker host (report_downloader.py).
+REPORT_HOST_CONCURRENCY = int(os.environ.get('D4J_REPORT_CONCURRENCY', '4'))
+
+# git log format consumed by vcs_log_xref.py: "<commit> <parents...>" line, message body, NUL terminator.
+# Parent hashes come straight from the log, so xref needs no per-commit `git rev-list` call.
+GITLOG_FORMAT = '%H %P%n%B%x00'
+
+# Stream `git log` straight into vcs_log_xref.py (--rev) whenever the log has to be (re)collected, instead of
+# writing gitlog.txt first and reading it back. D4J_GITLOG_CACHE=0 skips teeing the streamed log into the
+# cache file; only <log>.head is kept, so --update still cross-references just the new commits.
+GITLOG_STREAM = os.environ.get('D4J_GITLOG_STREAM', '1') == '1'
+GITLOG_CACHE = os.environ.get('D4J_GITLOG_CACHE', '1') == '1'
+
+# vcs_log_xref.py scans cached log files of at least D4J_XREF_PARALLEL_MIN_MB MiB with D4J_XREF_WORKERS
+# processes (mmap, split at commit boundaries, merged back in log order so bug.id numbering is unchanged).
+XREF_WORKERS = int(os.environ.get('D4J_XREF_WORKERS', str(os.cpu_count() or 1)))
+XREF_PARALLEL_MIN_BYTES = int(float(os.environ.get('D4J_XREF_PARALLEL_MIN_MB', '64')) * (1 << 20))
+
+# Whole-repository log for the multi-project xref (`git log --name-only`): the leading NUL
+# keeps the changed-file list of each commit in its own NUL-separated field.
+GITLOG_NAMES_FORMAT = '%x00%H %P%n%B%x00'
+
 # Bug CSV column names
 BUGS_CSV_BUGID = "bug.id"
 BUGS_CSV_PROJECT_ID = "project_id"
@@ -3,13 +3,32 @@ import os
 import sys
 import json
 import re
+import collections
+import shutil
 import requests
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urlunparse, urlencode, quote_plus
+import http_client
+import issue_index
 
 # Required packages:
 # pip install requests beautifulsoup4
 
+# 增量同步 (-S) 的 high-water mark: 上次同步开始时的 UTC 时间，保存在 output_dir 中
+SYNC_MARK_FILE = 'last_sync.txt'
+# 增量查询向前多取一天，抵消 tracker 服务器时区及日期精度的差异 (重复条目在合并时去除)
+SYNC_MARGIN = timedelta(days=1)
+
+def jira_since_query(query, since):
+    """
+    'issuetype = Bug ORDER BY key DESC' -> 'updated >= "2024/01/31" AND (issuetype = Bug) ORDER BY key DESC'
+    """
+    parts = re.split(r'\s+ORDER\s+BY\s+', query, maxsplit=1, flags=re.IGNORECASE)
+    jql = f'updated >= "{since:%Y/%m/%d}" AND ({parts[0]})'
+    return f"{jql} ORDER BY {parts[1]}" if len(parts) > 1 else jql
+
 SUPPORTED_TRACKERS = {
     'google': {
         'default_tracker_uri': 'https://storage.googleapis.com/google-code-archive/v2/code.google.com/',
@@ -20,7 +39,9 @@ SUPPORTED_TRACKERS = {
             (issue['id'], f"https://storage.googleapis.com/google-code-archive/v2/code.google.com/{quote_plus(project)}/issues/issue-{issue['id']}.json")
             for issue in json.load(open(path))['issues']
             if any(label.startswith('Type-Defect') for label in issue['labels'])
-        ]
+        ],
+        # issues-page-N.json 不包含总数，只能逐窗口探测
+        'total': lambda path, headers, limit: None
     },
     'jira': {
         'default_tracker_uri': 'https://issues.apache.org/jira/',
@@ -28,13 +49,18 @@ SUPPORTED_TRACKERS = {
         'default_limit': 200,
         'build_uri': lambda tracker, project, query, start, limit, org: (
             f"{tracker}sr/jira.issueviews:searchrequest-xml/temp/SearchRequest.xml?"
-            f"jqlQuery={quote_plus(f'project = \"{project}\" AND {query}')}"
-            f"&tempMax={limit}&pager/start={start}"
+            + "jqlQuery=" + quote_plus(f'project = "{project}" AND {query}')
+            + f"&tempMax={limit}&pager/start={start}"
         ),
         'results': lambda path, project: [
             (m.group(1), f"https://issues.apache.org/jira/browse/{m.group(1)}")
             for line in open(path) if (m := re.search(r'^\s*<key.*?>(.*?)</key>', line))
-        ]
+        ],
+        'since_query': lambda query, since: jira_since_query(query, since),
+        # <issue start="0" end="200" total="2361"/>
+        'total': lambda path, headers, limit: next(
+            (int(m.group(1)) for line in open(path) if (m := re.search(r'<issue\s[^>]*total="(\d+)"', line))), None
+        )
     },
     'github': {
         'default_tracker_uri': 'https://api.github.com/repos/',
@@ -48,7 +74,14 @@ SUPPORTED_TRACKERS = {
             (issue['number'], issue['html_url'])
             for issue in json.load(open(path))
             if 'pull_request' not in issue
-        ]
+        ],
+        'since_query': lambda query, since: f"{query}&since={since:%Y-%m-%dT%H:%M:%SZ}",
+        # Link: <...&page=34>; rel="last"  (没有 Link 头说明只有一页；缓存的页面没有响应头)
+        'total': lambda path, headers, limit: (
+            None if headers is None else
+            limit * int(m.group(1)) if (m := re.search(r'[?&]page=(\d+)[^>]*>;\s*rel="last"', headers.get('Link', ''))) else
+            limit
+        )
     },
     'sourceforge': {
         'default_tracker_uri': 'http://sourceforge.net/rest/p/',
@@ -60,7 +93,8 @@ SUPPORTED_TRACKERS = {
         'results': lambda path, project: [
             (ticket['ticket_num'], f"https://sourceforge.net{json.load(open(path))['tracker_config']['options']['url']}{ticket['ticket_num']}")
             for ticket in json.load(open(path))['tickets']
-        ]
+        ],
+        'total': lambda path, headers, limit: json.load(open(path)).get('count')
     },
     'bugzilla': {
         'default_tracker_uri': 'https://bz.apache.org/bugzilla/',
@@ -73,30 +107,92 @@ SUPPORTED_TRACKERS = {
         'results': lambda path, project: [
             (m.group(1), f"https://bz.apache.org/bugzilla/show_bug.cgi?id={m.group(1)}")
             for line in open(path) if (m := re.search(r'^\s*<bug_id>(.*?)</bug_id>', line))
-        ]
+        ],
+        # 作用于 buglist.cgi 的 URI (build_uri 不使用 query)
+        'since_uri': lambda uri, since: f"{uri}&chfieldfrom={since:%Y-%m-%d}&chfieldto=Now"
     }
 }
 
-def get_file(uri, save_to, session):
-    headers = {}
-    # use GH_TOKEN if available for GitHub API requests
-    if 'api.github.com' in uri and os.environ.get('GH_TOKEN'):
-        headers['Authorization'] = f"token {os.environ['GH_TOKEN']}"
-    
+def get_file(uri, save_to, session, response_headers=None):
+    # GitHub token (GH_TOKEN / GH_TOKENS) 与速率限制由 http_client 统一处理
     try:
-        response = session.get(uri, headers=headers, timeout=20)
-        response.raise_for_status() 
-        
-        with open(save_to, 'w', encoding='utf-8') as f:
-            f.write(response.text)
+        response, hit = http_client.fetch(session, uri, save_to, timeout=20)
+        # 304 响应不一定带有完整的响应头 (例如 GitHub 的 Link)，只使用 200 的响应头
+        if response_headers is not None and not hit:
+            response_headers.update(response.headers)
         return True
     except requests.exceptions.RequestException as e:
         print(f"Error downloading {uri}: {e}", file=sys.stderr)
         return False
 
+def download_page(uri, out_file, session, debug=False, response_headers=None, refresh=False):
+    """
+    下载一页结果到 out_file；已缓存 (非空) 的页面直接跳过。
+    refresh 为 True 时，有 ETag / Last-Modified 记录的缓存页面改为发送条件请求重新验证。
+    response_headers 为 dict 时填入响应头；命中缓存时保持为空。
+    """
+    if os.path.exists(out_file) and os.path.getsize(out_file) > 0 and not (refresh and http_client.has_validators(uri, out_file)):
+        if debug: print(f"Skipping download of {out_file}")
+        return True
+    if debug: print(f"Downloading {uri} to {out_file}")
+    return get_file(uri, out_file, session, response_headers)
+
+def read_sync_mark(output_dir, issues_file):
+    """
+    返回上次同步开始的 UTC 时间。
+    旧缓存没有记录时，退回到 issues_file 的修改时间 (即上次完整下载结束的时间)。
+    """
+    try:
+        with open(os.path.join(output_dir, SYNC_MARK_FILE), 'r', encoding='utf-8') as f:
+            return datetime.fromisoformat(f.read().strip())
+    except (IOError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(issues_file), timezone.utc)
+
+def commit_issues_file(issues_file, results_file, output_dir, synced_at, merge=False):
+    """
+    用 results_file 原子地替换 issues_file，读者不会看到写了一半的文件。
+    merge 为 True (增量同步) 时保留已有条目，只追加 id 尚不存在的新条目。
+    成功后记录本次同步的 high-water mark 并更新共享的 issue 索引，返回写入 (或新增) 的条目数；失败返回 None。
+    """
+    try:
+        with open(results_file, 'r', encoding='utf-8') as f:
+            new_lines = [line for line in f if line.strip()]
+        changed = [tuple(part.strip() for part in line.split(',', 1)) for line in new_lines if ',' in line]
+
+        if merge:
+            with open(issues_file, 'r', encoding='utf-8') as f:
+                old_lines = [line if line.endswith('\n') else line + '\n' for line in f if line.strip()]
+            known_ids = {line.split(',', 1)[0] for line in old_lines}
+            added = []
+            for line in new_lines:
+                issue_id = line.split(',', 1)[0]
+                if issue_id not in known_ids:
+                    known_ids.add(issue_id)
+                    added.append(line)
+            with open(results_file, 'w', encoding='utf-8') as f:
+                f.writelines(old_lines + added)
+            new_lines = added
+
+        os.replace(results_file, issues_file)
+
+        mark_tmp = os.path.join(output_dir, f".{SYNC_MARK_FILE}.tmp")
+        with open(mark_tmp, 'w', encoding='utf-8') as f:
+            f.write(synced_at.isoformat())
+        os.replace(mark_tmp, os.path.join(output_dir, SYNC_MARK_FILE))
+    except IOError as e:
+        print(f"Error writing to {issues_file}: {e}", file=sys.stderr)
+        return None
+
+    # 索引更新失败不影响 issues.txt；读取方发现索引过期时会从 issues.txt 重新导入
+    issue_index.index_issues(issues_file, changed if merge else None, synced_at)
+    return len(new_lines)
+
 def get_bugzilla_id_list(uri, project_name, session):
+    """
+    返回查询结果中的 Bugzilla ID 列表 (没有结果时为空列表)；下载失败时返回 None。
+    """
     try:
-        response = session.get(uri, timeout=10)
+        response = http_client.get(session, uri, timeout=10)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -115,7 +211,7 @@ def get_bugzilla_id_list(uri, project_name, session):
         return hidden_input['value'].split(',')
     except requests.exceptions.RequestException as e:
         print(f"Error parsing Bugzilla list {uri}: {e}", file=sys.stderr)
-        return []
+        return None
 
 def main():
     parser = argparse.ArgumentParser(description="Download issues from an issue tracker.")
@@ -127,6 +223,12 @@ def main():
     parser.add_argument('-q', dest='query', help="Custom query")
     parser.add_argument('-u', dest='tracker_uri', help="Custom tracker URI")
     parser.add_argument('-l', dest='limit', type=int, help="Fetching limit per page")
+    parser.add_argument('-j', dest='jobs', type=int, default=8, help="Maximum concurrent requests to the tracker host")
+    parser.add_argument('-c', dest='chunk_size', type=int, default=50, help="Bugzilla IDs per show_bug.cgi XML request")
+    parser.add_argument('-S', dest='sync', action='store_true',
+                        help="Delta sync: only fetch issues changed since the last sync and merge them into issues_file")
+    parser.add_argument('-R', dest='refresh', action='store_true',
+                        help="Revalidate cached pages that have ETag/Last-Modified validators with conditional requests")
     parser.add_argument('-D', dest='debug', action='store_true', help="Enable debug logging")
     
     args = parser.parse_args()
@@ -145,98 +247,185 @@ def main():
     tracker_uri = args.tracker_uri or tracker['default_tracker_uri']
     limit = args.limit or tracker['default_limit']
     debug = args.debug
+    jobs = max(1, args.jobs)
+    refresh = args.refresh
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # Set up a session with retries
+    # Set up a session; retries and backoff are done by http_client.request() so that
+    # the shared circuit breaker sees every failure
     session = requests.Session()
-    adapter = requests.adapters.HTTPAdapter(max_retries=5)
+    adapter = requests.adapters.HTTPAdapter(max_retries=0, pool_maxsize=max(jobs, 10))
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     session.headers.update({'User-Agent': 'Mozilla/5.0'})
 
     print("----------------------------------------------")
-    
+
+    # 结果先写入临时文件，完成后再原子地替换 (或合并到) issues_file
+    synced_at = datetime.now(timezone.utc)
+    results_file = f"{issues_file}.tmp"
+    page_dir = output_dir
+    sync = args.sync and os.path.exists(issues_file) and os.path.getsize(issues_file) > 0
+    if sync:
+        if 'since_query' not in tracker and 'since_uri' not in tracker:
+            print(f"Tracker {args.tracker_name} does not support delta sync. Keeping cached {issues_file}.")
+            sys.exit(0)
+        since = read_sync_mark(output_dir, issues_file) - SYNC_MARGIN
+        print(f"Delta sync of {tracker_id}: fetching issues changed since {since:%Y-%m-%d %H:%M} UTC")
+        if 'since_query' in tracker:
+            query = tracker['since_query'](query, since)
+        # 增量结果页不能与完整列表的页面缓存混用，每次同步都重新下载
+        page_dir = os.path.join(output_dir, 'delta')
+        shutil.rmtree(page_dir, ignore_errors=True)
+        os.makedirs(page_dir, exist_ok=True)
+    open(results_file, 'w').close()
+
     start = 0
 
-    # Bugzilla special handling (to be updated)
+    # Bugzilla special handling
     if args.tracker_name == 'bugzilla':
         list_uri = tracker['build_uri'](tracker_uri, tracker_id, query, 0, 0, organization_id)
+        if sync:
+            list_uri = tracker['since_uri'](list_uri, since)
         if debug: print(f"Fetching Bugzilla ID list from: {list_uri}")
         id_list = get_bugzilla_id_list(list_uri, tracker_id, session)
+        if id_list is None:
+            # 列表不完整时不能提交，否则 high-water mark 会越过未取得的修改
+            sys.exit(1)
         if not id_list:
+            if sync:
+                commit_issues_file(issues_file, results_file, output_dir, synced_at, merge=True)
+                print("No Bugzilla issues changed since the last sync.")
+                sys.exit(0)
             print("No Bugzilla IDs found.", file=sys.stderr)
             sys.exit(0)
             
         if debug: print(f"Found {len(id_list)} Bugzilla IDs.")
         
-        all_results = []
-        for i in range(0, len(id_list), 50):
-            chunk = id_list[i:i+50]
-            ids_query = "&".join([f"id={bid}" for bid in chunk])
+        # 按 chunk_size 分块并发下载 (最多 `jobs` 个请求同时发往 Bugzilla)，再按块顺序合并，
+        # 因此 issues.txt 仍按 ID 顺序排列。默认块大小沿用原有的缓存文件名。
+        chunk_size = max(1, args.chunk_size)
+        name_suffix = '' if chunk_size == 50 else f"-{chunk_size}"
+        chunks = []
+        for i in range(0, len(id_list), chunk_size):
+            ids_query = "&".join([f"id={bid}" for bid in id_list[i:i+chunk_size]])
             xml_uri = f"https://bz.apache.org/bugzilla/show_bug.cgi?ctype=xml&{ids_query}"
-            out_file = os.path.join(output_dir, f"{tracker_id}-issues-xml-{i}.txt")
-            
-            if not os.path.exists(out_file) or os.path.getsize(out_file) == 0:
-                if debug: print(f"Downloading {xml_uri} to {out_file}")
-                if not get_file(xml_uri, out_file, session):
-                    print(f"Could not download {xml_uri}", file=sys.stderr)
-                    continue
-            
+            out_file = os.path.join(page_dir, f"{tracker_id}-issues-xml-{i}{name_suffix}.txt")
+            chunks.append((xml_uri, out_file))
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            downloaded = list(executor.map(lambda chunk: download_page(chunk[0], chunk[1], session, debug, refresh=refresh), chunks))
+
+        failed = [xml_uri for (xml_uri, _), ok in zip(chunks, downloaded) if not ok]
+        if failed:
+            # 与其他 tracker 的页面下载失败一样放弃本次结果，保留原有的 issues_file 与 high-water mark
+            for xml_uri in failed:
+                print(f"Error: Could not download {xml_uri}", file=sys.stderr)
+            sys.exit(1)
+
+        all_results = []
+        for _, out_file in chunks:
             results = tracker['results'](out_file, tracker_id)
             all_results.extend(results)
-            
+
         try:
-            with open(issues_file, 'w', encoding='utf-8') as f:
+            with open(results_file, 'w', encoding='utf-8') as f:
                 for issue_id, issue_url in all_results:
                     f.write(f"{issue_id},{issue_url}\n")
         except IOError as e:
-            print(f"Error writing to {issues_file}: {e}", file=sys.stderr)
-            
-        print(f"Bugzilla processing complete. Wrote {len(all_results)} issues.")
+            print(f"Error writing to {results_file}: {e}", file=sys.stderr)
+            sys.exit(1)
+
+        written = commit_issues_file(issues_file, results_file, output_dir, synced_at, merge=sync)
+        if written is None:
+            sys.exit(1)
+        print(f"Bugzilla processing complete. {'Added' if sync else 'Wrote'} {written} issues.")
+        print(http_client.summary())
         sys.exit(0)
 
     # other trackers's processing
+    # 第一页顺序下载，用于得到结果总数；其余页面用最多 `jobs` 个线程并发预取，
+    # 但始终按页码顺序解析并追加到结果文件，输出与逐页下载完全一致。
+    # 无法得到总数 (Google、命中缓存的 GitHub 首页) 时，按窗口推测预取，遇到空页即停止。
+    project_in_file = tracker_id.replace('/', '-')
+    page_uri = lambda start: tracker['build_uri'](tracker_uri, tracker_id, query, start, limit, organization_id)
+    page_file = lambda start: os.path.join(page_dir, f"{project_in_file}-issues-{start}.json")
+
+    first_headers = {}
+    if not download_page(page_uri(start), page_file(start), session, debug, first_headers, refresh):
+        print(f"Error: Could not download {page_uri(start)}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        total = tracker['total'](page_file(start), first_headers or None, limit)
+    except Exception as e:
+        if debug: print(f"Could not determine total from {page_file(start)}: {e}")
+        total = None
+    if debug: print(f"Total results: {total if total is not None else 'unknown'}")
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    window = collections.deque() # [(start, future)]，按页码顺序
+    next_start = start + limit
+    downloaded = True
     give_up = False # special logic for Google tracker
-    while True:
-        uri = tracker['build_uri'](tracker_uri, tracker_id, query, start, limit, organization_id)
-        project_in_file = tracker_id.replace('/', '-')
-        out_file = os.path.join(output_dir, f"{project_in_file}-issues-{start}.json")
-        
-        if not os.path.exists(out_file) or os.path.getsize(out_file) == 0:
-            if debug: print(f"Downloading {uri} to {out_file}")
-            if not get_file(uri, out_file, session):
+    try:
+        while True:
+            if not downloaded:
                 if give_up: # Google tracker special logic
                     break
                 else:
-                    print(f"Error: Could not download {uri}", file=sys.stderr)
+                    print(f"Error: Could not download {page_uri(start)}", file=sys.stderr)
                     sys.exit(1)
-        else:
-            if debug: print(f"Skipping download of {out_file}")
-        
-        try:
-            results = tracker['results'](out_file, tracker_id)
-        except Exception as e:
-            if debug: print(f"Failed to parse {out_file}: {e}. Assuming end of results.")
-            results = []
 
-        if results:
+            out_file = page_file(start)
+            try:
+                results = tracker['results'](out_file, tracker_id)
+            except Exception as e:
+                if debug: print(f"Failed to parse {out_file}: {e}. Assuming end of results.")
+                results = []
+
+            if not results:
+                if debug: print("No more results found. Stopping.")
+                break
+
             try:
                 # use 'a' (append) mode
-                with open(issues_file, 'a', encoding='utf-8') as f:
+                with open(results_file, 'a', encoding='utf-8') as f:
                     for issue_id, issue_url in results:
                         f.write(f"{issue_id},{issue_url}\n")
             except IOError as e:
-                print(f"Cannot write to {issues_file}: {e}", file=sys.stderr)
+                print(f"Cannot write to {results_file}: {e}", file=sys.stderr)
                 sys.exit(1)
-            
+
             if args.tracker_name == 'google':
                 give_up = True # special logic for Google tracker
-            
-            start += limit 
-        else:
-            if debug: print("No more results found. Stopping.")
-            break 
+
+            # 补满预取窗口；已知总数时不请求超出范围的页面
+            while len(window) < jobs and (total is None or next_start < total):
+                window.append((next_start, executor.submit(
+                    download_page, page_uri(next_start), page_file(next_start), session, debug, None, refresh
+                )))
+                next_start += limit
+            if not window:
+                if debug: print("All pages fetched. Stopping.")
+                break
+
+            start, future = window.popleft()
+            downloaded = future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if total is None:
+            # 删除越过末尾的推测页面，避免日后结果增多时被当作缓存的空页
+            for page_start, future in window:
+                if future.done() and not future.cancelled() and os.path.exists(page_file(page_start)):
+                    os.remove(page_file(page_start))
+
+    written = commit_issues_file(issues_file, results_file, output_dir, synced_at, merge=sync)
+    if written is None:
+        sys.exit(1)
+    if sync:
+        print(f"Delta sync complete. Added {written} new issues to {issues_file}.")
+    print(http_client.summary())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,12 +3,23 @@
 
 import os
 import sys  
-import subprocess
+import argparse
 import csv
 import utils
 import config
+import fetch_reports
+import generate_patches
+import http_client
+import materialize_reports
+import pipeline_state
+import report_downloader
+import repo_cache
+import retry_queue
+import vcs_log_xref
 import codecs
+import functools
 import shutil
+import threading
 
 # Tee class for duplicating stderr output
 class Tee(object):
@@ -22,12 +33,568 @@ class Tee(object):
         for f in self.files:
             f.flush()
 
-def process_project(project_id, project_name, repository_url, issue_tracker_name, issue_tracker_project_id, bug_fix_regex, sub_project_path):
+# Buffers output written by background threads so it does not interleave with the main thread's output
+class ThreadOutput(object):
+    def __init__(self, stream, buffer):
+        self.stream = stream
+        self.buffer = buffer # [(stream, text), ...]，stdout 与 stderr 共享，保持原有顺序
+        self.owner = threading.current_thread()
+    def write(self, obj):
+        if threading.current_thread() is self.owner:
+            self.stream.write(obj)
+        else:
+            self.buffer.append((self.stream, obj))
+    def flush(self):
+        self.stream.flush()
+
+def unescape_regex(bug_fix_regex):
+    """
+    项目列表中的正则是转义过的 (例如 "/(BSF-\\\\d+)/mi")，还原为实际的正则字符串。
+    """
+    try:
+        return codecs.decode(bug_fix_regex, 'unicode_escape')
+    except Exception:
+        print(f"  -> Warning: Could not unescape regex: {bug_fix_regex!r}. Using raw value.", file=sys.stderr)
+        return bug_fix_regex
+
+def write_log_head(log_file, head):
+    """
+    原子地写入 <log_file>.head: 日志覆盖到的 HEAD commit，以及此时日志的长度 (用于发现中断的追加)。
+    """
+    size = f"{os.path.getsize(log_file)}\n" if os.path.exists(log_file) else ''
+    pipeline_state.write_atomic(f"{log_file}.head", f"{head}\n{size}")
+
+def logged_head(log_file):
+    """
+    返回缓存日志覆盖到的 HEAD commit: <log_file>.head 的记录，旧缓存则取日志中最后一个 commit；都没有时返回 None。
+    日志比 .head 记录的长度更长时 (上次追加增量日志时中断)，先截断多出的部分。
+    """
+    head_file = f"{log_file}.head"
+    if os.path.exists(head_file):
+        with open(head_file, 'r', encoding='utf-8') as f:
+            lines = f.read().split()
+        if len(lines) > 1 and os.path.exists(log_file) and os.path.getsize(log_file) > int(lines[1]):
+            print(f"  -> Truncating interrupted append to {log_file}", file=sys.stderr)
+            os.truncate(log_file, int(lines[1]))
+        return lines[0] if lines else None
+    if os.path.exists(log_file):
+        return vcs_log_xref.last_logged_commit(log_file)
+    return None
+
+def collect_git_log(cache_repo_dir, log_file, log_options, pathspec, desc, update=False):
+    """
+    生成 git log 缓存文件 log_file，并在 <log_file>.head 中记录日志覆盖到的 HEAD commit。
+    update 为 True 且日志已存在时，只把 <上次 HEAD>..HEAD 的新 commit 写入 <log_file>.delta，
+    由调用者 cross-reference 之后再通过 append_git_log() 合并进缓存。
+    返回 (success, delta_log)；delta_log 为 (delta_file, head) 或 None (没有新 commit)。
+    """
+    if os.path.exists(log_file) and not update:
+        return True, None
+
+    head = repo_cache.get_head_commit(cache_repo_dir)
+    if not head:
+        return False, None
+
+    cmd_log_list = [
+        'git',
+        f'--git-dir={cache_repo_dir}',
+        'log',
+        '--reverse'
+    ]
+
+    if not os.path.exists(log_file):
+        # 先写临时文件，中断的 git log 不会被当作完整的缓存
+        success, _ = utils.exec_cmd(cmd_log_list + log_options + [head] + pathspec, desc, output_file=f"{log_file}.tmp")
+        if success:
+            os.replace(f"{log_file}.tmp", log_file)
+            write_log_head(log_file, head)
+        return success, None
+
+    last_head = logged_head(log_file)
+    if last_head == head:
+        print(f"Git log {os.path.basename(log_file)} is up to date.")
+        return True, None
+
+    with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+        if vcs_log_xref.detect_log_format(f) == 'medium':
+            # 旧缓存的日志为默认格式，新 commit 也必须用相同格式追加
+            log_options = [opt for opt in log_options if not opt.startswith('--format=')]
+
+    revision_range = f"{last_head}..{head}" if last_head else head
+    delta_file = f"{log_file}.delta"
+    success, _ = utils.exec_cmd(cmd_log_list + log_options + [revision_range] + pathspec, desc, output_file=delta_file)
+    if not success:
+        return False, None
+    return True, (delta_file, head)
+
+def append_git_log(log_file, delta_log):
+    """
+    将 collect_git_log() 生成的增量日志追加到缓存日志末尾，并更新 .head 记录。
+    """
+    delta_file, head = delta_log
+    logged_head(log_file) # 先截断上次中断的追加
+    with open(log_file, 'ab') as dst, open(delta_file, 'rb') as src:
+        shutil.copyfileobj(src, dst)
+    # .head 更新之前中断时，下次读取会截断这次追加的内容并重新收集
+    write_log_head(log_file, head)
+    os.remove(delta_file)
+
+def stream_xref(cmd_xref_list, cache_repo_dir, log_file, last_head, desc):
+    """
+    流式 cross-reference: vcs_log_xref.py --rev 直接读取 `git log` 的管道输出，不先写出完整的日志文件。
+    last_head 为 None 时处理完整日志，否则只处理 <last_head>..HEAD 的新 commit。
+    config.GITLOG_CACHE 为 True 时日志同时写入 (或追加到) 缓存 log_file；总是更新 <log_file>.head。
+    成功返回 True。
+    """
+    head = repo_cache.get_head_commit(cache_repo_dir)
+    if not head:
+        return False
+    if last_head == head:
+        print(f"Git log {os.path.basename(log_file)} is up to date.")
+        return True
+
+    tee_file = None
+    if config.GITLOG_CACHE and (last_head is None or os.path.exists(log_file)):
+        tee_file = f"{log_file}.delta" if last_head else f"{log_file}.tmp"
+    cmd_xref_list = cmd_xref_list + ['--rev', f"{last_head}..{head}" if last_head else head]
+    if tee_file:
+        cmd_xref_list += ['-l', tee_file]
+
+    success, _ = utils.exec_cmd(cmd_xref_list, desc)
+    if not success:
+        return False
+    if last_head and tee_file:
+        append_git_log(log_file, (tee_file, head))
+    else:
+        if tee_file:
+            os.replace(tee_file, log_file)
+        write_log_head(log_file, head)
+    return True
+
+def group_xref_command(repository_url, cache_repo_dir, entries, desc_prefix=''):
+    """
+    返回对 entries [(project, issues_file, output_csv_file), ...] 执行多项目 vcs_log_xref.py 的命令 (不含日志参数)。
+    """
+    cmd_xref_list = [
+        sys.executable,
+        os.path.join(config.SCRIPT_DIR, 'vcs_log_xref.py'),
+        '-r', cache_repo_dir,
+        '-ru', repository_url
+    ]
+    for project, issues_file, output_csv_file in entries:
+        print(f"{desc_prefix}Regex for bug-fixing commits of {project['project_id']}: {project['bug_fix_regex']!r}")
+        cmd_xref_list += [
+            '-p',
+            project['project_id'],
+            project['sub_project_path'],
+            unescape_regex(project['bug_fix_regex']),
+            issues_file,
+            output_csv_file
+        ]
+    return cmd_xref_list
+
+def run_group_xref(repository_url, cache_repo_dir, log_file, entries, desc_prefix=''):
+    """
+    对 entries [(project, issues_file, output_csv_file), ...] 执行一次多项目 vcs_log_xref.py，
+    结果追加到各自的 active-bugs.csv。成功返回 True。
+    """
+    cmd_xref_list = group_xref_command(repository_url, cache_repo_dir, entries, desc_prefix) + ['-l', log_file]
+    project_ids = ", ".join(project['project_id'] for project, _, _ in entries)
+    success, _ = utils.exec_cmd(cmd_xref_list, f"{desc_prefix}Cross-referencing log for {project_ids}")
+    return success
+
+def write_csv_headers(output_csv_files):
+    """
+    为新的 active-bugs.csv 写入表头。成功返回 True。
+    """
+    try:
+        for output_csv_file in output_csv_files:
+            os.makedirs(os.path.dirname(output_csv_file), exist_ok=True)
+            with open(output_csv_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(config.ACTIVE_BUGS_HEADER)
+    except IOError as e:
+        print(f"Error: Cannot write header to {output_csv_file}: {e}. Skipping.", file=sys.stderr)
+        return False
+    return True
+
+def xref_repo_group(repository_url, cache_repo_dir, projects, desc_prefix='', update=False):
+    """
+    为共享同一仓库的多个项目一次性生成 active-bugs.csv:
+    整个仓库只执行一次 `git log --name-only`，并由 vcs_log_xref.py 在同一遍中处理所有子项目。
+    只处理 issues 已下载的项目；active-bugs.csv 已存在的项目在 update 模式下只追加新 commit 的结果。
+    每个被修改的 active-bugs.csv 都在对应项目的 pipeline_state 中记录检查点，失败或中断后回滚。
+    成功返回 True。
+    """
+    repo_base = os.path.splitext(cache_repo_dir)[0]
+    repo_gitlog_file = f"{repo_base}.gitlog.txt"
+
+    # 并行工作进程中，同一仓库组只由一个进程执行 xref，其余进程等待并复用结果
+    with utils.file_lock(f"{repo_base}.xref.lock"):
+        pending = []
+        existing = []
+        for project in projects:
+            issue_cache_key = f"{project['issue_tracker_name']}_{project['issue_tracker_project_id']}"
+            issues_file = os.path.join(config.SHARED_ISSUES_DIR, issue_cache_key, 'issues.txt')
+            output_csv_file = os.path.join(config.OUTPUT_DIR, project['project_id'], 'active-bugs.csv')
+            # 持有锁时仍为 running 的 xref 一定是中断的，先回滚不完整的 CSV (以及共享的 git log 缓存)
+            pipeline_state.rollback_xref(pipeline_state.for_project(project['project_id']), output_csv_file)
+            if not os.path.exists(issues_file) or os.path.getsize(issues_file) == 0:
+                continue
+            if os.path.exists(output_csv_file):
+                existing.append((project, issues_file, output_csv_file))
+            else:
+                pending.append((project, issues_file, output_csv_file))
+
+        if not pending and not (update and existing):
+            return True
+
+        touched = pending + (existing if update else [])
+        for project, _, output_csv_file in touched:
+            pipeline_state.checkpoint_xref(pipeline_state.for_project(project['project_id']), output_csv_file,
+                                           repo_gitlog_file)
+
+        success = xref_group_entries(repository_url, cache_repo_dir, repo_gitlog_file, pending, existing,
+                                     desc_prefix, update)
+        for project, _, output_csv_file in touched:
+            state = pipeline_state.for_project(project['project_id'])
+            if success:
+                state.finish('xref')
+            else:
+                pipeline_state.rollback_xref(state, output_csv_file)
+    return success
+
+def xref_group_entries(repository_url, cache_repo_dir, repo_gitlog_file, pending, existing, desc_prefix='', update=False):
+    """
+    xref_repo_group() 的主体 (持有仓库组的锁): pending 为尚无 active-bugs.csv 的项目，existing 为已有结果的项目，
+    均为 [(project, issues_file, output_csv_file), ...]。成功返回 True；失败时由调用者回滚 CSV。
+    """
+    project_ids = ", ".join(project['project_id'] for project, _, _ in pending or existing)
+    desc = f"{desc_prefix}Cross-referencing streamed log for {project_ids}"
+    if config.GITLOG_STREAM and pending and not existing and not os.path.exists(repo_gitlog_file):
+        # 首次运行: xref 直接读取 git log 管道
+        return write_csv_headers([output_csv_file for _, _, output_csv_file in pending]) and stream_xref(
+            group_xref_command(repository_url, cache_repo_dir, pending, desc_prefix),
+            cache_repo_dir, repo_gitlog_file, None, desc)
+    last_head = logged_head(repo_gitlog_file)
+    if config.GITLOG_STREAM and not pending and last_head:
+        # 增量更新: 只把新 commit 的日志流式交给 xref
+        return stream_xref(group_xref_command(repository_url, cache_repo_dir, existing, desc_prefix),
+                           cache_repo_dir, repo_gitlog_file, last_head, desc)
+
+    success, delta_log = collect_git_log(
+        cache_repo_dir,
+        repo_gitlog_file,
+        ['--name-only', '--no-renames', f'--format={config.GITLOG_NAMES_FORMAT}'],
+        [],
+        f"{desc_prefix}Collecting git log for {repository_url}",
+        update=update
+    )
+    if not success:
+        return False
+
+    if delta_log:
+        # 增量更新: 已有结果的项目只 cross-reference 新 commit
+        if existing and not run_group_xref(repository_url, cache_repo_dir, delta_log[0], existing, desc_prefix):
+            return False
+        append_git_log(repo_gitlog_file, delta_log)
+
+    if not pending:
+        return True
+
+    return write_csv_headers([output_csv_file for _, _, output_csv_file in pending]) and run_group_xref(
+        repository_url, cache_repo_dir, repo_gitlog_file, pending, desc_prefix)
+
+def single_xref_command(project_id, repository_url, bug_fix_regex, cache_repo_dir, cache_issues_file, output_csv_file):
+    """
+    返回单项目 vcs_log_xref.py 的命令 (不含日志参数)。
+    """
+    return [
+        sys.executable,
+        os.path.join(config.SCRIPT_DIR, 'vcs_log_xref.py'),
+        '-e', unescape_regex(bug_fix_regex),
+        '-r', cache_repo_dir,
+        '-i', cache_issues_file,
+        '-f', output_csv_file,
+        '-ru', repository_url,
+        '-pid', project_id
+    ]
+
+def is_medium_log(log_file):
+    """
+    缓存日志为旧的默认 (medium) 格式时返回 True；新 commit 只能用相同格式追加，不能流式处理。
+    """
+    if not os.path.exists(log_file):
+        return False
+    with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+        return vcs_log_xref.detect_log_format(f) == 'medium'
+
+def xref_project(project_id, project_name, repository_url, bug_fix_regex, sub_project_path,
+                 cache_repo_dir, cache_issues_file, cache_gitlog_file, output_csv_file,
+                 siblings=None, update=False, desc_prefix=''):
+    """
+    收集 git log 并与 issues 做 cross-reference，生成 (或在 update 模式下追加) active-bugs.csv。
+    共享仓库的项目交给 xref_repo_group() 一次性处理。
+    修改 active-bugs.csv 之前在 pipeline_state 中记录检查点: 失败时 (或下次运行发现上次中断时) 回滚到修改前的内容。
+    成功返回 True。
+    """
+    if siblings is not None and len(siblings) > 1:
+        print(f"{desc_prefix}Git log for {project_name} is collected once for all projects sharing {repository_url}.")
+        if not xref_repo_group(repository_url, cache_repo_dir, siblings, desc_prefix, update=update):
+            print(f"Error: Failed to cross-reference log for {project_id}. Skipping.", file=sys.stderr)
+            return False
+        return True
+
+    state = pipeline_state.for_project(project_id)
+    pipeline_state.checkpoint_xref(state, output_csv_file, cache_gitlog_file)
+    success = xref_single_project(project_id, project_name, repository_url, bug_fix_regex, sub_project_path,
+                                  cache_repo_dir, cache_issues_file, cache_gitlog_file, output_csv_file,
+                                  update, desc_prefix)
+    if success:
+        state.finish('xref')
+    else:
+        pipeline_state.rollback_xref(state, output_csv_file)
+    return success
+
+def xref_single_project(project_id, project_name, repository_url, bug_fix_regex, sub_project_path,
+                        cache_repo_dir, cache_issues_file, cache_gitlog_file, output_csv_file,
+                        update=False, desc_prefix=''):
+    """
+    xref_project() 中不共享仓库的项目。成功返回 True。
+    """
+    # 已有结果且不是 update 模式时不需要日志 (D4J_GITLOG_CACHE=0 时不会保留 gitlog.txt，不能以它判断)
+    if os.path.exists(output_csv_file) and not update:
+        print(f"{desc_prefix}Bugs file {output_csv_file} already exists.")
+        return True
+
+    # 流式模式: 需要新收集日志时 (首次运行，或 update 时有新 commit)，xref 直接读取 git log 管道
+    if config.GITLOG_STREAM and not is_medium_log(cache_gitlog_file):
+        last_head = logged_head(cache_gitlog_file)
+        fresh = not os.path.exists(output_csv_file) and not os.path.exists(cache_gitlog_file)
+        if fresh or (update and os.path.exists(output_csv_file) and last_head):
+            if fresh and not write_csv_headers([output_csv_file]):
+                return False
+            print(f"{desc_prefix}Regex for bug-fixing commits: {bug_fix_regex!r}")
+            cmd_xref_list = single_xref_command(project_id, repository_url, bug_fix_regex, cache_repo_dir,
+                                                cache_issues_file, output_csv_file) + ['--path', sub_project_path]
+            if not stream_xref(cmd_xref_list, cache_repo_dir, cache_gitlog_file, None if fresh else last_head,
+                               f"{desc_prefix}Cross-referencing streamed log for {project_id}"):
+                print(f"Error: Failed to cross-reference log for {project_id}. Skipping.", file=sys.stderr)
+                return False
+            return True
+
+    # 3c. getting git log
+    delta_log = None
+    if not os.path.exists(cache_gitlog_file) or update:
+        success, delta_log = collect_git_log(
+            cache_repo_dir,
+            cache_gitlog_file,
+            [f'--format={config.GITLOG_FORMAT}'],
+            ['--', sub_project_path],
+            f"{desc_prefix}Collecting git log for {project_name}",
+            update=update
+        )
+        if not success:
+            print(f"Error: Failed to get git log for {project_name}. Skipping.", file=sys.stderr)
+            return False
+        if delta_log and not os.path.exists(output_csv_file):
+            # 尚未 cross-reference 过: 直接合并日志，下面对完整日志做 cross-reference
+            append_git_log(cache_gitlog_file, delta_log)
+            delta_log = None
+    else:
+        print(f"{desc_prefix}Git log for {project_name} already cached.")
+
+    # 3d. cross-referencing git log with issues
+    if not os.path.exists(output_csv_file) or delta_log:
+        if delta_log:
+            # 增量更新: 只 cross-reference 新 commit，bug.id 接着已有编号追加
+            xref_log_file = delta_log[0]
+        else:
+            xref_log_file = cache_gitlog_file
+            if not write_csv_headers([output_csv_file]):
+                return False
+
+        print(f"{desc_prefix}Regex for bug-fixing commits: {bug_fix_regex!r}")
+
+        cmd_xref_list = single_xref_command(project_id, repository_url, bug_fix_regex, cache_repo_dir,
+                                            cache_issues_file, output_csv_file) + ['-l', xref_log_file]
+        success, _ = utils.exec_cmd(cmd_xref_list, f"{desc_prefix}Cross-referencing log for {project_id}")
+        if not success:
+            print(f"Error: Failed to cross-reference log for {project_id}. Skipping.", file=sys.stderr)
+            return False
+        if delta_log:
+            append_git_log(cache_gitlog_file, delta_log)
+    else:
+        print(f"{desc_prefix}Bugs file {output_csv_file} already exists.")
+
+    return True
+
+def download_shared_issues(issue_tracker_name, issue_tracker_project_id, update=False, refresh=False, desc_prefix=''):
+    """
+    确保 shared_issues/<tracker>_<id>/issues.txt 存在 (由 download_issues.py 完整下载)。
+    update 为 True 且已缓存时，只增量同步上次同步后有变动的 issue 并合并 (download_issues.py -S)；
+    refresh 为 True 时用条件请求重新验证已缓存的页面并重建列表 (download_issues.py -R)。
+    增量同步或重新验证失败不影响继续使用已缓存的列表。
+    多个工作进程共享同一个 tracker 时，通过 utils.single_flight() 保证只有一个进程下载 (每次运行最多同步一次)，
+    其余进程等待并复用结果。
+    成功返回 True。
+    """
+    issue_cache_key = f"{issue_tracker_name}_{issue_tracker_project_id}"
+    cache_issues_dir = os.path.join(config.SHARED_ISSUES_DIR, issue_cache_key)
+    cache_issues_file = os.path.join(cache_issues_dir, 'issues.txt')
+    os.makedirs(cache_issues_dir, exist_ok=True)
+
+    cmd_dl_list = [
+        sys.executable,
+        os.path.join(config.SCRIPT_DIR, 'download_issues.py'),
+        '-g', issue_tracker_name,
+        '-t', issue_tracker_project_id,
+        '-o', cache_issues_dir,
+        '-f', cache_issues_file
+    ]
+
+    def download():
+        if not os.path.exists(cache_issues_file) or os.path.getsize(cache_issues_file) == 0:
+            print(f"{desc_prefix}Shared issues for {issue_cache_key} not found. Downloading...")
+            success, _ = utils.exec_cmd(cmd_dl_list, f"{desc_prefix}Downloading issues for {issue_cache_key}")
+            if not success:
+                print(f"Error: Failed to download issues for {issue_cache_key}. Skipping.", file=sys.stderr)
+            return success
+        if update:
+            success, _ = utils.exec_cmd(cmd_dl_list + ['-S'], f"{desc_prefix}Syncing issues for {issue_cache_key}")
+            if not success:
+                print(f"Warning: Delta sync of {issue_cache_key} failed. Using cached issues.", file=sys.stderr)
+            return True
+        if refresh:
+            success, _ = utils.exec_cmd(cmd_dl_list + ['-R'], f"{desc_prefix}Revalidating issues for {issue_cache_key}")
+            if not success:
+                print(f"Warning: Revalidation of {issue_cache_key} failed. Using cached issues.", file=sys.stderr)
+            return True
+        print(f"{desc_prefix}Shared issues for {issue_cache_key} already cached. Skipping download.")
+        return True
+
+    # 完成标记: 普通模式下只要求下载过一次；update / refresh 模式下要求本次运行已同步过
+    token = utils.get_run_id() if update or refresh else 'done'
+    return utils.single_flight(
+        os.path.join(cache_issues_dir, '.issues.lock'),
+        os.path.join(cache_issues_dir, '.issues.done'),
+        download,
+        token
+    )
+
+def open_project_state(project_id, output_csv_file, output_patches_dir, output_reports_dir):
+    """
+    返回项目的 pipeline_state。第一次使用时，把旧版本 (没有进度记录) 已生成的 patch 与报告登记为已完成。
+    """
+    state = pipeline_state.for_project(project_id)
+    if not state.adopted():
+        patch_jobs = []
+        report_jobs = []
+        if os.path.exists(output_csv_file):
+            patch_jobs = generate_patches.read_patch_jobs(output_csv_file, output_patches_dir, done=set()) or []
+            report_jobs = materialize_reports.read_report_jobs(output_csv_file, output_reports_dir, include_existing=True) or []
+        state.adopt({
+            'patches': {bug_id: os.path.join(output_patches_dir, f"{bug_id}.src.patch") for bug_id, _, _ in patch_jobs},
+            'reports': {bug_id: report_file for bug_id, _, report_file in report_jobs}
+        })
+    return state
+
+def generate_project_patches(state, cache_repo_dir, output_csv_file, output_patches_dir, sub_project_path):
+    """
+    生成 state 中尚未记录完成的 patch，每个 patch 完成后立即记录。
+    未能生成的 patch 记入 retry_queue，已生成的从中移除。成功返回 True。
+    """
+    state.begin('patches')
+    success = generate_patches.generate_patches(cache_repo_dir, output_csv_file, output_patches_dir, sub_project_path,
+                                                done=state.done_bugs('patches'),
+                                                on_done=functools.partial(state.mark_done, 'patches'))
+    failed = [] if success else generate_patches.read_patch_jobs(output_csv_file, output_patches_dir,
+                                                                 state.done_bugs('patches')) or []
+    failed_ids = set(bug_id for bug_id, _, _ in failed)
+    retry_queue.resolve('patch', state.project_id,
+                        [entry['item'] for entry in retry_queue.entries('patch', state.project_id)
+                         if entry['item'] not in failed_ids])
+    data = {'repo_dir': cache_repo_dir, 'csv_file': output_csv_file,
+            'patches_dir': output_patches_dir, 'sub_project_path': sub_project_path}
+    retry_queue.record_failures('patch', state.project_id, [
+        (bug_id, f"could not diff {commit_buggy} -> {commit_fixed}", data)
+        for bug_id, commit_buggy, commit_fixed in failed
+    ])
+    state.finish('patches', success=success, failed=len(failed))
+    return success
+
+def materialize_project_reports(state, cache_issues_dir, issue_tracker_name, output_csv_file, output_reports_dir):
+    """
+    从缓存的 tracker 页面中拆分出 state 中尚未记录完成的报告，返回仍需通过网络获取的任务列表。
+    active-bugs.csv 无效时返回 None。
+    """
+    report_jobs = materialize_reports.read_report_jobs(output_csv_file, output_reports_dir, done=state.done_bugs('reports'))
+    if report_jobs is None:
+        state.finish('reports', success=False)
+        return None
+    state.begin('reports')
+    return materialize_reports.materialize_reports(cache_issues_dir, issue_tracker_name, report_jobs,
+                                                   functools.partial(state.mark_done, 'reports'))
+
+def download_project_reports(state, report_jobs, output_csv_file, output_reports_dir, refresh=False, retry_now=False):
+    """
+    批量获取 (fetch_reports) 并下载 report_jobs，失败的报告记入 retry_queue。
+    之前失败、尚未到重试时间的报告被跳过，除非 retry_now 为 True。返回失败的任务列表。
+    """
+    project_id = state.project_id
+    deferred = {} if retry_now else retry_queue.deferred('report', project_id)
+    if deferred:
+        print(f"  -> {len(deferred)} reports failed earlier and wait for their retry backoff.")
+        report_jobs = [job for job in report_jobs if job[0] not in deferred]
+
+    report_done = functools.partial(state.mark_done, 'reports')
+    failed = report_downloader.download_project_reports(
+        project_id, fetch_reports.fetch_reports(report_jobs, on_done=report_done), on_done=report_done)
+    if refresh:
+        revalidation_jobs = report_downloader.revalidation_jobs(output_csv_file, output_reports_dir)
+        failed += report_downloader.download_reports(revalidation_jobs, refresh=True)
+    # 从缓存页面或批量请求中得到的报告同样从队列中移除
+    retry_queue.resolve('report', project_id, state.done_bugs('reports'))
+    state.finish('reports', success=not failed, failed=len(failed))
+    return failed
+
+# 项目级阶段 (按执行顺序)。任一阶段失败时整个项目记入 retry_queue，已完成的输出保留，重试时重新运行该项目
+PROJECT_STAGES = ('repo', 'issues', 'xref', 'reports')
+
+def record_project_result(project, siblings, success, error=None):
+    """
+    成功时从 retry_queue 中移除项目的阶段条目；失败时记录失败的阶段 (pipeline_state 中第一个 failed 的阶段)
+    及错误信息 error，返回该阶段。
+    """
+    project_id = project['project_id']
+    if success:
+        retry_queue.resolve('stage', project_id, PROJECT_STAGES)
+        return None
+    state = pipeline_state.for_project(project_id)
+    failed = [name for name in PROJECT_STAGES if state.stage(name).get('status') == 'failed']
+    stage = failed[0] if failed else PROJECT_STAGES[0]
+    # 每个项目只保留一个阶段条目: 失败的阶段变了说明已有进展
+    retry_queue.resolve('stage', project_id, [name for name in PROJECT_STAGES if name != stage])
+    retry_queue.record_failure('stage', project_id, stage, error or f"{stage} stage failed (see error.txt)",
+                               data={'project': project, 'siblings': siblings})
+    return stage
+
+def stage_deferred(project_id):
+    """
+    项目上次在某个阶段失败且尚未到重试时间时，返回该 retry_queue 条目，否则返回 None。
+    """
+    deferred = retry_queue.deferred('stage', project_id)
+    return next(iter(deferred.values()), None)
+
+def process_project(project_id, project_name, repository_url, issue_tracker_name, issue_tracker_project_id, bug_fix_regex, sub_project_path, siblings=None, update=False, refresh=False, retry_now=False):
     """
     处理单个项目的完整挖掘流程。
+    siblings 为与该项目共享 repository_url 的所有项目 (含自身)，用于一次性 cross-reference。
+    update 为 True 时 fetch 已缓存的仓库并增量同步 issues，只对新 commit 做 cross-reference (bug.id 接着编号)。
+    refresh 为 True 时用条件请求 (ETag / Last-Modified) 重新验证已缓存的 issue 页面和报告。
+    retry_queue 中尚未到重试时间的报告会被跳过，除非 retry_now 为 True。
     如果成功，返回 True；如果任何关键步骤失败，返回 False。
     """
-    PYTHON_EXECUTABLE = sys.executable
 
     print("############################################################")
     print(f"Processing project: {project_id} ({project_name})")
@@ -52,196 +619,141 @@ def process_project(project_id, project_name, repository_url, issue_tracker_name
     os.makedirs(output_reports_dir, exist_ok=True) 
     os.makedirs(cache_project_dir, exist_ok=True) 
     os.makedirs(cache_issues_dir, exist_ok=True)
+
+    # 各阶段与每个 bug 的完成记录，中断后从上次停下的地方继续
+    state = open_project_state(project_id, output_csv_file, output_patches_dir, output_reports_dir)
     
     # 3. initialize git repository if not already done
     
-    # 3a. cloning repository
-    if not os.path.exists(cache_repo_dir):
-        cmd_list = [
-            'git', 
-            'clone', 
-            '--bare', 
-            repository_url, 
-            cache_repo_dir
-        ]
-        success, _ = utils.exec_cmd(cmd_list, f"Cloning {project_name}")
-        if not success:
-            print(f"Error: Failed to clone {repository_url}. Skipping.", file=sys.stderr)
-            return False # 
-    else:
+    # 3a. cloning repository (shared by all projects with the same repository_url)
+    if os.path.exists(cache_repo_dir):
+        # legacy per-project clone from earlier runs
         print(f"Repository {project_name}.git already cached.")
-
-    # 3b. downloading shared issues
-    if not os.path.exists(cache_issues_file) or os.path.getsize(cache_issues_file) == 0:
-        print(f"Shared issues for {issue_cache_key} not found. Downloading...")
-        
-        cmd_dl_list = [
-            PYTHON_EXECUTABLE,
-            os.path.join(config.SCRIPT_DIR, 'download_issues.py'),
-            '-g', issue_tracker_name,
-            '-t', issue_tracker_project_id,
-            '-o', cache_issues_dir,
-            '-f', cache_issues_file
-        ]
-        success, _ = utils.exec_cmd(cmd_dl_list, f"Downloading issues for {issue_cache_key}")
-        if not success:
-            print(f"Error: Failed to download issues for {issue_cache_key}. Skipping.", file=sys.stderr)
-            return False
     else:
-        print(f"Shared issues for {issue_cache_key} already cached. Skipping download.")
-
-    # 3c. getting git log
-    if not os.path.exists(cache_gitlog_file):
-        cmd_log_list = [
-            'git',
-            f'--git-dir={cache_repo_dir}',
-            'log',
-            '--reverse',
-            '--', 
-            sub_project_path
-        ]
-        success, _ = utils.exec_cmd(
-            cmd_log_list, 
-            f"Collecting git log for {project_name}",
-            output_file=cache_gitlog_file 
-        )
-        if not success:
-            print(f"Error: Failed to get git log for {project_name}. Skipping.", file=sys.stderr)
+        cache_repo_dir = repo_cache.ensure_repo(repository_url)
+        if not cache_repo_dir:
+            print(f"Error: Failed to clone {repository_url}. Skipping.", file=sys.stderr)
+            state.finish('repo', success=False)
             return False
-    else:
-        print(f"Git log for {project_name} already cached.")
 
-    # 3d. cross-referencing git log with issues
-    if not os.path.exists(output_csv_file):
-        try:
-            with open(output_csv_file, 'w', encoding='utf-8', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(config.ACTIVE_BUGS_HEADER)
-        except IOError as e:
-            print(f"Error: Cannot write header to {output_csv_file}: {e}. Skipping.", file=sys.stderr)
-            return False
+    if update and not repo_cache.update_repo(cache_repo_dir):
+        print(f"Error: Failed to fetch {repository_url}. Skipping.", file=sys.stderr)
+        state.finish('repo', success=False)
+        return False
+    state.finish('repo', repo_dir=cache_repo_dir)
 
-        print(f"Regex for bug-fixing commits: {bug_fix_regex!r}")
+    # 3b. downloading (or delta-syncing) shared issues
+    if not download_shared_issues(issue_tracker_name, issue_tracker_project_id, update=update, refresh=refresh):
+        state.finish('issues', success=False)
+        return False
+    state.finish('issues')
 
-        try:
-            processed_regex = codecs.decode(bug_fix_regex, 'unicode_escape')
-        except Exception:
-            print(f"  -> Warning: Could not unescape regex: {bug_fix_regex!r}. Using raw value.", file=sys.stderr)
-            processed_regex = bug_fix_regex
-        
-        cmd_xref_list = [
-            PYTHON_EXECUTABLE,
-            os.path.join(config.SCRIPT_DIR, 'vcs_log_xref.py'),
-            '-e', processed_regex,
-            '-l', cache_gitlog_file,
-            '-r', cache_repo_dir,
-            '-i', cache_issues_file,
-            '-f', output_csv_file,
-            '-ru', repository_url,
-            '-pid', project_id
-        ]
-        success, _ = utils.exec_cmd(cmd_xref_list, f"Cross-referencing log for {project_id}")
-        if not success:
-            print(f"Error: Failed to cross-reference log for {project_id}. Skipping.", file=sys.stderr)
-            return False
-    else:
-        print(f"Bugs file {output_csv_file} already exists.")
+    # 3c/3d. getting git log and cross-referencing it with issues
+    if not xref_project(project_id, project_name, repository_url, bug_fix_regex, sub_project_path,
+                        cache_repo_dir, cache_issues_file, cache_gitlog_file, output_csv_file,
+                        siblings=siblings, update=update):
+        state.finish('xref', success=False)
+        return False
 
-    # 4. generating patches AND downloading reports
+    # 4. materializing reports from cached tracker pages, batch-fetching the rest per tracker
     print(f"Generating patches and downloading reports from {output_csv_file}...")
-    
+
+    report_jobs = materialize_project_reports(state, cache_issues_dir, issue_tracker_name, output_csv_file, output_reports_dir)
+    if report_jobs is None:
+        return False
+
+    # 网络部分 (批量获取 + 按主机限流的并发下载) 在后台线程中进行，不阻塞 patch 生成
+    # 其输出先缓冲，patch 生成结束后整体输出
+    report_result = {}
+    def download_remaining_reports():
+        try:
+            report_result['failed'] = download_project_reports(state, report_jobs, output_csv_file, output_reports_dir,
+                                                               refresh, retry_now)
+        except Exception as e:
+            report_result['error'] = e
+
+    report_output = []
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = ThreadOutput(stdout, report_output), ThreadOutput(stderr, report_output)
     try:
-        with open(output_csv_file, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            try:
-                header = next(reader)
-                idx_bug_id = header.index(config.BUGS_CSV_BUGID) 
-                idx_commit_buggy = header.index(config.BUGS_CSV_COMMIT_BUGGY)
-                idx_commit_fixed = header.index(config.BUGS_CSV_COMMIT_FIXED)
-                idx_report_url = header.index(config.BUGS_CSV_ISSUE_URL) 
-                
-            except (StopIteration, ValueError) as e:
-                print(f"Error: Invalid or empty CSV file: {output_csv_file}. {e}", file=sys.stderr)
-                return False
-                
-            for row in reader:
-                try:
-                    bug_id = row[idx_bug_id]
-                    commit_buggy = row[idx_commit_buggy]
-                    commit_fixed = row[idx_commit_fixed]
-                    report_url = row[idx_report_url] 
-                except IndexError:
-                    continue 
-
-                # --- 4a. Download Report (NEW LOGIC) ---
-                if not report_url or report_url == "NA":
-                    print(f"  -> Skipping report for bug {bug_id} (missing URL).")
-                else:
-                    ext = '.json' 
-                    if 'issues.apache.org/jira' in report_url or 'bz.apache.org/bugzilla' in report_url:
-                        ext = '.xml' 
-                    
-                    report_file = os.path.join(output_reports_dir, f"{bug_id}{ext}")
-                    
-                    if os.path.exists(report_file):
-                        pass 
-                    else:
-                        print(f"\n  -> Downloading report for bug {bug_id}...")
-                        utils.download_report_data(report_url, report_file)
-
-
-                # --- 4b. Generate Patch (Existing logic) ---
-                if not commit_buggy or not commit_fixed:
-                    print(f"  -> Skipping patch for bug {bug_id} (missing commit hash).")
-                    continue
+        report_thread = threading.Thread(target=download_remaining_reports, daemon=True)
+        report_thread.start()
 
-                patch_file = os.path.join(output_patches_dir, f"{bug_id}.src.patch")
-                
-                if os.path.exists(patch_file):
-                    continue 
-
-                print(f"  -> Generating patch for bug {bug_id} ({commit_buggy} -> {commit_fixed})")
-
-                cmd_diff_list = [
-                    'git',
-                    f'--git-dir={cache_repo_dir}',
-                    'diff',
-                    commit_buggy,
-                    commit_fixed,
-                    '--', 
-                    sub_project_path
-                ]
-
-                try:
-                    result = subprocess.run(
-                        cmd_diff_list, 
-                        shell=False, 
-                        check=True, 
-                        capture_output=True, 
-                        text=True,
-                        encoding='utf-8',
-                        errors='ignore'
-                    )
-                    
-                    with open(patch_file, 'w', encoding='utf-8') as f:
-                        f.write(result.stdout)
-                    
-                    if os.path.getsize(patch_file) == 0:
-                        print(f"  -> Warning: Generated patch for bug {bug_id} is empty.", file=sys.stderr)
-                except subprocess.CalledProcessError as e:
-                    print(f"  -> Error generating patch for bug {bug_id}.", file=sys.stderr)
-                    if os.path.exists(patch_file):
-                        os.remove(patch_file) 
+        # 5. generating all missing patches in one streaming git pass
+        generate_project_patches(state, cache_repo_dir, output_csv_file, output_patches_dir, sub_project_path)
 
-    except IOError as e:
-        print(f"Error reading {output_csv_file}: {e}", file=sys.stderr)
+        report_thread.join()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        for stream, text in report_output:
+            stream.write(text)
+    state.compact()
+
+    if 'error' in report_result:
+        print(f"Error: Downloading reports for {project_id} failed: {report_result['error']}", file=sys.stderr)
+        state.finish('reports', success=False, error=str(report_result['error']))
         return False
 
     print(f"Finished processing project {project_id}.\n")
     return True
 
+def run_project(project, siblings, update=False, refresh=False, retry_now=False):
+    """
+    运行 process_project() 并在 retry_queue 中记录结果。失败时保留已完成的输出，返回 False。
+    """
+    project_id = project['project_id']
+    success = process_project(
+        project_id,
+        project['project_name'],
+        project['repository_url'],
+        project['issue_tracker_name'],
+        project['issue_tracker_project_id'],
+        project['bug_fix_regex'],
+        project['sub_project_path'],
+        siblings=siblings,
+        update=update,
+        refresh=refresh,
+        retry_now=retry_now
+    )
+    stage = record_project_result(project, siblings, success)
+    if not success:
+        print(f"--- Project {project_id} FAILED in stage {stage}. Keeping completed outputs; "
+              f"it will be retried after its backoff. ---", file=sys.stderr)
+        print("------------------------------------------------------------\n", file=sys.stderr)
+    return success
+
+def retry_pending(update=False, refresh=False):
+    """
+    重试 retry_queue 中已到重试时间的条目: 失败的项目阶段 (重新运行项目)、报告与 patch。
+    """
+    for entry in retry_queue.entries('stage', due_only=True):
+        print(f"Retrying project {entry['project_id']} (failed in stage {entry['item']})...")
+        run_project(entry['data']['project'], entry['data']['siblings'], update, refresh)
+
+    report_downloader.retry_reports()
+
+    projects = {}
+    for entry in retry_queue.entries('patch', due_only=True):
+        projects.setdefault(entry['project_id'], entry['data'])
+    for project_id, data in sorted(projects.items()):
+        print(f"Retrying queued patches of {project_id}...")
+        state = pipeline_state.for_project(project_id)
+        generate_project_patches(state, data['repo_dir'], data['csv_file'], data['patches_dir'], data['sub_project_path'])
+        state.compact()
+
 def main():
-    
+    parser = argparse.ArgumentParser(description="Mine bug-fixing commits, patches and reports for all projects in example.txt.")
+    parser.add_argument('-u', '--update', dest='update', action='store_true',
+                        help="Fetch cached repositories and cross-reference only commits newer than the cached git logs")
+    parser.add_argument('-r', '--refresh', dest='refresh', action='store_true',
+                        help="Revalidate cached issue pages and reports with conditional requests (ETag/Last-Modified)")
+    parser.add_argument('--retry-now', dest='retry_now', action='store_true',
+                        help="Retry failed projects and reports from earlier runs without waiting for their backoff")
+    args = parser.parse_args()
+
+    # download_issues.py 子进程继承同一个运行标识，HTTP 缓存统计按运行汇总
+    utils.get_run_id()
+
     # define error log file
     ERROR_LOG_FILE = 'error.txt'
     
@@ -259,57 +771,44 @@ def main():
                 print(f"Error: Input file not found at {input_file}", file=sys.stderr)
                 sys.exit(1)
 
+            projects = []
             with open(input_file, 'r') as f:
                 for line in f:
                     line = line.strip()
                     if not line or line.startswith('#'):
                         continue
                         
-                    try:
-                        parts = line.split('\t') 
-                        project_id = parts[0] 
-                        project_name = parts[1]
-                        repository_url = parts[2]
-                        issue_tracker_name = parts[3]
-                        issue_tracker_project_id = parts[4]
-                        bug_fix_regex = parts[5]
-                        
-                        sub_project_path = "."
-                        if len(parts) > 6 and parts[6].strip() and parts[6].strip() != ".":
-                            sub_project_path = parts[6].strip()
-                            
-                    except IndexError:
+                    project = utils.parse_project_line(line)
+                    if not project:
                         print(f"Skipping malformed line (expected at least 6 tab-separated parts): {line}", file=sys.stderr)
                         continue
+                    projects.append(project)
+
+            # projects sharing a repository_url are cross-referenced in one log pass
+            repo_groups = repo_cache.group_projects_by_repo(projects)
+
+            for project in projects:
+                project_id = project['project_id']
+
+                # 上次失败的项目在退避时间内跳过 (--retry-now 除外)
+                entry = stage_deferred(project_id)
+                if entry and not args.retry_now:
+                    print(f"Skipping {project_id}: failed in stage {entry['item']} "
+                          f"(attempt {entry['attempts']}), waiting for its retry backoff. Use --retry-now to retry now.\n")
+                    continue
 
-                    # define project output directory
-                    output_project_dir = os.path.join(config.OUTPUT_DIR, project_id)
-                    
-                    success = process_project(
-                        project_id, 
-                        project_name, 
-                        repository_url, 
-                        issue_tracker_name, 
-                        issue_tracker_project_id, 
-                        bug_fix_regex, 
-                        sub_project_path
-                    )
-                    
-                    # check success and clean up on failure
-                    if not success:
-                        print(f"--- Project {project_id} FAILED. Cleaning up output directory. ---", file=sys.stderr)
-                        if os.path.exists(output_project_dir):
-                            try:
-                                shutil.rmtree(output_project_dir)
-                                print(f"  -> Successfully removed {output_project_dir}", file=sys.stderr)
-                            except OSError as e:
-                                print(f"  -> Error: Could not remove directory {output_project_dir}: {e}", file=sys.stderr)
-                        else:
-                            print(f"  -> Directory {output_project_dir} was not created. No cleanup needed.", file=sys.stderr)
-                        print("------------------------------------------------------------\n", file=sys.stderr)
+                run_project(project, repo_groups[repo_cache.normalize_repo_url(project['repository_url'])],
+                            update=args.update, refresh=args.refresh, retry_now=args.retry_now)
 
+            # 重试已到重试时间的失败 (包括本次运行中较早失败的)，仍未完成的留待下次运行
+            retry_pending(update=args.update, refresh=args.refresh)
+            pending = retry_queue.summary()
+            if pending:
+                print(pending, file=sys.stderr)
+                print("Failed items are retried by later runs; see `python framework/retry_queue.py --list`.", file=sys.stderr)
 
             print("All projects processed.")
+            print(http_client.run_summary())
             
     except Exception as e:
         print(f"CRITICAL ERROR: An unexpected exception occurred: {e}", file=sys.stderr)
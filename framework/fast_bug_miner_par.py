@@ -1,226 +1,240 @@
 #!/usr/bin/env python3
-# framework/fast_bug_miner.py
+# framework/fast_bug_miner_par.py
+#
+# 并行挖掘 test.txt 中的所有项目。每个项目的流程被拆成多个阶段，由 stage_scheduler 按依赖关系调度到三个进程池:
+#   network  clone/fetch 仓库 (同一仓库只一次)、下载 issues (同一 tracker 只一次)、批量获取 / 下载报告
+#   cpu      git log + cross-reference、生成 patch
+#   disk     从缓存的 tracker 页面中拆分报告
+# 依赖关系: repo, issues -> xref -> patches
+#                                -> materialize -> reports
+# 一个项目 clone 的同时，另一个项目可以在做 xref，第三个项目在下载报告。
 
 import os
 import sys
-import subprocess
-import csv
+import argparse
 import utils
 import config
-import multiprocessing 
-import contextlib 
+import http_client
+import materialize_reports
+import pipeline_state
+import repo_cache
+import retry_queue
+import fast_bug_miner
+import stage_scheduler
+import contextlib
+import traceback
 
 # Not suit for Windows due to multiprocessing and redirection issues.
 
-def process_project(line):
+def project_paths(project):
     """
-    处理单个项目（此函数将在并行工作进程中执行）。
-    所有 stdout/stderr 输出将被重定向到项目目录下的 mining.log。
-    函数将返回一个元组: (project_id, "STATUS", "Reason")
+    返回项目的路径字典 (与 fast_bug_miner.process_project() 相同的布局)。
     """
-    
-    # --- 1. 解析 Project ID 和设置日志文件 ---
-    try:
-        parts_prelim = line.split('\t') 
-        project_id = parts_prelim[0] 
-    except IndexError:
-        msg = f"Skipping malformed line (cannot parse project_id): {line}"
-        print(msg, file=sys.stderr) 
-        return (None, "SKIPPED", "Malformed line")
-
-    # 定义日志文件路径
+    project_id = project['project_id']
+    issue_cache_key = f"{project['issue_tracker_name']}_{project['issue_tracker_project_id']}"
     output_project_dir = os.path.join(config.OUTPUT_DIR, project_id)
-    os.makedirs(output_project_dir, exist_ok=True) 
-    log_file_path = os.path.join(output_project_dir, 'mining.log')
-
-    # --- 2. 开始重定向并执行主要逻辑 ---
+    cache_project_dir = os.path.join(config.CACHE_DIR, project_id)
+    return {
+        'cache_issues_dir': os.path.join(config.SHARED_ISSUES_DIR, issue_cache_key),
+        'cache_issues_file': os.path.join(config.SHARED_ISSUES_DIR, issue_cache_key, 'issues.txt'),
+        'output_project_dir': output_project_dir,
+        'output_patches_dir': os.path.join(output_project_dir, 'patches'),
+        'output_reports_dir': os.path.join(output_project_dir, 'reports'),
+        'output_csv_file': os.path.join(output_project_dir, 'active-bugs.csv'),
+        'cache_project_dir': cache_project_dir,
+        # legacy per-project clone from earlier runs
+        'legacy_repo_dir': os.path.join(cache_project_dir, f"{project['project_name']}.git"),
+        'cache_gitlog_file': os.path.join(cache_project_dir, 'gitlog.txt'),
+        'log_file': os.path.join(output_project_dir, 'mining.log'),
+    }
+
+def run_logged(log_file, stage_func, *args):
+    """
+    在工作进程中运行 stage_func(*args)，所有 stdout/stderr 输出追加到项目目录下的 mining.log。
+    返回 (success, reason)。
+    """
     try:
-        with open(log_file_path, 'w', encoding='utf-8') as log_f:
+        with open(log_file, 'a', encoding='utf-8') as log_f:
             with contextlib.redirect_stdout(log_f), contextlib.redirect_stderr(log_f):
-                
-                # 所有的 print 都会进入 log_file_path ---
                 try:
-                    parts = line.split('\t') 
-                    project_id = parts[0] # 
-                    project_name = parts[1]
-                    repository_url = parts[2]
-                    issue_tracker_name = parts[3]
-                    issue_tracker_project_id = parts[4]
-                    bug_fix_regex = parts[5]
-                    
-                    sub_project_path = "."
-                    if len(parts) > 6 and parts[6].strip() and parts[6].strip() != ".":
-                        sub_project_path = parts[6].strip()
-                        
-                except IndexError:
-                    print(f"Skipping malformed line (expected at least 6 tab-separated parts): {line}", file=sys.stderr)
-                    return (project_id, "FAILED", "Malformed line parts")
-
-                PYTHON_EXECUTABLE = sys.executable
-
-                print("############################################################")
-                print(f"Processing project: {project_id} ({project_name})")
-                print(f"Full log redirect to: {log_file_path}")
-                print("############################################################")
-
-                # 1. define paths
-                issue_cache_key = f"{issue_tracker_name}_{issue_tracker_project_id}"
-                cache_issues_dir = os.path.join(config.SHARED_ISSUES_DIR, issue_cache_key)
-                cache_issues_file = os.path.join(cache_issues_dir, 'issues.txt')
-
-                output_patches_dir = os.path.join(output_project_dir, 'patches')
-                output_csv_file = os.path.join(output_project_dir, 'active-bugs.csv')
-                
-                cache_project_dir = os.path.join(config.CACHE_DIR, project_id)
-                cache_repo_dir = os.path.join(cache_project_dir, f"{project_name}.git")
-                cache_gitlog_file = os.path.join(cache_project_dir, 'gitlog.txt')
-                
-                # 2. create necessary directories
-                os.makedirs(output_patches_dir, exist_ok=True)
-                os.makedirs(cache_project_dir, exist_ok=True) 
-                os.makedirs(cache_issues_dir, exist_ok=True)
-                
-                # 3. initialize git repository
-                
-                # 3a. cloning repository
-                if not os.path.exists(cache_repo_dir):
-                    cmd = f"git clone --bare \"{repository_url}\" \"{cache_repo_dir}\""
-                    success, _ = utils.exec_cmd(cmd, f"({project_id}) Cloning {project_name}")
-                    if not success:
-                        print(f"Error: Failed to clone {repository_url}. Skipping.", file=sys.stderr)
-                        return (project_id, "FAILED", "Clone failed") # (!!) 返回状态
-                else:
-                    print(f"({project_id}) Repository {project_name}.git already cached.")
-                
-                # TODO shared_issues下载竞态条件可能性？添加锁？（download_issues.py）
-                # 3b. downloading shared issues
-                if not os.path.exists(cache_issues_file) or os.path.getsize(cache_issues_file) == 0:
-                    print(f"({project_id}) Shared issues for {issue_cache_key} not found. Downloading...")
-                    
-                    cmd_dl = (
-                        f"\"{PYTHON_EXECUTABLE}\" {os.path.join(config.SCRIPT_DIR, 'download_issues.py')} "
-                        f"-g \"{issue_tracker_name}\" -t \"{issue_tracker_project_id}\" "
-                        f"-o \"{cache_issues_dir}\" -f \"{cache_issues_file}\""
-                    )
-                    success, _ = utils.exec_cmd(cmd_dl, f"({project_id}) Downloading issues for {issue_cache_key}")
-                    if not success:
-                        print(f"Error: Failed to download issues for {issue_cache_key}. Skipping.", file=sys.stderr)
-                        return (project_id, "FAILED", "Issue download failed")
-                else:
-                    print(f"({project_id}) Shared issues for {issue_cache_key} already cached. Skipping download.")
-
-                # 3c. getting git log
-                if not os.path.exists(cache_gitlog_file):
-                    cmd_log = f"git --git-dir=\"{cache_repo_dir}\" log --reverse -- \"{sub_project_path}\" > \"{cache_gitlog_file}\""
-                    success, _ = utils.exec_cmd(cmd_log, f"({project_id}) Collecting git log for {project_name}")
-                    if not success:
-                        print(f"Error: Failed to get git log for {project_name}. Skipping.", file=sys.stderr)
-                        return (project_id, "FAILED", "Git log failed")
-                else:
-                    print(f"({project_id}) Git log for {project_name} already cached.")
-
-                # 3d. cross-referencing git log with issues
-                if not os.path.exists(output_csv_file):
-                    try:
-                        with open(output_csv_file, 'w', encoding='utf-8', newline='') as f:
-                            writer = csv.writer(f)
-                            writer.writerow(config.ACTIVE_BUGS_HEADER)
-                    except IOError as e:
-                        print(f"Error: Cannot write header to {output_csv_file}: {e}. Skipping.", file=sys.stderr)
-                        return (project_id, "FAILED", "CSV header write failed")
-
-                    print(f"({project_id}) Regex for bug-fixing commits: {bug_fix_regex!r}")
-
-                    cmd_xref = (
-                        f"\"{PYTHON_EXECUTABLE}\" {os.path.join(config.SCRIPT_DIR, 'vcs_log_xref.py')} "
-                        f"-e \"{bug_fix_regex}\" -l \"{cache_gitlog_file}\" "
-                        f"-r \"{cache_repo_dir}\" "
-                        f"-i \"{cache_issues_file}\" "
-                        f"-f \"{output_csv_file}\" "
-                        f"-ru \"{repository_url}\" "
-                        f"-pid \"{project_id}\""
-                    )
-                    success, _ = utils.exec_cmd(cmd_xref, f"({project_id}) Cross-referencing log for {project_id}")
-                    if not success:
-                        print(f"Error: Failed to cross-reference log for {project_id}. Skipping.", file=sys.stderr)
-                        return (project_id, "FAILED", "XRef failed")
-                else:
-                    print(f"({project_id}) Bugs file {output_csv_file} already exists.")
-
-                # generating patches
-                print(f"({project_id}) Generating patches from {output_csv_file}...")
-                
-                try:
-                    with open(output_csv_file, 'r', encoding='utf-8') as csvfile:
-                        reader = csv.reader(csvfile)
-                        try:
-                            header = next(reader)
-                            idx_bug_id = header.index(config.BUGS_CSV_BUGID)
-                            idx_commit_buggy = header.index(config.BUGS_CSV_COMMIT_BUGGY)
-                            idx_commit_fixed = header.index(config.BUGS_CSV_COMMIT_FIXED)
-                        except (StopIteration, ValueError) as e:
-                            print(f"Error: Invalid or empty CSV file: {output_csv_file}. {e}", file=sys.stderr)
-                            return (project_id, "FAILED", "Invalid CSV file")
-                            
-                        for row in reader:
-                            try:
-                                bug_id = row[idx_bug_id]
-                                commit_buggy = row[idx_commit_buggy]
-                                commit_fixed = row[idx_commit_fixed]
-                            except IndexError:
-                                continue 
-
-                            if not commit_buggy or not commit_fixed:
-                                print(f"  -> ({project_id}) Skipping bug {bug_id} (missing commit hash).")
-                                continue
-
-                            patch_file = os.path.join(output_patches_dir, f"{bug_id}.src.patch")
-                            
-                            if os.path.exists(patch_file):
-                                continue 
-
-                            print(f"  -> ({project_id}) Generating patch for bug {bug_id} ({commit_buggy} -> {commit_fixed})")
-
-                            cmd_diff = f"git --git-dir=\"{cache_repo_dir}\" diff \"{commit_buggy}\" \"{commit_fixed}\" -- \"{sub_project_path}\" > \"{patch_file}\""
-
-                            try:
-                                subprocess.run(cmd_diff, shell=True, check=True, capture_output=True)
-                                
-                                if os.path.getsize(patch_file) == 0:
-                                    print(f"  -> ({project_id}) Warning: Generated patch for bug {bug_id} is empty.", file=sys.stderr)
-                            except subprocess.CalledProcessError as e:
-                                print(f"  -> ({project_id}) Error generating patch for bug {bug_id}.", file=sys.stderr)
-                                if os.path.exists(patch_file):
-                                    os.remove(patch_file) 
-
-                except IOError as e:
-                    print(f"Error reading {output_csv_file}: {e}", file=sys.stderr)
-                    return (project_id, "FAILED", "CSV read failed")
-
-                print(f"Finished processing project {project_id}.\n")
-                
-                # (!!) 成功返回
-                return (project_id, "SUCCESS", None)
-
-    except Exception as e:
-        # 捕获意外错误 (例如日志文件打开失败)
-        # 尝试最后一次打印到主控制台
-        error_msg = f"CRITICAL ERROR processing {project_id}: {e}"
-        print(error_msg, file=sys.stderr)
-        
-        # 尝试写入日志文件
-        try:
-            with open(log_file_path, 'a') as f_err:
-                f_err.write(f"\n--- CRITICAL ERROR ---\n{error_msg}\n{traceback.format_exc()}\n")
-        except:
-            pass
-            
-        return (project_id, "FAILED", f"Critical Error: {e}")
+                    return stage_func(*args)
+                except Exception as e:
+                    print(f"\n--- CRITICAL ERROR ---\n{e}\n{traceback.format_exc()}")
+                    return False, f"Critical Error: {e}"
+    except IOError as e:
+        print(f"CRITICAL ERROR: Could not open {log_file}: {e}", file=sys.stderr)
+        return False, f"Critical Error: {e}"
+
+def stage_repo(projects, repo_dir, update):
+    """
+    network: clone (或在 update 模式下 fetch) projects 共享的仓库。repo_dir 为旧版本的项目内仓库 (不存在时为 None)。
+    """
+    project = projects[0]
+    desc_prefix = f"({project['project_id']}) "
+    states = [pipeline_state.for_project(p['project_id']) for p in projects]
+
+    if repo_dir:
+        print(f"{desc_prefix}Repository {os.path.basename(repo_dir)} already cached.")
+    else:
+        repo_dir = repo_cache.ensure_repo(project['repository_url'], desc_prefix)
+        if not repo_dir:
+            print(f"Error: Failed to clone {project['repository_url']}. Skipping.", file=sys.stderr)
+            for state in states:
+                state.finish('repo', success=False)
+            return False, "Clone failed"
+
+    if update and not repo_cache.update_repo(repo_dir, desc_prefix):
+        print(f"Error: Failed to fetch {project['repository_url']}. Skipping.", file=sys.stderr)
+        for state in states:
+            state.finish('repo', success=False)
+        return False, "Fetch failed"
+
+    for state in states:
+        state.finish('repo', repo_dir=repo_dir)
+    return True, None
+
+def stage_issues(projects, update, refresh):
+    """
+    network: 下载 (或增量同步) projects 共享的 issue 列表。
+    """
+    project = projects[0]
+    success = fast_bug_miner.download_shared_issues(project['issue_tracker_name'], project['issue_tracker_project_id'],
+                                                    update=update, refresh=refresh,
+                                                    desc_prefix=f"({project['project_id']}) ")
+    for p in projects:
+        pipeline_state.for_project(p['project_id']).finish('issues', success=success)
+    return success, None if success else "Issue download failed"
+
+def stage_xref(project, siblings, update):
+    """
+    cpu: 收集 git log 并做 cross-reference (共享仓库的项目一次性处理)。
+    """
+    project_id = project['project_id']
+    paths = project_paths(project)
+    state = pipeline_state.for_project(project_id)
+    if not fast_bug_miner.xref_project(project_id, project['project_name'], project['repository_url'],
+                                       project['bug_fix_regex'], project['sub_project_path'],
+                                       state.stage('repo')['repo_dir'], paths['cache_issues_file'],
+                                       paths['cache_gitlog_file'], paths['output_csv_file'],
+                                       siblings=siblings, update=update, desc_prefix=f"({project_id}) "):
+        state.finish('xref', success=False)
+        return False, "XRef failed"
+    return True, None
+
+def stage_patches(project):
+    """
+    cpu: 用一个 git diff-tree 进程生成所有缺失的 patch。未能生成的 patch 记入 retry_queue，不算项目失败。
+    """
+    project_id = project['project_id']
+    paths = project_paths(project)
+    state = pipeline_state.for_project(project_id)
+    print(f"({project_id}) Generating patches from {paths['output_csv_file']}...")
+    if not fast_bug_miner.generate_project_patches(state, state.stage('repo')['repo_dir'], paths['output_csv_file'],
+                                                   paths['output_patches_dir'], project['sub_project_path']):
+        print(f"  -> ({project_id}) Some patches could not be generated.", file=sys.stderr)
+    return True, None
+
+def stage_materialize(project):
+    """
+    disk: 从缓存的 tracker 页面中拆分出报告。
+    """
+    paths = project_paths(project)
+    state = pipeline_state.for_project(project['project_id'])
+    report_jobs = fast_bug_miner.materialize_project_reports(state, paths['cache_issues_dir'], project['issue_tracker_name'],
+                                                             paths['output_csv_file'], paths['output_reports_dir'])
+    if report_jobs is None:
+        return False, "Invalid active-bugs.csv"
+    return True, None
+
+def stage_reports(project, refresh, retry_now):
+    """
+    network: 批量获取并下载其余的报告。失败的报告记入 retry_queue，不算项目失败。
+    """
+    paths = project_paths(project)
+    state = pipeline_state.for_project(project['project_id'])
+    report_jobs = materialize_reports.read_report_jobs(paths['output_csv_file'], paths['output_reports_dir'],
+                                                       done=state.done_bugs('reports')) or []
+    print(f"({project['project_id']}) Downloading {len(report_jobs)} reports...")
+    fast_bug_miner.download_project_reports(state, report_jobs, paths['output_csv_file'], paths['output_reports_dir'],
+                                            refresh, retry_now)
+    return True, None
+
+def build_tasks(projects, repo_groups, args):
+    """
+    为 projects 生成 stage_scheduler 的任务列表，返回 (tasks, {task_key: [project_id, ...]})。
+    仓库按 repository_url、issues 按 tracker 各只生成一个任务，由所有使用它的项目共享。
+    """
+    repo_projects = {}   # task key -> (projects, legacy repo_dir)
+    issue_projects = {}  # task key -> projects
+    project_keys = {}    # project_id -> (repo key, issues key)
+    for project in projects:
+        paths = project_paths(project)
+        if os.path.exists(paths['legacy_repo_dir']):
+            repo_key, repo_dir = f"repo:{project['project_id']}", paths['legacy_repo_dir']
+        else:
+            repo_key, repo_dir = f"repo:{repo_cache.normalize_repo_url(project['repository_url'])}", None
+        issues_key = f"issues:{project['issue_tracker_name']}_{project['issue_tracker_project_id']}"
+        repo_projects.setdefault(repo_key, ([], repo_dir))[0].append(project)
+        issue_projects.setdefault(issues_key, []).append(project)
+        project_keys[project['project_id']] = (repo_key, issues_key)
+
+    tasks = []
+    task_projects = {}
+    for key, (members, repo_dir) in repo_projects.items():
+        tasks.append(stage_scheduler.Task(key, 'network', run_logged,
+                                          (project_paths(members[0])['log_file'], stage_repo, members, repo_dir, args.update)))
+        task_projects[key] = [p['project_id'] for p in members]
+    for key, members in issue_projects.items():
+        tasks.append(stage_scheduler.Task(key, 'network', run_logged,
+                                          (project_paths(members[0])['log_file'], stage_issues, members, args.update, args.refresh)))
+        task_projects[key] = [p['project_id'] for p in members]
+
+    for project in projects:
+        project_id = project['project_id']
+        log_file = project_paths(project)['log_file']
+        repo_key, issues_key = project_keys[project_id]
+        siblings = repo_groups[repo_cache.normalize_repo_url(project['repository_url'])]
+        # 共享仓库时等所有兄弟项目的 issues 就绪 (无论成败)，一遍 git log 处理整组
+        sibling_issues = [project_keys[s['project_id']][1] for s in siblings
+                          if s['project_id'] in project_keys and project_keys[s['project_id']][1] != issues_key]
+        # 兄弟项目的 xref 可能追加本项目的 active-bugs.csv，之后才读取它
+        sibling_xrefs = [f"xref:{s['project_id']}" for s in siblings
+                         if s['project_id'] in project_keys and s['project_id'] != project_id]
+        stages = [
+            stage_scheduler.Task(f"xref:{project_id}", 'cpu', run_logged, (log_file, stage_xref, project, siblings, args.update),
+                                 deps=(repo_key, issues_key), after=sibling_issues),
+            stage_scheduler.Task(f"patches:{project_id}", 'cpu', run_logged, (log_file, stage_patches, project),
+                                 deps=(f"xref:{project_id}",), after=sibling_xrefs),
+            stage_scheduler.Task(f"materialize:{project_id}", 'disk', run_logged, (log_file, stage_materialize, project),
+                                 deps=(f"xref:{project_id}",), after=sibling_xrefs),
+            stage_scheduler.Task(f"reports:{project_id}", 'network', run_logged,
+                                 (log_file, stage_reports, project, args.refresh, args.retry_now),
+                                 deps=(f"materialize:{project_id}",)),
+        ]
+        for task in stages:
+            tasks.append(task)
+            task_projects[task.key] = [project_id]
+    return tasks, task_projects
 
 
 def main():
-    input_file = os.path.join(config.SCRIPT_DIR, 'test.txt') 
-    
+    parser = argparse.ArgumentParser(description="Mine all projects in test.txt in parallel.")
+    parser.add_argument('-u', '--update', dest='update', action='store_true',
+                        help="Fetch cached repositories and cross-reference only commits newer than the cached git logs")
+    parser.add_argument('-r', '--refresh', dest='refresh', action='store_true',
+                        help="Revalidate cached issue pages and reports with conditional requests (ETag/Last-Modified)")
+    parser.add_argument('--retry-now', dest='retry_now', action='store_true',
+                        help="Retry projects and reports that failed in earlier runs without waiting for their backoff")
+    parser.add_argument('--network-workers', dest='network_workers', type=int, default=config.NETWORK_WORKERS,
+                        help="Processes for network stages: clone/fetch, issue download, report download")
+    parser.add_argument('--cpu-workers', dest='cpu_workers', type=int, default=config.CPU_WORKERS,
+                        help="Processes for git-heavy stages: git log + cross-referencing, patch generation")
+    parser.add_argument('--disk-workers', dest='disk_workers', type=int, default=config.DISK_WORKERS,
+                        help="Processes for disk-bound stages: splitting reports out of cached tracker pages")
+    args = parser.parse_args()
+
+    input_file = os.path.join(config.SCRIPT_DIR, 'test.txt')
+
     if not os.path.exists(input_file):
         print(f"Error: Input file not found at {input_file}", file=sys.stderr)
         sys.exit(1)
@@ -238,50 +252,103 @@ def main():
         print("No projects found in input file.")
         sys.exit(0)
 
-    # 2. 设定并行工作进程数量
-    num_workers = os.cpu_count() or 4 
-    print(f"Starting parallel processing with {num_workers} workers for {len(project_lines)} projects...")
+    skip_count = 0
+    all_projects = []
+    for line in project_lines:
+        project = utils.parse_project_line(line)
+        if not project:
+            print(f"[SKIPPED] Malformed line (Reason: expected at least 6 tab-separated parts): {line}")
+            skip_count += 1
+            continue
+        all_projects.append(project)
+
+    # projects sharing a repository_url are cross-referenced together in one log pass
+    repo_groups = repo_cache.group_projects_by_repo(all_projects)
+
+    projects = []
+    for project in all_projects:
+        # 上次失败的项目在退避时间内跳过 (--retry-now 除外)
+        entry = fast_bug_miner.stage_deferred(project['project_id'])
+        if entry and not args.retry_now:
+            print(f"[DEFERRED] {project['project_id']:<15} (failed in stage {entry['item']}, waiting for its retry backoff)")
+            continue
+        projects.append(project)
+
+    # 2. 准备输出目录与进度记录 (首次使用时登记旧版本已生成的输出)
+    for project in projects:
+        paths = project_paths(project)
+        for path in ('output_patches_dir', 'output_reports_dir', 'cache_project_dir', 'cache_issues_dir'):
+            os.makedirs(paths[path], exist_ok=True)
+        with open(paths['log_file'], 'w', encoding='utf-8') as log_f:
+            log_f.write(f"Processing project: {project['project_id']} ({project['project_name']})\n")
+        fast_bug_miner.open_project_state(project['project_id'], paths['output_csv_file'],
+                                          paths['output_patches_dir'], paths['output_reports_dir'])
+
+    tasks, task_projects = build_tasks(projects, repo_groups, args)
+    pool_sizes = {'network': args.network_workers, 'cpu': args.cpu_workers, 'disk': args.disk_workers}
+    print(f"Scheduling {len(tasks)} stages of {len(projects)} projects on process pools "
+          f"(network: {pool_sizes['network']}, cpu: {pool_sizes['cpu']}, disk: {pool_sizes['disk']})...")
     print("Detailed logs will be saved to 'bug-mining/<project_id>/mining.log'")
     print("-" * 60)
 
-    # 3. 使用 multiprocessing.Pool 来并发执行
+    # 工作进程继承同一个运行标识，共享缓存 (issues 同步、仓库 fetch) 在本次运行中只执行一次，
+    # 各进程的 HTTP 缓存统计也按运行汇总
+    utils.get_run_id()
+
+    projects_by_id = {project['project_id']: project for project in projects}
+    remaining = {}
+    for project_ids in task_projects.values():
+        for project_id in project_ids:
+            remaining[project_id] = remaining.get(project_id, 0) + 1
+    reasons = {} # project_id -> 第一个失败阶段的原因
+    counts = {"SUCCESS": 0, "FAILED": 0}
+
+    def on_finish(task, success, reason):
+        print(f"  [{task.pool:<7}] {task.key}: {'done' if success else f'FAILED ({reason})'}")
+        for project_id in task_projects[task.key]:
+            if not success:
+                reasons.setdefault(project_id, reason)
+            remaining[project_id] -= 1
+            if remaining[project_id]:
+                continue
+            # 项目的所有阶段都已结束
+            project = projects_by_id[project_id]
+            pipeline_state.for_project(project_id).compact()
+            siblings = repo_groups[repo_cache.normalize_repo_url(project['repository_url'])]
+            failed = project_id in reasons
+            fast_bug_miner.record_project_result(project, siblings, not failed,
+                                                 f"{reasons.get(project_id)} (see {project_id}/mining.log)")
+            if failed:
+                print(f"[FAILED]  {project_id:<15} (Reason: {reasons[project_id]})")
+                counts["FAILED"] += 1
+            else:
+                print(f"[SUCCESS] {project_id}")
+                counts["SUCCESS"] += 1
+
+    # 3. 按依赖关系调度所有阶段
     try:
-        with multiprocessing.Pool(processes=num_workers) as pool:
-
-            results = pool.imap_unordered(process_project, project_lines)
-
-            success_count = 0
-            fail_count = 0
-            skip_count = 0
-        
-            for (project_id, status, reason) in results:
-                if status == "SUCCESS":
-                    print(f"[SUCCESS] {project_id}")
-                    success_count += 1
-                elif status == "FAILED":
-                    # 失败信息
-                    print(f"[FAILED]  {project_id:<15} (Reason: {reason})")
-                    fail_count += 1
-                elif status == "SKIPPED":
-                    # 跳过信息
-                    print(f"[SKIPPED] Malformed line (Reason: {reason})")
-                    skip_count += 1
-
-        # 打印最终摘要
-        print("-" * 60)
-        print("\n--- Summary ---")
-        print(f"  Successful: {success_count}")
-        print(f"  Failed:     {fail_count}")
-        print(f"  Skipped:    {skip_count}")
-        print(f"  Total:      {len(project_lines)}")
-
+        stage_scheduler.run(tasks, pool_sizes, on_finish)
     except KeyboardInterrupt:
         print("\nCaught KeyboardInterrupt! Terminating workers.", file=sys.stderr)
-        pool.terminate()
-        pool.join()
         sys.exit(1)
-    
+
+    # 与 fast_bug_miner.py 相同: 重试已到重试时间的失败 (包括本次运行中较早失败的)，仍未完成的留待下次运行
+    fast_bug_miner.retry_pending(update=args.update, refresh=args.refresh)
+
+    # 打印最终摘要
+    print("-" * 60)
+    print("\n--- Summary ---")
+    print(f"  Successful: {counts['SUCCESS']}")
+    print(f"  Failed:     {counts['FAILED']}")
+    print(f"  Deferred:   {len(all_projects) - len(projects)}")
+    print(f"  Skipped:    {skip_count}")
+    print(f"  Total:      {len(project_lines)}")
+    pending = retry_queue.summary()
+    if pending:
+        print(f"\n{pending}")
+
     print("\nAll projects processed.")
+    print(http_client.run_summary())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# framework/fetch_reports.py
+#
+# 批量下载缓存页面未覆盖的缺陷报告: 按 tracker 分组，每个请求获取多个 issue，再拆分回 reports/<bug.id>.xml|.json。
+# - JIRA: searchrequest-xml + `key in (...)`，每个请求最多 100 个 key
+# - Bugzilla: show_bug.cgi?ctype=xml&id=..&id=..
+# GitHub 报告仍逐个通过 REST /issues/<n> 下载 (report_downloader)，保证报告内容与字段完整。
+# 批量请求失败或未返回的 issue 留给调用者用 utils.download_report_data() 逐个下载。
+
+import argparse
+import os
+import sys
+import requests
+from urllib.parse import quote_plus
+import http_client
+import utils
+import materialize_reports
+
+DEFAULT_BATCH_SIZE = 100
+
+def classify_report_url(report_url):
+    """
+    返回 (tracker_name, group_key, issue_key)；不支持批量获取时返回 None。
+    group_key 为同一批请求共享的部分 (tracker 根地址或 GitHub 仓库)。
+    """
+    # 与 utils.download_report_data() 的 URL 映射保持一致，只批量处理它会改写为 XML 视图的 URL
+    if 'issues.apache.org/jira/' in report_url and '/browse/' in report_url:
+        base, key = report_url.split('/browse/', 1)
+        return ('jira', f"{base}/", key.strip('/'))
+    if 'bugzilla' in report_url and 'show_bug.cgi?id=' in report_url:
+        bug_id = materialize_reports.report_key('bugzilla', report_url)
+        if bug_id:
+            return ('bugzilla', report_url.split('show_bug.cgi', 1)[0], bug_id)
+    return None
+
+def _get_text(session, uri):
+    response = http_client.get(session, uri, timeout=60)
+    response.raise_for_status()
+    return response.text
+
+def fetch_jira_batch(session, base_uri, keys):
+    """
+    一次 searchrequest-xml 请求获取多个 JIRA issue，返回 [(issue_key, XML), ...]。
+    """
+    jql = f"key in ({', '.join(keys)})"
+    uri = (
+        f"{base_uri}sr/jira.issueviews:searchrequest-xml/temp/SearchRequest.xml?"
+        f"jqlQuery={quote_plus(jql)}&tempMax={len(keys)}"
+    )
+    try:
+        return materialize_reports.split_jira_page(_get_text(session, uri))
+    except requests.exceptions.HTTPError as e:
+        # 任一 key 不存在 (或已删除) 时 JIRA 以 400 拒绝整个查询: 对半拆分后分别重试，只放弃无效的 key
+        if e.response is None or e.response.status_code != 400:
+            raise
+        if len(keys) == 1:
+            return []
+        middle = len(keys) // 2
+        return fetch_jira_batch(session, base_uri, keys[:middle]) + fetch_jira_batch(session, base_uri, keys[middle:])
+
+def fetch_bugzilla_batch(session, base_uri, bug_ids):
+    """
+    一次 ctype=xml 请求获取多个 Bugzilla bug，返回 [(bug_id, XML), ...]。
+    """
+    ids_query = "&".join(f"id={bug_id}" for bug_id in bug_ids)
+    uri = f"{base_uri}show_bug.cgi?ctype=xml&{ids_query}"
+    return materialize_reports.split_bugzilla_chunk(_get_text(session, uri))
+
+BATCH_FETCHERS = {
+    'jira': ('JIRA', fetch_jira_batch),
+    'bugzilla': ('Bugzilla', fetch_bugzilla_batch)
+}
+
+def fetch_reports(jobs, batch_size=DEFAULT_BATCH_SIZE, on_done=None):
+    """
+    按 tracker 分组批量下载 jobs [(bug_id, report_url, report_file), ...] 中的报告，每写入一个报告调用 on_done(bug_id)。
+    返回未能批量获取 (不支持的 tracker、请求失败或响应中缺失) 的任务列表。
+    """
+    groups = {} # (tracker_name, group_key) -> {issue_key: [job, ...]}
+    remaining = []
+    for job in jobs:
+        classified = classify_report_url(job[1])
+        if classified is None:
+            remaining.append(job)
+            continue
+        tracker_name, group_key, issue_key = classified
+        groups.setdefault((tracker_name, group_key), {}).setdefault(issue_key, []).append(job)
+
+    session = utils.get_http_session()
+    for (tracker_name, group_key), issue_jobs in groups.items():
+        label, fetcher = BATCH_FETCHERS[tracker_name]
+        issue_keys = list(issue_jobs.keys())
+        for i in range(0, len(issue_keys), batch_size):
+            batch = issue_keys[i:i + batch_size]
+            print(f"  -> [{label}] Fetching {len(batch)} reports in one request", end="")
+            try:
+                reports = fetcher(session, group_key, batch)
+                print("OK", file=sys.stderr)
+            except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                print("FAIL", file=sys.stderr)
+                print(f"  -> Error fetching {label} batch: {e}", file=sys.stderr)
+                reports = []
+
+            for issue_key, content in reports:
+                for bug_id, report_url, report_file in issue_jobs.pop(issue_key, []):
+                    try:
+                        materialize_reports.write_report(report_file, content)
+                        if on_done:
+                            on_done(bug_id)
+                    except IOError as e:
+                        print(f"  -> Error writing report for bug {bug_id}: {e}", file=sys.stderr)
+                        remaining.append((bug_id, report_url, report_file))
+
+        # 批量结果中缺失的 issue (例如已移动的 JIRA key) 交给逐个下载
+        for key_jobs in issue_jobs.values():
+            remaining.extend(key_jobs)
+
+    return remaining
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch missing reports for active-bugs.csv in batches per issue tracker.")
+    parser.add_argument('-b', dest='csv_file', required=True, help="Path to active-bugs.csv")
+    parser.add_argument('-o', dest='reports_dir', required=True, help="Output directory for <bug.id>.xml|.json reports")
+    parser.add_argument('-n', dest='batch_size', type=int, default=DEFAULT_BATCH_SIZE, help="Issues per request")
+
+    args = parser.parse_args()
+
+    os.makedirs(args.reports_dir, exist_ok=True)
+    jobs = materialize_reports.read_report_jobs(args.csv_file, args.reports_dir)
+    if jobs is None:
+        sys.exit(1)
+
+    for bug_id, report_url, report_file in fetch_reports(jobs, max(1, args.batch_size)):
+        print(f"\n  -> Downloading report for bug {bug_id}...")
+        utils.download_report_data(report_url, report_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# framework/generate_patches.py
+#
+# 为 active-bugs.csv 中的所有缺陷批量生成 patches/<bug.id>.src.patch。
+# 只启动一个 `git diff-tree --stdin -p` 进程，流式读取其输出并按 commit 切分，
+# 不会把任何一个完整的 diff 读入内存。
+# diff-tree 遇到不存在的 commit 会直接退出，因此先通过 git_backend 的常驻 cat-file 进程排除这些 commit；
+# 单遍进程仍意外退出时，其后尚未生成的 patch 用 git_backend.diff() 逐个补做。
+
+import argparse
+import csv
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import config
+import git_backend
+import repo_cache
+
+# diff-tree 在每个 commit 的 patch 之前输出一行完整的 commit hash (SHA-1 或 SHA-256)。
+# diff 内容行总是以 ' ', '+', '-', '\\' 或带空格的头部开始，因此不会与之混淆。
+COMMIT_HEADER_RE = re.compile(rb'^([0-9a-f]{40}|[0-9a-f]{64})\n$')
+
+def read_patch_jobs(csv_file, patches_dir, done=None):
+    """
+    读取 active-bugs.csv，返回尚未生成 patch 的任务列表 [(bug_id, buggy, fixed), ...]。
+    done 为已完成的 bug_id 集合 (pipeline_state) 时，只跳过其中 patch 文件存在的 bug；为 None 时跳过所有已存在的 patch。
+    CSV 无效时返回 None。
+    """
+    jobs = []
+    try:
+        with open(csv_file, 'r', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            try:
+                header = next(reader)
+                idx_bug_id = header.index(config.BUGS_CSV_BUGID)
+                idx_commit_buggy = header.index(config.BUGS_CSV_COMMIT_BUGGY)
+                idx_commit_fixed = header.index(config.BUGS_CSV_COMMIT_FIXED)
+            except (StopIteration, ValueError) as e:
+                print(f"Error: Invalid or empty CSV file: {csv_file}. {e}", file=sys.stderr)
+                return None
+
+            for row in reader:
+                try:
+                    bug_id = row[idx_bug_id]
+                    commit_buggy = row[idx_commit_buggy]
+                    commit_fixed = row[idx_commit_fixed]
+                except IndexError:
+                    continue
+
+                if not commit_buggy or not commit_fixed:
+                    print(f"  -> Skipping patch for bug {bug_id} (missing commit hash).")
+                    continue
+
+                if os.path.exists(os.path.join(patches_dir, f"{bug_id}.src.patch")) and (done is None or bug_id in done):
+                    continue
+
+                jobs.append((bug_id, commit_buggy, commit_fixed))
+    except IOError as e:
+        print(f"Error reading {csv_file}: {e}", file=sys.stderr)
+        return None
+
+    return jobs
+
+def _feed_stdin(stdin, pairs):
+    """
+    在独立线程中写入 diff-tree 的标准输入，避免与读取 stdout 互相阻塞。
+    每行 "<fixed> <buggy>": 将 buggy 视为 fixed 的父 commit 进行比较，等价于 `git diff buggy fixed`。
+    """
+    try:
+        for commit_buggy, commit_fixed in pairs:
+            stdin.write(f"{commit_fixed} {commit_buggy}\n".encode('ascii'))
+        stdin.close()
+    except (BrokenPipeError, OSError):
+        pass
+
+def _finish_patch(tmp_file, bug_ids, patches_dir):
+    """
+    将临时文件原子地重命名为 patch 文件；多个 bug 共享同一对 commit 时复制给其余 bug (同样先写临时文件)。
+    """
+    tmp_file.close()
+    first_patch = os.path.join(patches_dir, f"{bug_ids[0]}.src.patch")
+    os.replace(tmp_file.name, first_patch)
+    if os.path.getsize(first_patch) == 0:
+        print(f"  -> Warning: Generated patch for bug {bug_ids[0]} is empty.", file=sys.stderr)
+    for bug_id in bug_ids[1:]:
+        copy_tmp = os.path.join(patches_dir, f".{bug_id}.src.patch.tmp")
+        shutil.copyfile(first_patch, copy_tmp)
+        os.replace(copy_tmp, os.path.join(patches_dir, f"{bug_id}.src.patch"))
+
+def prefetch_blobs(repo_dir, pairs, sub_project_path='.'):
+    """
+    partial clone (--filter=blob:none) 中，diff 所需的 blob 可能尚未下载。
+    先用一次不含 patch 的 `git diff-tree --raw` 列出所有改动文件的新旧 blob，
+    再批量 fetch，避免 git 在生成 patch 时逐个 commit 按需下载。
+    """
+    cmd_list = [
+        'git',
+        f'--git-dir={repo_dir}',
+        'diff-tree',
+        '--stdin',
+        '-r',
+        '--raw',
+        '--no-renames',
+        '--no-commit-id',
+        '--',
+        sub_project_path
+    ]
+    oids = set()
+    try:
+        proc = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        print(f"  -> Warning: Could not list blobs to prefetch: {e}", file=sys.stderr)
+        return False
+
+    feeder = threading.Thread(target=_feed_stdin, args=(proc.stdin, pairs), daemon=True)
+    feeder.start()
+    for line in proc.stdout:
+        # ":100644 100644 <old> <new> M\tpath"
+        fields = line.split(b'\t', 1)[0].split()
+        if len(fields) < 4 or not fields[0].startswith(b':'):
+            continue
+        for mode, oid in ((fields[0][1:], fields[2]), (fields[1], fields[3])):
+            # 跳过不存在的一侧 (全零) 与 submodule (160000)
+            if mode != b'160000' and oid.strip(b'0'):
+                oids.add(oid.decode('ascii'))
+    proc.stdout.close()
+    proc.wait()
+    feeder.join()
+
+    if not oids:
+        return True
+    return repo_cache.fetch_objects(repo_dir, oids, "  -> ")
+
+def _diff_one_by_one(backend, pairs, pair_bug_ids, patches_dir, sub_project_path, on_done):
+    """
+    用常驻的 diff-tree 进程 (git_backend.diff()) 逐个重新生成 pairs 的 patch，
+    例如单遍 diff-tree 中途退出后未生成的部分。返回仍然失败的 pairs。
+    """
+    print(f"  -> Retrying {len(pairs)} patches one at a time")
+    failed = []
+    for commit_buggy, commit_fixed in pairs:
+        try:
+            patch = backend.diff(commit_buggy, commit_fixed, sub_project_path)
+        except (git_backend.GitProcessError, OSError) as e:
+            print(f"  -> git diff-tree failed for {commit_fixed}: {e}", file=sys.stderr)
+            patch = None
+        if patch is None:
+            failed.append((commit_buggy, commit_fixed))
+            continue
+        bug_ids = pair_bug_ids[(commit_buggy, commit_fixed)]
+        tmp_file = open(os.path.join(patches_dir, f".{bug_ids[0]}.src.patch.tmp"), 'w', encoding='utf-8')
+        tmp_file.write(patch)
+        _finish_patch(tmp_file, bug_ids, patches_dir)
+        for bug_id in bug_ids:
+            on_done(bug_id)
+    return failed
+
+def generate_patches(repo_dir, csv_file, patches_dir, sub_project_path='.', done=None, on_done=None):
+    """
+    用一个长期运行的 `git diff-tree --stdin` 进程生成 csv_file 中所有缺失的 patch。
+    已存在的 patch 会被跳过 (done 的含义见 read_patch_jobs())。
+    每个 patch 完整写入后调用 on_done(bug_id)。全部成功返回 True，否则返回 False。
+    """
+    on_done = on_done or (lambda bug_id: None)
+    jobs = read_patch_jobs(csv_file, patches_dir, done)
+    if jobs is None:
+        return False
+    if not jobs:
+        return True
+
+    os.makedirs(patches_dir, exist_ok=True)
+
+    # 相同 (buggy, fixed) 只需 diff 一次
+    pair_bug_ids = {}
+    for bug_id, commit_buggy, commit_fixed in jobs:
+        pair_bug_ids.setdefault((commit_buggy, commit_fixed), []).append(bug_id)
+    pairs = list(pair_bug_ids.keys())
+
+    # 不存在的 commit 会让 diff-tree (包括 prefetch_blobs 的 --raw 列表) 中途退出，使其后的所有 patch 失败
+    backend = git_backend.get_backend(repo_dir)
+    missing = []
+    try:
+        missing = [pair for pair in pairs if not (backend.exists(pair[0]) and backend.exists(pair[1]))]
+    except (git_backend.GitProcessError, OSError) as e:
+        print(f"  -> Warning: Could not check commits in {repo_dir}: {e}", file=sys.stderr)
+    for commit_buggy, commit_fixed in missing:
+        print(f"  -> Commit {commit_buggy} or {commit_fixed} not found in {repo_dir}.", file=sys.stderr)
+    pairs = [pair for pair in pairs if pair not in missing]
+
+    if repo_cache.is_partial_clone(repo_dir):
+        prefetch_blobs(repo_dir, pairs, sub_project_path)
+
+    print(f"  -> Generating {len(jobs)} patches with one git diff-tree pass")
+
+    # -M: 与 porcelain `git diff` 默认的 rename 检测保持一致
+    # --always: 即使 diff 为空也输出 commit 行，以便生成空 patch
+    cmd_list = [
+        'git',
+        f'--git-dir={repo_dir}',
+        'diff-tree',
+        '--stdin',
+        '-p',
+        '-M',
+        '--always',
+        '--',
+        sub_project_path
+    ]
+
+    failed = []
+    with tempfile.TemporaryFile() as stderr_file:
+        try:
+            proc = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr_file)
+        except OSError as e:
+            print(f"Error: Could not start git diff-tree: {e}", file=sys.stderr)
+            return False
+
+        feeder = threading.Thread(target=_feed_stdin, args=(proc.stdin, pairs), daemon=True)
+        feeder.start()
+
+        next_pair = 0
+        current = None  # (tmp_file, bug_ids)
+        last_bug_ids = [] # 最后一个 patch 在 diff-tree 正常退出后才算完整
+        try:
+            for line in proc.stdout:
+                match = COMMIT_HEADER_RE.match(line)
+                if match:
+                    header_hash = match.group(1).decode('ascii')
+                    # 无法解析的输入行不会产生输出；跳过这些任务直到对上当前 commit
+                    pair_idx = next_pair
+                    while pair_idx < len(pairs) and not header_hash.startswith(pairs[pair_idx][1]):
+                        pair_idx += 1
+                    if pair_idx < len(pairs):
+                        if current:
+                            # 已开始输出下一个 commit，上一个 patch 是完整的
+                            _finish_patch(current[0], current[1], patches_dir)
+                            for bug_id in current[1]:
+                                on_done(bug_id)
+                        failed.extend(pairs[next_pair:pair_idx])
+                        bug_ids = pair_bug_ids[pairs[pair_idx]]
+                        tmp_file = open(os.path.join(patches_dir, f".{bug_ids[0]}.src.patch.tmp"), 'w', encoding='utf-8')
+                        current = (tmp_file, bug_ids)
+                        next_pair = pair_idx + 1
+                        continue
+
+                if current:
+                    current[0].write(line.decode('utf-8', errors='ignore'))
+
+            if current:
+                _finish_patch(current[0], current[1], patches_dir)
+                last_bug_ids = current[1]
+                current = None
+        finally:
+            if current:
+                current[0].close()
+                if os.path.exists(current[0].name):
+                    os.remove(current[0].name)
+            proc.stdout.close()
+            returncode = proc.wait()
+            feeder.join()
+
+        failed.extend(pairs[next_pair:])
+
+        if returncode == 0:
+            for bug_id in last_bug_ids:
+                on_done(bug_id)
+        else:
+            # 进程异常退出时，最后一个 patch 可能不完整
+            stderr_file.seek(0)
+            print(f"Error: git diff-tree exited with {returncode}", file=sys.stderr)
+            print(stderr_file.read().decode('utf-8', errors='ignore'), file=sys.stderr)
+            if next_pair > 0:
+                failed.append(pairs[next_pair - 1])
+                for bug_id in pair_bug_ids[pairs[next_pair - 1]]:
+                    patch_file = os.path.join(patches_dir, f"{bug_id}.src.patch")
+                    if os.path.exists(patch_file):
+                        os.remove(patch_file)
+
+    if failed:
+        failed = _diff_one_by_one(backend, failed, pair_bug_ids, patches_dir, sub_project_path, on_done)
+
+    for commit_buggy, commit_fixed in missing + failed:
+        for bug_id in pair_bug_ids[(commit_buggy, commit_fixed)]:
+            print(f"  -> Error generating patch for bug {bug_id} ({commit_buggy} -> {commit_fixed}).", file=sys.stderr)
+
+    return not (missing or failed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate patches for all bugs in active-bugs.csv with one git pass.")
+    parser.add_argument('-r', dest='repo_dir', required=True, help="Path to the .git repository directory")
+    parser.add_argument('-b', dest='csv_file', required=True, help="Path to active-bugs.csv")
+    parser.add_argument('-o', dest='patches_dir', required=True, help="Output directory for <bug.id>.src.patch files")
+    parser.add_argument('-p', dest='sub_project_path', default='.', help="Sub-project path to restrict the diff to")
+
+    args = parser.parse_args()
+
+    if not generate_patches(args.repo_dir, args.csv_file, args.patches_dir, args.sub_project_path):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# framework/git_backend.py
+#
+# 常驻的 git 访问层: 每个裸仓库保持长期运行的
+#   git cat-file --batch-check   (对象是否存在、类型)
+#   git cat-file --batch         (读取对象内容，例如 commit 的父 commit)
+#   git diff-tree --stdin -p     (按需生成单个 patch)
+# 进程，查询通过它们的 stdin/stdout 复用，不再为每个 commit 启动一个 git 进程。
+# 批量生成 patch 仍由 generate_patches.py 的单个 `git diff-tree --stdin` 进程流式完成；
+# 它先用 exists() 排除不存在的 commit，单遍进程中途退出时用 diff() 逐个补做其余 patch。
+# diff-tree 会原样输出无法解析为 commit 的输入行，每个查询后写入一个哨兵行作为输出结束标记。
+# 所有查询都是线程安全的 (每个进程一把锁)。
+
+import atexit
+import os
+import subprocess
+import sys
+import threading
+
+class GitProcessError(Exception):
+    """
+    常驻 git 进程意外退出或输出无法解析。
+    """
+
+class _BatchProcess:
+    """
+    一个常驻 git 进程及其锁。
+    """
+    def __init__(self, cmd_list):
+        env = dict(os.environ)
+        # partial clone 中查询缺失的对象时不触发按需下载 (git 2.44+，旧版本忽略)
+        env['GIT_NO_LAZY_FETCH'] = '1'
+        self.cmd_list = cmd_list
+        self.lock = threading.Lock()
+        self.seq = 0 # 哨兵行序号，持有 lock 时递增
+        self.proc = subprocess.Popen(
+            cmd_list, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env
+        )
+
+    def write(self, data):
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise GitProcessError(f"{self.cmd_list} exited: {e}")
+
+    def readline(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise GitProcessError(f"{self.cmd_list} exited with {self.proc.poll()}")
+        return line
+
+    def read(self, size):
+        data = self.proc.stdout.read(size)
+        if len(data) != size:
+            raise GitProcessError(f"{self.cmd_list} exited with {self.proc.poll()}")
+        return data
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+
+class GitBackend:
+    """
+    一个裸仓库的常驻 git 进程集合。进程在第一次使用时启动，close() 时结束。
+    """
+    def __init__(self, repo_dir):
+        self.repo_dir = repo_dir
+        self._lock = threading.Lock()
+        self._processes = {} # key -> _BatchProcess
+
+    def _process(self, key, args):
+        with self._lock:
+            if key not in self._processes:
+                self._processes[key] = _BatchProcess(['git', f'--git-dir={self.repo_dir}'] + args)
+            return self._processes[key]
+
+    def _restart(self, key):
+        with self._lock:
+            process = self._processes.pop(key, None)
+        if process:
+            process.close()
+
+    def object_info(self, oid):
+        """
+        返回 (完整 oid, 类型, 大小)；对象不存在时返回 None。
+        partial clone 中按需获取的对象 (缺失的 blob) 会使进程退出 (GitProcessError)，只应查询 commit 等总是存在的对象。
+        """
+        process = self._process('batch-check', ['cat-file', '--batch-check'])
+        with process.lock:
+            try:
+                process.write(f"{oid}\n".encode('utf-8'))
+                fields = process.readline().decode('utf-8', errors='ignore').split()
+            except GitProcessError:
+                self._restart('batch-check')
+                raise
+        if len(fields) != 3:
+            return None # "<oid> missing" 或 "<oid> ambiguous"
+        return fields[0], fields[1], int(fields[2])
+
+    def exists(self, oid):
+        return self.object_info(oid) is not None
+
+    def read_object(self, oid):
+        """
+        返回 (类型, 内容 bytes)；对象不存在时返回 None。
+        """
+        process = self._process('batch', ['cat-file', '--batch'])
+        with process.lock:
+            try:
+                process.write(f"{oid}\n".encode('utf-8'))
+                fields = process.readline().decode('utf-8', errors='ignore').split()
+                if len(fields) != 3:
+                    return None # "<oid> missing" 或 "<oid> ambiguous"
+                content = process.read(int(fields[2]))
+                process.read(1) # 内容后的换行
+            except GitProcessError:
+                # 下次查询时重新启动进程
+                self._restart('batch')
+                raise
+        return fields[1], content
+
+    def parents(self, commit):
+        """
+        返回 commit 的父 commit 列表 (root commit 为空列表)；不是 commit 或不存在时返回 None。
+        """
+        obj = self.read_object(commit)
+        if obj is None or obj[0] != 'commit':
+            return None
+        parents = []
+        for line in obj[1].split(b'\n'):
+            if not line:
+                break # 头部结束，之后是提交消息
+            if line.startswith(b'parent '):
+                parents.append(line[7:].decode('ascii'))
+        return parents
+
+    def diff(self, commit_buggy, commit_fixed, sub_project_path='.'):
+        """
+        返回 `git diff buggy fixed -- sub_project_path` (含 rename 检测) 的 patch 文本，与 generate_patches.py 的输出相同；
+        commit 不存在时返回 None。每个 sub_project_path 使用一个常驻的 diff-tree --stdin 进程。
+        """
+        # diff-tree 遇到不存在的对象会直接退出，先用 batch-check 确认
+        if not (self.exists(commit_buggy) and self.exists(commit_fixed)):
+            return None
+        key = f"diff-tree:{sub_project_path}"
+        process = self._process(key, ['diff-tree', '--stdin', '-p', '-M', '--always', '--', sub_project_path])
+        with process.lock:
+            process.seq += 1
+            marker = f"#d4j-end-{os.getpid()}-{process.seq}\n".encode('ascii')
+            query = f"{commit_fixed} {commit_buggy}\n".encode('utf-8')
+            lines = []
+            try:
+                process.write(query + marker)
+                header = process.readline()
+                while header != marker:
+                    line = process.readline()
+                    if line == marker:
+                        break
+                    lines.append(line)
+            except GitProcessError:
+                self._restart(key)
+                raise
+        if header in (marker, query):
+            return None # 例如 commit_fixed 不是 commit；不是 hash 的输入被原样输出
+        if not header.strip().decode('ascii', errors='ignore').startswith(commit_fixed):
+            # 输出错位 (不应发生)；重启进程，避免影响后续查询
+            self._restart(key)
+            raise GitProcessError(f"Unexpected diff-tree output for {commit_fixed}: {header!r}")
+        return b''.join(lines).decode('utf-8', errors='ignore')
+
+    def close(self):
+        with self._lock:
+            processes = list(self._processes.values())
+            self._processes.clear()
+        for process in processes:
+            process.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_backend(repo_dir):
+    """
+    返回本进程中 repo_dir 共享的 GitBackend。进程退出时自动关闭。
+    """
+    repo_dir = os.path.abspath(repo_dir)
+    with _backends_lock:
+        if repo_dir not in _backends:
+            _backends[repo_dir] = GitBackend(repo_dir)
+        return _backends[repo_dir]
+
+@atexit.register
+def close_all():
+    with _backends_lock:
+        backends = list(_backends.values())
+        _backends.clear()
+    for backend in backends:
+        try:
+            backend.close()
+        except Exception as e:
+            print(f"Warning: Could not close git processes for {backend.repo_dir}: {e}", file=sys.stderr)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# framework/http_client.py
+#
+# download_issues.py、报告下载等所有网络请求共用的 HTTP 层。
+# 条件请求缓存: 每个 URL 的 ETag / Last-Modified 保存在 cache/http/<sha1>.json；
+# 刷新已缓存的文件时发送 If-None-Match / If-Modified-Since，304 计为命中且不重写文件。
+# GitHub API 请求: 由 GitHubTokenPool 按 X-RateLimit-Remaining 在多个 token 之间分配，
+# 遇到速率限制时换用其他 token，全部耗尽时暂停到最早的重置时间，而不是失败。
+# 每主机速率限制: 每个请求发出前经过 rate_limiter.wait()，所有进程共享同一个 token bucket。
+# 失败重试: 连接错误、超时与 429/5xx 按指数退避 (或 Retry-After) 重试；连续失败的主机由 circuit_breaker 熔断。
+# 缓存统计: 除本进程的计数 (summary()) 外，同一次运行 (D4J_RUN_ID) 的所有进程共享 cache/http/<run_id>.stats。
+
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+import circuit_breaker
+import config
+import rate_limiter
+import utils
+
+_stats_lock = threading.Lock()
+# 本进程的缓存统计: 304 命中数、完整下载数，以及对应的字节数
+stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_fetched': 0}
+
+def _run_stats_file(run_id):
+    return os.path.join(config.HTTP_CACHE_DIR, f"{run_id}.stats")
+
+def _read_run_stats(run_id):
+    try:
+        with open(_run_stats_file(run_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def _count(hits=0, misses=0, bytes_saved=0, bytes_fetched=0):
+    counts = {'hits': hits, 'misses': misses, 'bytes_saved': bytes_saved, 'bytes_fetched': bytes_fetched}
+    with _stats_lock:
+        for name, value in counts.items():
+            stats[name] += value
+
+    # 挖掘脚本的工作进程与 download_issues.py 子进程继承同一个 D4J_RUN_ID，
+    # 各自把计数累加到 cache/http/<run_id>.stats，运行结束时由 run_summary() 汇总
+    run_id = os.environ.get('D4J_RUN_ID')
+    if not run_id:
+        return
+    stats_file = _run_stats_file(run_id)
+    try:
+        os.makedirs(config.HTTP_CACHE_DIR, exist_ok=True)
+        with utils.file_lock(f"{stats_file}.lock"):
+            totals = _read_run_stats(run_id)
+            for name, value in counts.items():
+                totals[name] = totals.get(name, 0) + value
+            tmp_file = f"{stats_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(totals, f)
+            os.replace(tmp_file, stats_file)
+    except OSError as e:
+        # 统计失败不影响下载
+        print(f"Warning: Could not update {stats_file}: {e}", file=sys.stderr)
+
+def _format_stats(counts):
+    return (
+        f"HTTP cache: {counts.get('hits', 0)} hits (304 Not Modified), {counts.get('misses', 0)} misses, "
+        f"{counts.get('bytes_saved', 0) / 1024:.1f} KiB not re-downloaded, {counts.get('bytes_fetched', 0) / 1024:.1f} KiB fetched"
+    )
+
+def summary():
+    """
+    返回本进程的缓存统计摘要，用于日志输出。
+    """
+    with _stats_lock:
+        return _format_stats(stats)
+
+def run_summary():
+    """
+    返回本次运行 (D4J_RUN_ID) 所有进程的缓存统计摘要，并删除其统计文件。在运行结束时调用。
+    """
+    run_id = utils.get_run_id()
+    stats_file = _run_stats_file(run_id)
+    with utils.file_lock(f"{stats_file}.lock"):
+        totals = _read_run_stats(run_id)
+        if os.path.exists(stats_file):
+            os.remove(stats_file)
+    try:
+        os.remove(f"{stats_file}.lock")
+    except OSError:
+        pass
+    return _format_stats(totals)
+
+def _validator_file(uri):
+    return os.path.join(config.HTTP_CACHE_DIR, f"{hashlib.sha1(uri.encode('utf-8')).hexdigest()}.json")
+
+def load_validators(uri):
+    """
+    返回 uri 上次响应的 {'etag': ..., 'last_modified': ...}；没有记录时返回 None。
+    """
+    try:
+        with open(_validator_file(uri), 'r', encoding='utf-8') as f:
+            validators = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if validators.get('uri') != uri or not (validators.get('etag') or validators.get('last_modified')):
+        return None
+    return validators
+
+def has_validators(uri, save_to):
+    """
+    save_to 已存在且 uri 有 validators 时返回 True，即可以用条件请求廉价地检查是否有变化。
+    """
+    return os.path.exists(save_to) and load_validators(uri) is not None
+
+def _save_validators(uri, response):
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    validator_file = _validator_file(uri)
+    if not etag and not last_modified:
+        if os.path.exists(validator_file):
+            os.remove(validator_file)
+        return
+    os.makedirs(config.HTTP_CACHE_DIR, exist_ok=True)
+    tmp_file = f"{validator_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'uri': uri, 'etag': etag, 'last_modified': last_modified}, f)
+    os.replace(tmp_file, validator_file)
+
+class GitHubTokenPool:
+    """
+    GitHub token 池。根据每个响应的 X-RateLimit-Remaining / X-RateLimit-Reset 跟踪各 token 的剩余额度，
+    每次选择剩余额度最多的 token；没有 token 时以匿名身份 (None) 参与同样的调度。
+    """
+    def __init__(self, tokens):
+        self.tokens = list(tokens) or [None]
+        self._lock = threading.Lock()
+        # token -> {'remaining': 剩余次数 (未知为 None), 'reset': 额度恢复的 epoch 秒}
+        self._state = {token: {'remaining': None, 'reset': 0.0} for token in self.tokens}
+
+    def acquire(self):
+        """
+        返回一个仍有额度的 token；全部耗尽时睡眠到最早的重置时间。
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                available = [
+                    token for token in self.tokens
+                    if self._state[token]['remaining'] is None
+                    or self._state[token]['remaining'] > 0
+                    or self._state[token]['reset'] <= now
+                ]
+                if available:
+                    token = max(available, key=self._priority)
+                    state = self._state[token]
+                    if state['remaining'] is not None:
+                        # 额度已重置时先视为未知，等下一个响应更新
+                        state['remaining'] = state['remaining'] - 1 if state['reset'] > now else None
+                    return token
+                wait = min(state['reset'] for state in self._state.values()) - now
+            print(f"GitHub rate limit exhausted for all {len(self.tokens)} token(s). "
+                  f"Pausing {wait:.0f}s until the earliest reset.", file=sys.stderr)
+            time.sleep(max(wait, 1))
+
+    def _priority(self, token):
+        state = self._state[token]
+        return float('inf') if state['remaining'] is None else state['remaining']
+
+    def update(self, token, response):
+        """
+        用响应头更新 token 的额度。响应为速率限制 (403/429) 时返回 True，表示应换用 token 重试。
+        """
+        now = time.time()
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        retry_after = response.headers.get('Retry-After')
+        with self._lock:
+            state = self._state[token]
+            if remaining is not None and remaining.isdigit():
+                state['remaining'] = int(remaining)
+            if reset is not None and reset.isdigit():
+                state['reset'] = float(reset)
+
+            if response.status_code not in (403, 429):
+                return False
+            if retry_after is not None and retry_after.isdigit():
+                # secondary rate limit: 在 Retry-After 之前不再使用该 token；
+                # 主额度未耗尽时 X-RateLimit-Reset 与此无关，不必等到主额度重置
+                if state['remaining']:
+                    state['reset'] = now + int(retry_after)
+                else:
+                    state['reset'] = max(state['reset'], now + int(retry_after))
+                state['remaining'] = 0
+                return True
+            if state['remaining'] == 0:
+                state['reset'] = max(state['reset'], now + 1)
+                return True
+            return False
+
+_github_pool = None
+_github_pool_lock = threading.Lock()
+
+def get_github_pool():
+    """
+    返回本进程共享的 GitHubTokenPool (config.GITHUB_TOKENS)。
+    """
+    global _github_pool
+    with _github_pool_lock:
+        if _github_pool is None:
+            _github_pool = GitHubTokenPool(config.GITHUB_TOKENS)
+        return _github_pool
+
+def is_github_api(uri):
+    return urlparse(uri).netloc in config.GITHUB_API_HOSTS
+
+# 视为主机故障、需要退避重试的响应状态
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+def _retry_after(response):
+    """
+    解析 Retry-After (秒数或 HTTP 日期)，返回秒数；没有或无法解析时返回 None。
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def request(session, method, uri, headers=None, timeout=20, **kwargs):
+    """
+    发送 HTTP 请求。所有下载都经由此函数发出，并受每主机速率限制 (rate_limiter.py) 与熔断器 (circuit_breaker.py) 约束。
+    连接错误、超时与 429/5xx 响应按指数退避重试 (优先使用 Retry-After)，最多 config.HTTP_RETRIES 次；
+    主机熔断时抛出 circuit_breaker.HostUnavailable。
+    GitHub API 请求自动附加 token，并在遇到速率限制时换用 token 或等待重置后重试。
+    """
+    headers = dict(headers or {})
+    host = urlparse(uri).netloc
+    pool = get_github_pool() if is_github_api(uri) else None
+    attempt = 0
+    while True:
+        circuit_breaker.check(host)
+        token = None
+        if pool:
+            token = pool.acquire()
+            if token:
+                headers['Authorization'] = f"token {token}"
+        rate_limiter.wait(host)
+
+        try:
+            response = session.request(method, uri, headers=headers, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            circuit_breaker.record_failure(host)
+            if attempt >= config.HTTP_RETRIES:
+                raise
+            reason, delay = type(e).__name__, None
+        else:
+            if pool and pool.update(token, response):
+                print(f"  -> GitHub rate limit hit ({response.status_code}) for {uri}. Retrying.", file=sys.stderr)
+                continue
+            if response.status_code not in RETRY_STATUS:
+                circuit_breaker.record_success(host)
+                return response
+            delay = _retry_after(response)
+            circuit_breaker.record_failure(host, delay)
+            if attempt >= config.HTTP_RETRIES or (delay is not None and delay > config.HTTP_BACKOFF_MAX):
+                return response
+            reason = f"HTTP {response.status_code}"
+
+        if delay is None:
+            delay = min(config.HTTP_BACKOFF * 2 ** attempt, config.HTTP_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+        attempt += 1
+        print(f"  -> {reason} for {uri}. Retrying in {delay:.1f}s ({attempt}/{config.HTTP_RETRIES}).", file=sys.stderr)
+        time.sleep(delay)
+
+def get(session, uri, headers=None, timeout=20):
+    return request(session, 'GET', uri, headers, timeout)
+
+def post(session, uri, headers=None, timeout=20, **kwargs):
+    return request(session, 'POST', uri, headers, timeout, **kwargs)
+
+def fetch(session, uri, save_to, headers=None, timeout=20):
+    """
+    下载 uri 并原子地写入 save_to，同时记录响应的 ETag / Last-Modified。
+    save_to 已存在且有 validators 时发送条件请求；304 时保留原文件。
+    返回 (response, hit)。HTTP 错误时抛出 requests.exceptions.RequestException。
+    """
+    headers = dict(headers or {})
+    validators = load_validators(uri) if os.path.exists(save_to) else None
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    response = get(session, uri, headers, timeout)
+    if validators and response.status_code == 304:
+        _count(hits=1, bytes_saved=os.path.getsize(save_to))
+        return response, True
+    response.raise_for_status()
+
+    tmp_file = f"{save_to}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(response.text)
+    os.replace(tmp_file, save_to)
+    _save_validators(uri, response)
+    _count(misses=1, bytes_fetched=len(response.content))
+    return response, False
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# framework/issue_index.py
+#
+# 所有项目与运行共享的 issue 索引: cache/shared_issues/issues.sqlite3
+#   issues(tracker, key, key_lower, url, fetched_at, updated_at)，主键 (tracker, key_lower)
+#   trackers(tracker, issues_file, mtime_ns, size, indexed_at)
+# tracker 为 issues.txt 的规范化绝对路径 (不同位置、同一目录下的不同 issues 文件不会互相覆盖)。issues.txt 仍由 download_issues.py 写出并保持为权威数据:
+# download_issues.py 每次写入后同步更新索引；索引记录的 issues.txt 大小/修改时间与文件不一致时 (旧缓存、手工修改)，
+# 读取方会从 issues.txt 重新导入。vcs_log_xref.py 按需查询 (忽略大小写)，不再把整个 issues.txt 读入内存。
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+import config
+import utils
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS issues (
+    tracker TEXT NOT NULL,
+    key TEXT NOT NULL,
+    key_lower TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (tracker, key_lower)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS trackers (
+    tracker TEXT PRIMARY KEY,
+    issues_file TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    indexed_at TEXT NOT NULL
+);
+'''
+
+def tracker_key(issues_file):
+    """
+    返回 issues_file 在索引中的 tracker 键，即它的规范化绝对路径 (.../shared_issues/<tracker>_<id>/issues.txt)。
+    """
+    return os.path.normcase(os.path.realpath(issues_file))
+
+def resolve_tracker(tracker):
+    """
+    返回命令行中指定的 tracker 的键: tracker 可以是 issues.txt、它所在的目录，或 shared_issues 下的目录名 (例如 jira_CAY)。
+    """
+    if os.path.isfile(tracker):
+        return tracker_key(tracker)
+    if not os.path.isdir(tracker):
+        tracker = os.path.join(config.SHARED_ISSUES_DIR, tracker)
+    return tracker_key(os.path.join(tracker, 'issues.txt'))
+
+def connect(db_file=None):
+    """
+    打开 (必要时创建) 索引数据库。WAL 模式允许多个进程同时读取。
+    """
+    db_file = db_file or config.ISSUE_INDEX_FILE
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    conn = sqlite3.connect(db_file, timeout=60)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+def read_issues_file(issues_file):
+    """
+    按 utils.read_config_file() 的规则解析 issues.txt，逐个返回 (key, url)。
+    """
+    with open(issues_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or ',' not in line:
+                continue
+            key, url = line.split(',', 1)
+            yield key.strip(), url.strip()
+
+def _file_stat(issues_file):
+    st = os.stat(issues_file)
+    return st.st_mtime_ns, st.st_size
+
+def _record_file(conn, tracker, issues_file, now):
+    mtime_ns, size = _file_stat(issues_file)
+    conn.execute(
+        'INSERT OR REPLACE INTO trackers (tracker, issues_file, mtime_ns, size, indexed_at) VALUES (?, ?, ?, ?, ?)',
+        (tracker, os.path.abspath(issues_file), mtime_ns, size, now)
+    )
+
+def index_issues(issues_file, changed=None, synced_at=None, db_file=None):
+    """
+    把 issues_file 同步到索引。
+    changed 为 None 时 (完整下载) 以 issues_file 为准替换该 tracker 的全部条目；
+    否则 (增量同步) 只插入 changed [(key, url), ...] 中的新条目，并更新已有条目的 updated_at。
+    已有条目的 fetched_at 保持为首次索引的时间。失败时返回 False (issues.txt 仍可用)。
+    """
+    tracker = tracker_key(issues_file)
+    now = (synced_at or datetime.now(timezone.utc)).isoformat()
+    try:
+        conn = connect(db_file)
+        try:
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                if changed is None:
+                    entries = read_issues_file(issues_file)
+                    # 与 read_config_file() 一致: 重复的 key 以最后一行为准
+                    conflict = 'DO UPDATE SET key = excluded.key, url = excluded.url, updated_at = excluded.updated_at'
+                else:
+                    entries = changed
+                    # 与 issues.txt 的合并规则一致: 已有条目保留原 url
+                    conflict = 'DO UPDATE SET updated_at = excluded.updated_at'
+                conn.executemany(
+                    'INSERT INTO issues (tracker, key, key_lower, url, fetched_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+                    f'ON CONFLICT (tracker, key_lower) {conflict}',
+                    ((tracker, key, key.lower(), url, now, now) for key, url in entries)
+                )
+                if changed is None:
+                    # 不再出现在完整列表中的条目
+                    conn.execute('DELETE FROM issues WHERE tracker = ? AND updated_at <> ?', (tracker, now))
+                _record_file(conn, tracker, issues_file, now)
+        finally:
+            conn.close()
+    except (sqlite3.Error, IOError, OSError) as e:
+        print(f"Warning: Could not update issue index for {tracker}: {e}", file=sys.stderr)
+        return False
+    return True
+
+def ensure_indexed(issues_file, db_file=None):
+    """
+    索引中该 tracker 的记录与 issues_file 不一致 (没有记录、文件已变化) 时从 issues_file 重新导入。
+    多个进程同时发现时只导入一次。成功返回 True。
+    """
+    tracker = tracker_key(issues_file)
+
+    def is_current():
+        conn = connect(db_file)
+        try:
+            row = conn.execute('SELECT mtime_ns, size FROM trackers WHERE tracker = ?', (tracker,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None and tuple(row) == _file_stat(issues_file)
+
+    try:
+        if is_current():
+            return True
+        with utils.file_lock(f"{db_file or config.ISSUE_INDEX_FILE}.lock"):
+            if is_current():
+                return True
+            print(f"Indexing {issues_file} into the shared issue index...", file=sys.stderr)
+            return index_issues(issues_file, db_file=db_file)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: Could not index {issues_file}: {e}", file=sys.stderr)
+        return False
+
+class IssueIndex:
+    """
+    某个 tracker 的只读视图，接口与 {小写 key: url} 字典相同 (`key in index`、index.get(key, default))，
+    供 vcs_log_xref.match_commit() 使用。查询结果在进程内缓存；fork 出的子进程会重新连接数据库。
+    """
+    def __init__(self, tracker, db_file=None):
+        self.tracker = tracker
+        self.db_file = db_file or config.ISSUE_INDEX_FILE
+        self._cache = {}
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def _lookup(self, key_lower):
+        if key_lower in self._cache:
+            return self._cache[key_lower]
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_file, timeout=60)
+            self._pid = os.getpid()
+        row = self._conn.execute(
+            'SELECT url FROM issues WHERE tracker = ? AND key_lower = ?', (self.tracker, key_lower)
+        ).fetchone()
+        url = row[0] if row else None
+        self._cache[key_lower] = url
+        return url
+
+    def __contains__(self, key):
+        return self._lookup(key.lower()) is not None
+
+    def get(self, key, default=None):
+        url = self._lookup(key.lower())
+        return default if url is None else url
+
+    def __len__(self):
+        conn = sqlite3.connect(self.db_file, timeout=60)
+        try:
+            return conn.execute('SELECT COUNT(*) FROM issues WHERE tracker = ?', (self.tracker,)).fetchone()[0]
+        finally:
+            conn.close()
+
+def open_issues(issues_file, db_file=None):
+    """
+    返回 issues_file 对应 tracker 的 IssueIndex；issues_file 不存在或为空时返回 None。
+    索引不可用时退回到读入内存的 {小写 key: url} 字典。
+    """
+    if not os.path.exists(issues_file) or os.path.getsize(issues_file) == 0:
+        return None
+    if not ensure_indexed(issues_file, db_file):
+        return {key.lower(): url for key, url in read_issues_file(issues_file)} or None
+    index = IssueIndex(tracker_key(issues_file), db_file)
+    return index if len(index) else None
+
+def export_issues(tracker, output_file, db_file=None):
+    """
+    把索引中 tracker 的条目按 key 排序导出为 issues.txt 格式 (id,url)。返回条目数。
+    """
+    conn = connect(db_file)
+    try:
+        rows = conn.execute('SELECT key, url FROM issues WHERE tracker = ? ORDER BY key', (tracker,)).fetchall()
+    finally:
+        conn.close()
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for key, url in rows:
+            f.write(f"{key},{url}\n")
+    os.replace(tmp_file, output_file)
+    return len(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the shared SQLite issue index (cache/shared_issues/issues.sqlite3).")
+    parser.add_argument('-f', dest='issues_files', nargs='+', help="issues.txt files to (re)index")
+    parser.add_argument('-x', dest='tracker',
+                        help="Tracker to export: a shared_issues directory name (e.g., jira_CAY), its path, or its issues.txt")
+    parser.add_argument('-o', dest='output_file', help="Output file for -x (issues.txt format)")
+
+    args = parser.parse_args()
+
+    if not args.issues_files and not args.tracker:
+        parser.error("one of -f or -x is required")
+    for issues_file in args.issues_files or []:
+        if not index_issues(issues_file):
+            sys.exit(1)
+        print(f"Indexed {issues_file} as {tracker_key(issues_file)}")
+    if args.tracker:
+        if not args.output_file:
+            parser.error("-x requires -o")
+        print(f"Exported {export_issues(resolve_tracker(args.tracker), args.output_file)} issues to {args.output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# framework/materialize_reports.py
+#
+# 从 download_issues.py 已缓存的 tracker 页面中拆分出每个缺陷的报告 reports/<bug.id>.xml|.json，
+# 只有页面中不包含的 issue 才需要再通过网络下载。
+# - JIRA searchrequest-xml 页面: 每个 <item> 与 issue-xml 单页视图的 <item> 相同
+# - Bugzilla ctype=xml 多 id 块: 每个 <bug> 与 show_bug.cgi?ctype=xml 单页相同
+# - GitHub issue 列表 JSON: 每个元素即 /repos/<org>/<repo>/issues/<n> 返回的 issue 对象
+
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+from urllib.parse import urlparse, parse_qs
+import config
+
+JIRA_ITEM_RE = re.compile(r'<item>.*?</item>', re.S)
+JIRA_KEY_RE = re.compile(r'<key[^>]*>(.*?)</key>')
+# 页面中的分页信息 <issue start="0" end="200" total="2361"/>，单个 issue 视图中没有
+JIRA_PAGER_RE = re.compile(r'^[ \t]*<issue\s[^>]*/>[ \t]*\n?', re.M)
+
+BUGZILLA_BUG_RE = re.compile(r'<bug(\s[^>]*)?>.*?</bug>', re.S)
+BUGZILLA_ID_RE = re.compile(r'<bug_id>(.*?)</bug_id>')
+
+def report_file_name(bug_id, report_url):
+    """
+    返回报告文件名: JIRA 与 Bugzilla 为 XML 视图，其余 tracker 为 JSON。
+    """
+    ext = '.json'
+    if 'issues.apache.org/jira' in report_url or 'bz.apache.org/bugzilla' in report_url:
+        ext = '.xml'
+    return f"{bug_id}{ext}"
+
+def report_key(tracker_name, report_url):
+    """
+    返回 issues.txt 中 report_url 在 tracker 页面里对应的标识 (JIRA key、Bugzilla id 或 GitHub html_url)。
+    无法识别时返回 None。
+    """
+    if tracker_name == 'jira':
+        return report_url.rstrip('/').rsplit('/', 1)[-1] or None
+    if tracker_name == 'bugzilla':
+        ids = parse_qs(urlparse(report_url).query).get('id')
+        return ids[0] if ids else None
+    if tracker_name == 'github':
+        return report_url
+    return None
+
+def read_report_jobs(csv_file, reports_dir, include_existing=False, done=None):
+    """
+    读取 active-bugs.csv，返回尚未下载报告的任务列表 [(bug_id, report_url, report_file), ...]。
+    include_existing 为 True 时也包含已下载的报告。done 为已完成的 bug_id 集合 (pipeline_state) 时，
+    只有其中报告文件存在的 bug 算作已下载。CSV 无效时返回 None。
+    """
+    jobs = []
+    try:
+        with open(csv_file, 'r', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            try:
+                header = next(reader)
+                idx_bug_id = header.index(config.BUGS_CSV_BUGID)
+                idx_report_url = header.index(config.BUGS_CSV_ISSUE_URL)
+            except (StopIteration, ValueError) as e:
+                print(f"Error: Invalid or empty CSV file: {csv_file}. {e}", file=sys.stderr)
+                return None
+
+            for row in reader:
+                try:
+                    bug_id = row[idx_bug_id]
+                    report_url = row[idx_report_url]
+                except IndexError:
+                    continue
+
+                if not report_url or report_url == "NA":
+                    if not include_existing:
+                        print(f"  -> Skipping report for bug {bug_id} (missing URL).")
+                    continue
+
+                report_file = os.path.join(reports_dir, report_file_name(bug_id, report_url))
+                if os.path.exists(report_file) and (done is None or bug_id in done) and not include_existing:
+                    continue
+
+                jobs.append((bug_id, report_url, report_file))
+    except IOError as e:
+        print(f"Error reading {csv_file}: {e}", file=sys.stderr)
+        return None
+
+    return jobs
+
+def list_cached_pages(cache_issues_dir, tracker_name):
+    """
+    返回 tracker 的缓存页面文件列表。增量同步的页面 (delta/) 更新，排在前面。
+    """
+    if tracker_name == 'bugzilla':
+        pattern = '*-issues-xml-*.txt'
+    elif tracker_name in ('jira', 'github'):
+        pattern = '*-issues-*.json'
+    else:
+        return []
+    pages = []
+    for page_dir in (os.path.join(cache_issues_dir, 'delta'), cache_issues_dir):
+        pages.extend(sorted(glob.glob(os.path.join(page_dir, pattern))))
+    return pages
+
+def split_jira_page(text):
+    """
+    将 searchrequest-xml 页面拆分为 [(issue_key, 单个 issue 的 XML), ...]。
+    """
+    first_item = text.find('<item>')
+    if first_item < 0:
+        return []
+    head = JIRA_PAGER_RE.sub('', text[:first_item])
+    reports = []
+    for match in JIRA_ITEM_RE.finditer(text, first_item):
+        item = match.group(0)
+        key = JIRA_KEY_RE.search(item)
+        if key:
+            reports.append((key.group(1).strip(), f"{head}{item}\n</channel>\n</rss>\n"))
+    return reports
+
+def split_bugzilla_chunk(text):
+    """
+    将 ctype=xml 多 id 块拆分为 [(bug_id, 单个 bug 的 XML), ...]。
+    不存在或无权限的 id 以 <bug error="..."> 出现，跳过。
+    """
+    match = BUGZILLA_BUG_RE.search(text)
+    if not match:
+        return []
+    head = text[:match.start()]
+    reports = []
+    for match in BUGZILLA_BUG_RE.finditer(text, match.start()):
+        if match.group(1) and 'error=' in match.group(1):
+            continue
+        bug = match.group(0)
+        bug_id = BUGZILLA_ID_RE.search(bug)
+        if bug_id:
+            reports.append((bug_id.group(1).strip(), f"{head}{bug}\n\n</bugzilla>\n"))
+    return reports
+
+def split_github_page(text):
+    """
+    将 issue 列表 JSON 拆分为 [(html_url, 单个 issue 的 JSON), ...]，跳过 pull request。
+    """
+    return [
+        (issue['html_url'], json.dumps(issue, ensure_ascii=False))
+        for issue in json.loads(text)
+        if 'pull_request' not in issue
+    ]
+
+SPLITTERS = {
+    'jira': split_jira_page,
+    'bugzilla': split_bugzilla_chunk,
+    'github': split_github_page
+}
+
+def write_report(report_file, content):
+    """
+    原子地写入报告文件 (先写临时文件再重命名)。
+    """
+    tmp_file = f"{report_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_file, report_file)
+
+def materialize_reports(cache_issues_dir, tracker_name, jobs, on_done=None):
+    """
+    用 cache_issues_dir 中已缓存的 tracker 页面生成 jobs [(bug_id, report_url, report_file), ...] 中的报告。
+    逐页读取，每页只在内存中停留一次。每写入一个报告调用 on_done(bug_id)。返回页面未覆盖、仍需下载的任务列表。
+    """
+    splitter = SPLITTERS.get(tracker_name)
+    if not splitter or not jobs:
+        return jobs
+
+    # 同一个 issue 可能对应多个 bug.id
+    wanted = {}
+    remaining = []
+    for job in jobs:
+        key = report_key(tracker_name, job[1])
+        if key is None:
+            remaining.append(job)
+        else:
+            wanted.setdefault(key, []).append(job)
+
+    materialized = 0
+    for page_file in list_cached_pages(cache_issues_dir, tracker_name):
+        if not wanted:
+            break
+        try:
+            with open(page_file, 'r', encoding='utf-8', errors='ignore') as f:
+                reports = splitter(f.read())
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            print(f"  -> Warning: Could not split cached page {page_file}: {e}", file=sys.stderr)
+            continue
+
+        for key, content in reports:
+            for bug_id, report_url, report_file in wanted.pop(key, []):
+                try:
+                    write_report(report_file, content)
+                    materialized += 1
+                    if on_done:
+                        on_done(bug_id)
+                except IOError as e:
+                    print(f"  -> Error writing report for bug {bug_id}: {e}", file=sys.stderr)
+                    remaining.append((bug_id, report_url, report_file))
+
+    for key_jobs in wanted.values():
+        remaining.extend(key_jobs)
+
+    print(f"  -> Materialized {materialized} reports from cached {tracker_name} pages, {len(remaining)} left to download")
+    return remaining
+
+def main():
+    parser = argparse.ArgumentParser(description="Split cached issue-tracker pages into per-bug reports for active-bugs.csv.")
+    parser.add_argument('-i', dest='cache_issues_dir', required=True, help="Shared issues cache directory (e.g., cache/shared_issues/jira_LANG)")
+    parser.add_argument('-g', dest='tracker_name', required=True, help="Tracker name (jira, github, bugzilla)")
+    parser.add_argument('-b', dest='csv_file', required=True, help="Path to active-bugs.csv")
+    parser.add_argument('-o', dest='reports_dir', required=True, help="Output directory for <bug.id>.xml|.json reports")
+
+    args = parser.parse_args()
+
+    os.makedirs(args.reports_dir, exist_ok=True)
+    jobs = read_report_jobs(args.csv_file, args.reports_dir)
+    if jobs is None:
+        sys.exit(1)
+
+    remaining = materialize_reports(args.cache_issues_dir, args.tracker_name, jobs)
+    for bug_id, report_url, _ in remaining:
+        print(f"  -> Report for bug {bug_id} not in cached pages: {report_url}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# framework/pipeline_state.py
+#
+# 每个项目的挖掘进度记录 (cache/<project_id>/state.json + state.journal)，用于中断后准确地续跑。
+# - state.json: 各阶段 (repo, issues, xref, reports, patches) 的状态，始终通过 "临时文件 + 重命名" 原子地整体替换，
+#   读写由 utils.file_lock 保护 (共享仓库的 xref 会由其他项目的进程代为更新)。
+#   阶段开始时记录为 running 并保存回滚所需的检查点 (例如 active-bugs.csv 的原长度)；
+#   下次运行发现仍为 running 的阶段，说明上次在该阶段中断，先回滚其部分输出再重做。
+# - state.journal: 每个 bug 的完成记录 ("<stage>\t<bug_id>")，每完成一个 patch / 报告追加一行；
+#   没有换行结尾的最后一行 (写到一半时中断) 被忽略。compact() 将其合并进 state.json。
+# 只有记录为已完成且文件存在的 patch / 报告会被跳过。
+
+import json
+import os
+import sys
+import threading
+import time
+import config
+import utils
+
+STATE_FILE = 'state.json'
+JOURNAL_FILE = 'state.journal'
+
+# 每个 bug 单独记录完成情况的阶段
+BUG_STAGES = ('patches', 'reports')
+
+def write_atomic(path, text):
+    """
+    先写入临时文件再重命名为 path，读者不会看到写了一半的文件。
+    """
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+class ProjectState:
+    """
+    一个项目的进度记录。所有方法都可以在多个线程中同时调用。
+    """
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.project_id = os.path.basename(state_dir)
+        self.state_file = os.path.join(state_dir, STATE_FILE)
+        self.journal_file = os.path.join(state_dir, JOURNAL_FILE)
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.state_file)
+
+    def _read(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            state = {}
+        state.setdefault('stages', {})
+        state.setdefault('bugs', {})
+        return state
+
+    def _read_journal(self):
+        """
+        返回 journal 中的 [(stage, bug_id), ...]。
+        """
+        entries = []
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.endswith('\n') and line.count('\t') == 1:
+                        entries.append(tuple(line[:-1].split('\t')))
+        except IOError:
+            pass
+        return entries
+
+    def _update(self, change):
+        """
+        在文件锁内读取 state.json，调用 change(state) 修改后原子地写回。
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._lock, utils.file_lock(f"{self.state_file}.lock"):
+            state = self._read()
+            change(state)
+            write_atomic(self.state_file, json.dumps(state, indent=1, sort_keys=True))
+
+    def stage(self, name):
+        """
+        返回阶段 name 的记录 ({'status': 'running' | 'done' | 'failed', ...})；没有记录时返回 {}。
+        """
+        return self._read()['stages'].get(name, {})
+
+    def is_done(self, name):
+        return self.stage(name).get('status') == 'done'
+
+    def begin(self, name, **checkpoint):
+        """
+        记录阶段 name 开始，checkpoint 为中断后回滚所需的信息。
+        """
+        def change(state):
+            state['stages'][name] = dict(checkpoint, status='running', started_at=time.time())
+        self._update(change)
+
+    def finish(self, name, success=True, **info):
+        """
+        记录阶段 name 完成 (success 为 False 时记录为 failed)。
+        """
+        def change(state):
+            state['stages'][name] = dict(info, status='done' if success else 'failed', finished_at=time.time())
+        self._update(change)
+
+    def mark_done(self, stage, bug_id):
+        """
+        记录 bug_id 在 stage (patches / reports) 中已完成。只追加一行 journal，可以在每个 bug 完成后立即调用。
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._lock:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(f"{stage}\t{bug_id}\n")
+
+    def done_bugs(self, stage):
+        """
+        返回 stage 中已完成的 bug_id 集合。
+        """
+        with self._lock:
+            done = set(self._read()['bugs'].get(stage, []))
+            done.update(bug_id for entry_stage, bug_id in self._read_journal() if entry_stage == stage)
+        return done
+
+    def reset_bugs(self, stages=BUG_STAGES):
+        """
+        清除 stages 中所有 bug 的完成记录 (例如 active-bugs.csv 重新生成、bug.id 重新编号后)。
+        """
+        def change(state):
+            for stage in stages:
+                state['bugs'].pop(stage, None)
+            remaining = [entry for entry in self._read_journal() if entry[0] not in stages]
+            write_atomic(self.journal_file, ''.join(f"{stage}\t{bug_id}\n" for stage, bug_id in remaining))
+        self._update(change)
+
+    def compact(self):
+        """
+        将 journal 合并进 state.json 并清空 journal。
+        """
+        def change(state):
+            for stage, bug_id in self._read_journal():
+                bugs = state['bugs'].setdefault(stage, [])
+                if bug_id not in bugs:
+                    bugs.append(bug_id)
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+        if os.path.exists(self.journal_file):
+            self._update(change)
+
+    def adopted(self):
+        return 'adopted_at' in self._read()
+
+    def adopt(self, bug_files):
+        """
+        把旧版本 (没有进度记录时) 生成的输出登记为已完成，每个项目只登记一次。
+        bug_files 为 {stage: {bug_id: file, ...}}，只登记已存在的文件。
+        """
+        def change(state):
+            if 'adopted_at' in state:
+                return
+            for stage, files in bug_files.items():
+                bugs = set(state['bugs'].get(stage, []))
+                bugs.update(bug_id for bug_id, path in files.items() if os.path.exists(path))
+                state['bugs'][stage] = sorted(bugs)
+            state['adopted_at'] = time.time()
+        self._update(change)
+
+_states = {}
+_states_lock = threading.Lock()
+
+def for_project(project_id):
+    """
+    返回本进程中 project_id 共享的 ProjectState。
+    """
+    with _states_lock:
+        if project_id not in _states:
+            _states[project_id] = ProjectState(os.path.join(config.CACHE_DIR, project_id))
+        return _states[project_id]
+
+def _read_text(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except IOError:
+        return None
+
+def checkpoint_xref(state, csv_file, log_file=None):
+    """
+    在 xref 修改 csv_file (以及追加 git log 缓存 log_file) 之前调用:
+    回滚上次中断的 xref，然后记录 csv_file 与 log_file 的当前长度和 <log_file>.head 的内容 (不存在时为 None)。
+    """
+    rollback_xref(state, csv_file)
+    size = os.path.getsize(csv_file) if os.path.exists(csv_file) else None
+    checkpoint = {'csv_size': size}
+    if log_file:
+        checkpoint.update(
+            log_file=log_file,
+            log_size=os.path.getsize(log_file) if os.path.exists(log_file) else None,
+            log_head=_read_text(f"{log_file}.head")
+        )
+    state.begin('xref', **checkpoint)
+    if size is None:
+        # 新的 active-bugs.csv 会从 1 开始重新编号，旧的 patch / 报告记录不再对应
+        state.reset_bugs()
+
+def _truncate_or_remove(path, size):
+    """
+    把 path 恢复到长度 size；size 为 None 时 (原本不存在) 删除。有改动时返回 True。
+    """
+    if size is None:
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+    elif os.path.exists(path) and os.path.getsize(path) > size:
+        os.truncate(path, size)
+        return True
+    return False
+
+def rollback_xref(state, csv_file):
+    """
+    xref 仍记录为 running (本次失败，或上次运行在 xref 中中断) 时，把 csv_file 恢复到 xref 开始前的状态
+    (删除新建的文件，或截断追加的行)，git log 缓存及其 .head 记录也恢复到检查点，之后重做时会重新收集。
+    """
+    stage = state.stage('xref')
+    if stage.get('status') != 'running':
+        return
+    try:
+        if _truncate_or_remove(csv_file, stage.get('csv_size')):
+            print(f"  -> Rolled back incomplete {csv_file}", file=sys.stderr)
+        log_file = stage.get('log_file')
+        if log_file:
+            _truncate_or_remove(log_file, stage.get('log_size'))
+            if stage.get('log_head') is None:
+                if os.path.exists(f"{log_file}.head"):
+                    os.remove(f"{log_file}.head")
+            else:
+                write_atomic(f"{log_file}.head", stage['log_head'])
+    except OSError as e:
+        print(f"  -> Warning: Could not roll back {csv_file}: {e}", file=sys.stderr)
+    state.finish('xref', success=False)
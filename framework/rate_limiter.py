@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# framework/rate_limiter.py
+#
+# 跨进程的每主机请求速率限制 (token bucket)。
+# fast_bug_miner_par.py 的所有工作进程，以及它们启动的 download_issues.py 子进程，
+# 共享 cache/ratelimit/<host>.state 中的桶状态 (由 utils.file_lock 保护)，
+# 因此无论运行多少个进程，每个 tracker 主机的总请求速率都不超过配置值。
+#
+# 桶状态只保存一个时间戳 tat (下一个令牌可用的理论时间，GCRA 形式的 token bucket):
+# 每次请求在锁内预约一个令牌并推进 tat，然后在锁外睡眠到预约时间，锁只持有几微秒。
+
+import os
+import re
+import time
+import config
+import utils
+
+def _state_file(host):
+    return os.path.join(config.RATE_LIMIT_DIR, f"{re.sub(r'[^A-Za-z0-9.-]', '_', host)}.state")
+
+def get_rate(host):
+    """
+    返回 host 的速率限制 (rate 请求/秒, burst)；rate 为 0 表示不限制。
+    """
+    rate = config.HOST_RATE_LIMITS.get(host, config.HOST_RATE_LIMIT)
+    return rate, max(1, int(config.HOST_RATE_BURST or rate))
+
+def reserve(host):
+    """
+    为 host 预约一个令牌，返回需要等待的秒数 (0 表示立即可用)。
+    """
+    rate, burst = get_rate(host)
+    if rate <= 0:
+        return 0.0
+    interval = 1.0 / rate
+    state_file = _state_file(host)
+
+    with utils.file_lock(f"{state_file}.lock"):
+        now = time.time()
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                tat = float(f.read().strip() or 0)
+        except (IOError, ValueError):
+            tat = 0.0
+        # 空闲期间最多积累 burst 个令牌
+        tat = max(tat, now) + interval
+        with open(state_file, 'w', encoding='utf-8') as f:
+            f.write(f"{tat:.6f}\n")
+
+    return max(0.0, tat - now - burst * interval)
+
+def wait(host):
+    """
+    阻塞直到 host 有可用令牌。所有经过 http_client.request() 的请求都会调用。
+    """
+    delay = reserve(host)
+    if delay > 0:
+        time.sleep(delay)
+    return delay
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# framework/repo_cache.py
+#
+# 按规范化后的 repository_url 共享 bare clone。
+# 例如 Cayenne_jgroups / Cayenne_jms / Cayenne_xmpp 都使用 https://github.com/apache/cayenne.git，
+# 它们共用 cache/repos/github.com_apache_cayenne.git，且并发的工作进程只会执行一次 clone。
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+from urllib.parse import urlparse
+import utils
+import config
+
+# 仓库路径不区分大小写的主机；其他主机 (自建 GitLab / Gitea 等) 上仅大小写不同的路径是不同的仓库
+CASE_INSENSITIVE_HOSTS = ('github.com',)
+
+def normalize_repo_url(repository_url):
+    """
+    将仓库 URL 规范化为 "host/path" 形式，使同一仓库的不同写法得到相同的 key:
+    https://github.com/Apache/cayenne.git, git@github.com:apache/cayenne, http://github.com/apache/cayenne/
+    都会变成 'github.com/apache/cayenne'。主机名总是转为小写，路径只在 CASE_INSENSITIVE_HOSTS 上转为小写。
+    """
+    url = repository_url.strip()
+
+    # scp 风格: git@github.com:org/repo.git
+    scp_match = re.match(r'^[\w.-]+@([\w.-]+):(?!//)(.*)$', url)
+    if scp_match:
+        host, path = scp_match.group(1), scp_match.group(2)
+    else:
+        parsed = urlparse(url)
+        if parsed.scheme in ('', 'file'):
+            # 本地仓库: 使用绝对路径作为 key
+            return os.path.abspath(parsed.path or url).rstrip('/')
+        host, path = parsed.hostname or '', parsed.path
+
+    host = host.lower()
+    path = path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+    if host in CASE_INSENSITIVE_HOSTS:
+        path = path.lower()
+    return f"{host}/{path}".rstrip('/')
+
+def get_repo_cache_dir(repository_url):
+    """
+    返回该仓库共享 bare clone 的路径 (cache/repos/<key>.git)。
+    """
+    key = re.sub(r'[^\w.-]+', '_', normalize_repo_url(repository_url)).strip('_')
+    return os.path.join(config.REPOS_CACHE_DIR, f"{key}.git")
+
+def ensure_repo(repository_url, desc_prefix=''):
+    """
+    确保 repository_url 的共享 bare clone 存在，返回其路径；失败时返回 None。
+    通过文件锁保证同一仓库同一时间只有一个 clone 在进行，其余进程等待并复用结果。
+    clone 先写入临时目录再重命名，中断的 clone 不会被误认为已完成。
+    """
+    repo_dir = get_repo_cache_dir(repository_url)
+    if os.path.isdir(repo_dir):
+        print(f"{desc_prefix}Repository {os.path.basename(repo_dir)} already cached.")
+        return repo_dir
+
+    with utils.file_lock(f"{repo_dir}.lock"):
+        # 等待锁期间其他进程可能已完成 clone
+        if os.path.isdir(repo_dir):
+            print(f"{desc_prefix}Repository {os.path.basename(repo_dir)} cloned by another worker.")
+            return repo_dir
+
+        tmp_dir = f"{repo_dir}.tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        cmd_list = [
+            'git',
+            'clone',
+            '--bare',
+            repository_url,
+            tmp_dir
+        ]
+        if config.CLONE_FILTER:
+            # partial clone: 只下载 commit (及 tree)，blob 由 fetch_objects() 按需批量获取
+            cmd_list.insert(3, f'--filter={config.CLONE_FILTER}')
+        success, _ = utils.exec_cmd(cmd_list, f"{desc_prefix}Cloning {repository_url}")
+        if not success:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+
+        os.replace(tmp_dir, repo_dir)
+
+    return repo_dir
+
+def get_head_commit(repo_dir):
+    """
+    返回仓库 HEAD 指向的 commit hash；失败时返回 None。
+    """
+    try:
+        result = subprocess.run(
+            ['git', f'--git-dir={repo_dir}', 'rev-parse', '--verify', 'HEAD^{commit}'],
+            shell=False,
+            capture_output=True,
+            text=True,
+            check=True,
+            encoding='utf-8',
+            errors='ignore'
+        )
+        return result.stdout.strip()
+    except subprocess.CalledProcessError as e:
+        print(f"Error: Could not resolve HEAD of {repo_dir}: {e.stderr.strip()}", file=sys.stderr)
+        return None
+
+def update_repo(repo_dir, desc_prefix=''):
+    """
+    对已缓存的 bare 仓库执行 `git fetch`，使其分支与标签与远端一致，而无需重新 clone。
+    共享同一仓库的所有工作进程在一次运行中只 fetch 一次 (utils.single_flight)。
+    成功返回 True。
+    """
+    def fetch():
+        # `git clone --bare` 不配置 fetch refspec，需要显式指定才会更新本地分支
+        cmd_list = [
+            'git',
+            f'--git-dir={repo_dir}',
+            'fetch',
+            '--prune',
+            '--update-head-ok',
+            'origin',
+            '+refs/heads/*:refs/heads/*',
+            '+refs/tags/*:refs/tags/*'
+        ]
+        success, _ = utils.exec_cmd(cmd_list, f"{desc_prefix}Fetching {os.path.basename(repo_dir)}")
+        return success
+
+    return utils.single_flight(f"{repo_dir}.lock", f"{repo_dir}.fetched", fetch, utils.get_run_id())
+
+def is_partial_clone(repo_dir):
+    """
+    判断仓库是否为 partial clone (存在 promisor remote，部分对象需要按需获取)。
+    """
+    result = subprocess.run(
+        ['git', f'--git-dir={repo_dir}', 'config', '--get', 'remote.origin.promisor'],
+        shell=False,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='ignore'
+    )
+    return result.stdout.strip() == 'true'
+
+def fetch_objects(repo_dir, oids, desc_prefix='', batch_size=5000):
+    """
+    从 promisor remote 批量获取指定对象 (partial clone 中缺失的 blob)。
+    与 git 自身的按需获取使用相同的命令，但每批请求多个对象，而不是每个对象一次 fetch。
+    全部成功返回 True。
+    """
+    oids = sorted(oids)
+    success = True
+    for i in range(0, len(oids), batch_size):
+        batch = oids[i:i + batch_size]
+        cmd_list = [
+            'git',
+            f'--git-dir={repo_dir}',
+            '-c', 'fetch.negotiationAlgorithm=noop',
+            'fetch',
+            'origin',
+            '--no-tags',
+            '--no-write-fetch-head',
+            '--recurse-submodules=no',
+            '--filter=blob:none',
+            '--stdin'
+        ]
+        desc = f"{desc_prefix}Fetching {len(batch)} objects for {os.path.basename(repo_dir)}"
+        if not utils.exec_cmd(cmd_list, desc, input_text='\n'.join(batch) + '\n')[0]:
+            success = False
+    return success
+
+def group_projects_by_repo(projects):
+    """
+    按规范化 repository_url 对项目字典分组，返回 {url_key: [project, ...]}，保持输入顺序。
+    """
+    groups = {}
+    for project in projects:
+        groups.setdefault(normalize_repo_url(project['repository_url']), []).append(project)
+    return groups
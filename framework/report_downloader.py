@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# framework/report_downloader.py
+#
+# 基于 asyncio 的报告下载引擎: 对 (bug_id, report_url, report_file) 任务并发下载，
+# 每个 tracker 主机最多 config.REPORT_HOST_CONCURRENCY 个请求同时进行。
+# HTTP 请求仍由 utils.get_http_session() 的 requests 会话在线程中完成 (连接池复用 keep-alive 连接)，
+# URL 映射与 utils.download_report_data() 相同，已存在的报告会被跳过；
+# refresh 模式下，有 ETag / Last-Modified 记录的报告改为用条件请求重新验证 (http_client)。
+# download_project_reports() 把下载失败的报告 (包括主机熔断期间跳过的) 记入 retry_queue，
+# 由 retry_reports() 在运行结束时 (或下次运行时) 按退避时间重试。
+
+import argparse
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import circuit_breaker
+import config
+import http_client
+import utils
+import materialize_reports
+import pipeline_state
+import retry_queue
+
+def revalidation_jobs(csv_file, reports_dir):
+    """
+    返回 active-bugs.csv 中已下载、且有 ETag / Last-Modified 记录的报告任务，供 refresh 模式重新验证。
+    从缓存页面拆分出的报告没有记录，不会被重新请求。
+    """
+    jobs = materialize_reports.read_report_jobs(csv_file, reports_dir, include_existing=True) or []
+    return [
+        job for job in jobs
+        if http_client.has_validators(utils.remap_report_uri(job[1])[0], job[2])
+    ]
+
+async def _download_report(session, job, semaphore, refresh=False):
+    """
+    下载单个报告，返回 (job, api_uri, status)；status 为 'OK'、'not modified' 或异常对象。
+    任何异常都只记为该报告失败，不会中断其他报告的下载。
+    """
+    bug_id, report_url, report_file = job
+    api_uri = report_url
+    async with semaphore:
+        try:
+            api_uri, headers, _ = utils.remap_report_uri(report_url)
+            if os.path.exists(report_file) and not (refresh and http_client.has_validators(api_uri, report_file)):
+                return job, api_uri, 'OK'
+            _, hit = await asyncio.to_thread(http_client.fetch, session, api_uri, report_file, headers, 20)
+        except Exception as e:
+            return job, api_uri, e
+    return job, api_uri, 'not modified' if hit else 'OK'
+
+async def download_reports_async(jobs, per_host=None, refresh=False, on_done=None, on_failed=None):
+    """
+    并发下载 jobs 中的报告，按完成顺序输出结果，每个成功的报告调用 on_done(bug_id)，
+    每个失败的报告调用 on_failed(job, error)。返回下载失败的任务列表。
+    """
+    per_host = max(1, per_host or config.REPORT_HOST_CONCURRENCY)
+    session = utils.get_http_session()
+
+    semaphores = {} # host -> asyncio.Semaphore
+    tasks = []
+    for job in jobs:
+        host = urlparse(utils.remap_report_uri(job[1])[0]).netloc
+        semaphore = semaphores.setdefault(host, asyncio.Semaphore(per_host))
+        tasks.append(asyncio.ensure_future(_download_report(session, job, semaphore, refresh)))
+
+    # 每个主机最多 per_host 个线程在等待网络
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=per_host * max(1, len(semaphores))))
+
+    failed = []
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        (bug_id, report_url, report_file), api_uri, status = await task
+        if isinstance(status, str):
+            print(f"  -> [{done}/{len(tasks)}] Report for bug {bug_id}: {status}")
+            if on_done:
+                on_done(bug_id)
+        else:
+            if isinstance(status, circuit_breaker.HostUnavailable):
+                # 主机熔断期间不发请求
+                print(f"  -> [{done}/{len(tasks)}] Report for bug {bug_id}: SKIPPED ({status})", file=sys.stderr)
+            else:
+                # http_client.fetch() 原子写入，失败时不会留下不完整的文件
+                print(f"  -> [{done}/{len(tasks)}] Report for bug {bug_id}: FAIL", file=sys.stderr)
+                print(f"  -> Error downloading {api_uri}: {status}", file=sys.stderr)
+            failed.append((bug_id, report_url, report_file))
+            if on_failed:
+                on_failed((bug_id, report_url, report_file), status)
+    return failed
+
+def download_reports(jobs, per_host=None, refresh=False, on_done=None, on_failed=None):
+    """
+    download_reports_async() 的同步入口。返回下载失败的任务列表。
+    """
+    if not jobs:
+        return []
+    return asyncio.run(download_reports_async(jobs, per_host, refresh, on_done, on_failed))
+
+def download_project_reports(project_id, jobs, per_host=None, on_done=None):
+    """
+    下载项目 project_id 的报告 jobs。失败的报告记入 retry_queue (熔断时至少推迟到熔断结束)，成功的从队列中移除。
+    返回下载失败的任务列表。
+    """
+    succeeded = []
+    failures = []
+
+    def report_done(bug_id):
+        succeeded.append(bug_id)
+        if on_done:
+            on_done(bug_id)
+
+    def report_failed(job, error):
+        data = {'report_url': job[1], 'report_file': job[2]}
+        failures.append((job[0], error, data, getattr(error, 'open_until', 0)))
+
+    failed = download_reports(jobs, per_host, on_done=report_done, on_failed=report_failed)
+    retry_queue.resolve('report', project_id, succeeded)
+    retry_queue.record_failures('report', project_id, failures)
+    return failed
+
+def retry_reports(per_host=None, retry_now=False):
+    """
+    重试 retry_queue 中已到重试时间 (retry_now 为 True 时为全部) 的报告。
+    已存在的报告直接从队列中移除。返回仍未下载的任务列表。
+    """
+    projects = {}
+    for entry in retry_queue.entries('report', due_only=not retry_now):
+        projects.setdefault(entry['project_id'], []).append(
+            (entry['item'], entry['data']['report_url'], entry['data']['report_file'])
+        )
+
+    failed = []
+    for project_id, jobs in sorted(projects.items()):
+        state = pipeline_state.for_project(project_id)
+        existing = [job[0] for job in jobs if os.path.exists(job[2])]
+        for bug_id in existing:
+            state.mark_done('reports', bug_id)
+        retry_queue.resolve('report', project_id, existing)
+        jobs = [job for job in jobs if not os.path.exists(job[2])]
+        if jobs:
+            print(f"Retrying {len(jobs)} queued reports of {project_id}...")
+            failed += download_project_reports(project_id, jobs, per_host,
+                                               on_done=lambda bug_id, state=state: state.mark_done('reports', bug_id))
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Download all missing reports for active-bugs.csv concurrently.")
+    parser.add_argument('-b', dest='csv_file', help="Path to active-bugs.csv")
+    parser.add_argument('-o', dest='reports_dir', help="Output directory for <bug.id>.xml|.json reports")
+    parser.add_argument('-c', dest='per_host', type=int, default=config.REPORT_HOST_CONCURRENCY,
+                        help="Maximum concurrent requests per tracker host")
+    parser.add_argument('-R', dest='refresh', action='store_true',
+                        help="Also revalidate downloaded reports that have ETag/Last-Modified validators")
+    parser.add_argument('--retry', dest='retry', action='store_true',
+                        help="Only retry the failed reports in the retry queue whose backoff has expired")
+    parser.add_argument('--retry-now', dest='retry_now', action='store_true',
+                        help="With --retry, retry every queued report regardless of its backoff")
+
+    args = parser.parse_args()
+
+    if args.retry:
+        failed = retry_reports(args.per_host, args.retry_now)
+        print(retry_queue.summary() or "No pending retries.")
+        if failed:
+            sys.exit(1)
+        return
+    if not args.csv_file or not args.reports_dir:
+        parser.error("-b and -o are required unless --retry is given")
+
+    os.makedirs(args.reports_dir, exist_ok=True)
+    jobs = materialize_reports.read_report_jobs(args.csv_file, args.reports_dir)
+    if jobs is None:
+        sys.exit(1)
+
+    # reports_dir 为 bug-mining/<project_id>/reports
+    project_id = os.path.basename(os.path.dirname(os.path.abspath(args.reports_dir)))
+    failed = download_project_reports(project_id, jobs, args.per_host)
+    if args.refresh:
+        failed += download_reports(revalidation_jobs(args.csv_file, args.reports_dir), args.per_host, refresh=True)
+    print(http_client.summary())
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
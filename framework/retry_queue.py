@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# framework/retry_queue.py
+#
+# 持久化的重试队列 (cache/retry/queue.json)，所有工作进程共享，读写由 utils.file_lock 保护，整体原子替换。
+# 失败以尽可能小的粒度记录，已完成的输出不会因此被丢弃:
+#   report  每个 bug 的报告下载 (data: report_url, report_file)
+#   patch   每个 bug 的 patch 生成 (data: repo_dir, csv_file, patches_dir, sub_project_path)
+#   stage   项目的某个阶段 (repo, issues, xref)，重试时重新运行该项目 (data: 项目行的字段)
+# 第 n 次失败后等待 config.RETRY_BACKOFF * 2^(n-1) 秒 (最多 config.RETRY_BACKOFF_MAX) 才再次重试；
+# 主机熔断时至少等到熔断结束。运行结束时 (或下次运行时) 重试已到期的条目，成功后从队列中移除。
+
+import argparse
+import json
+import os
+import time
+import config
+import pipeline_state
+import utils
+
+QUEUE_FILE = 'queue.json'
+
+def _queue_file():
+    return os.path.join(config.RETRY_DIR, QUEUE_FILE)
+
+def _entry_key(kind, project_id, item):
+    return f"{kind}\t{project_id}\t{item}"
+
+def _read():
+    try:
+        with open(_queue_file(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def _update(change):
+    """
+    在文件锁内读取队列，调用 change(queue, now) 修改后原子地写回，返回 change 的返回值。
+    """
+    os.makedirs(config.RETRY_DIR, exist_ok=True)
+    with utils.file_lock(f"{_queue_file()}.lock"):
+        now = time.time()
+        queue = _read()
+        result = change(queue, now)
+        pipeline_state.write_atomic(_queue_file(), json.dumps(queue, indent=1, sort_keys=True))
+    return result
+
+def backoff(attempts):
+    """
+    第 attempts 次失败后到下次重试的等待秒数。
+    """
+    return min(config.RETRY_BACKOFF * 2 ** max(0, attempts - 1), config.RETRY_BACKOFF_MAX)
+
+def record_failures(kind, project_id, failures):
+    """
+    记录一批失败。failures 为 [(item, error, data), ...] 或 [(item, error, data, not_before), ...]，
+    not_before 为最早的重试时间 (例如主机熔断结束的时间)。已在队列中的条目增加失败次数并推迟下次重试。
+    """
+    if not failures:
+        return
+
+    def change(queue, now):
+        for failure in failures:
+            item, error, data = failure[:3]
+            not_before = failure[3] if len(failure) > 3 else 0
+            key = _entry_key(kind, project_id, item)
+            entry = queue.get(key) or {
+                'kind': kind, 'project_id': project_id, 'item': str(item), 'attempts': 0, 'first_failed_at': now
+            }
+            entry['attempts'] += 1
+            entry['next_attempt_at'] = max(now + backoff(entry['attempts']), not_before or 0)
+            entry['last_error'] = str(error)[:500]
+            entry['data'] = data or {}
+            queue[key] = entry
+    _update(change)
+
+def record_failure(kind, project_id, item, error, data=None, not_before=0):
+    record_failures(kind, project_id, [(item, error, data, not_before)])
+
+def resolve(kind, project_id, items):
+    """
+    从队列中移除已完成的条目。
+    """
+    items = set(str(item) for item in items)
+    queue = _read()
+    if not any(_entry_key(kind, project_id, item) in queue for item in items):
+        return
+
+    def change(queue, now):
+        for item in items:
+            queue.pop(_entry_key(kind, project_id, item), None)
+    _update(change)
+
+def entries(kind=None, project_id=None, due_only=False):
+    """
+    返回队列中的条目 (可按类型、项目过滤)；due_only 为 True 时只返回已到重试时间的条目。
+    """
+    now = time.time()
+    return [
+        entry for entry in _read().values()
+        if (kind is None or entry['kind'] == kind)
+        and (project_id is None or entry['project_id'] == project_id)
+        and (not due_only or entry['next_attempt_at'] <= now)
+    ]
+
+def deferred(kind, project_id):
+    """
+    返回 project_id 中尚未到重试时间的 kind 条目 {item: entry}。
+    """
+    now = time.time()
+    return {entry['item']: entry for entry in entries(kind, project_id) if entry['next_attempt_at'] > now}
+
+def _format_delay(seconds):
+    if seconds <= 0:
+        return "now"
+    if seconds < 120:
+        return f"in {seconds:.0f}s"
+    if seconds < 7200:
+        return f"in {seconds / 60:.0f}m"
+    return f"in {seconds / 3600:.1f}h"
+
+def summary():
+    """
+    返回仍在队列中的失败的摘要 (每个项目一行)；队列为空时返回空字符串。
+    """
+    pending = entries()
+    if not pending:
+        return ""
+    now = time.time()
+    projects = {}
+    for entry in pending:
+        projects.setdefault(entry['project_id'], []).append(entry)
+
+    lines = [f"Pending retries ({len(pending)}):"]
+    for project_id in sorted(projects):
+        parts = []
+        for kind, label in (('stage', 'stage'), ('report', 'reports'), ('patch', 'patches')):
+            kind_entries = [entry for entry in projects[project_id] if entry['kind'] == kind]
+            if not kind_entries:
+                continue
+            next_attempt = min(entry['next_attempt_at'] for entry in kind_entries)
+            attempts = max(entry['attempts'] for entry in kind_entries)
+            if kind == 'stage':
+                what = ", ".join(f"stage {entry['item']}" for entry in kind_entries)
+            else:
+                what = f"{len(kind_entries)} {label}"
+            parts.append(f"{what} (attempt {attempts}, next {_format_delay(next_attempt - now)})")
+        lines.append(f"  {project_id}: " + "; ".join(parts))
+        for entry in projects[project_id]:
+            if entry['kind'] == 'stage':
+                lines.append(f"      {entry['item']}: {entry['last_error']}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or clear the persistent retry queue (cache/retry/queue.json).")
+    parser.add_argument('-p', dest='project_id', help="Only this project")
+    parser.add_argument('--list', dest='list_entries', action='store_true', help="List every queued item")
+    parser.add_argument('--clear', dest='clear', action='store_true', help="Remove the queued items (of -p, or all)")
+
+    args = parser.parse_args()
+
+    if args.clear:
+        def change(queue, now):
+            for key in [key for key, entry in queue.items() if args.project_id in (None, entry['project_id'])]:
+                del queue[key]
+        _update(change)
+        print("Retry queue cleared.")
+        return
+
+    if args.list_entries:
+        for entry in sorted(entries(project_id=args.project_id), key=lambda e: (e['project_id'], e['kind'], e['item'])):
+            print(f"{entry['project_id']}\t{entry['kind']}\t{entry['item']}\tattempts={entry['attempts']}\t"
+                  f"next={_format_delay(entry['next_attempt_at'] - time.time())}\t{entry['last_error']}")
+        return
+
+    print(summary() or "No pending retries.")
+
+if __name__ == "__main__":
+    main()
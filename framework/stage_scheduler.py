@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# framework/stage_scheduler.py
+#
+# 按依赖关系 (DAG) 调度任务。每类资源一个独立的进程池 (例如网络、git/CPU、磁盘)，各自限制并发数，
+# 任务在依赖全部成功后提交到所属的进程池，不同项目的不同阶段因此可以重叠:
+# 一个项目 clone 的同时，另一个项目做 xref，第三个项目下载报告。
+# 依赖失败的任务不会运行 (记录为失败，原因指向失败的依赖)；after 中的任务只约束先后顺序，失败不影响。
+# 任务函数及其参数必须可以 pickle (模块级函数)，返回 (success, reason)。
+
+import sys
+import concurrent.futures
+
+class Task:
+    """
+    DAG 中的一个节点。key 唯一标识任务，pool 为所属进程池的名字，运行 func(*args)。
+    deps 中的任务全部成功后才运行；after 中的任务结束 (无论成败) 后才运行。
+    """
+    def __init__(self, key, pool, func, args=(), deps=(), after=()):
+        self.key = key
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.deps = tuple(deps)
+        self.after = tuple(after)
+
+def run(tasks, pool_sizes, on_finish=None):
+    """
+    运行 tasks 中的所有任务，pool_sizes 为 {pool: 进程数}。每个任务结束 (或因依赖失败而放弃) 时，
+    在调用者的进程中调用 on_finish(task, success, reason)。返回 {key: (success, reason)}。
+    """
+    tasks = {task.key: task for task in tasks}
+    for task in tasks.values():
+        unknown = [key for key in task.deps + task.after if key not in tasks]
+        if unknown:
+            raise ValueError(f"Task {task.key} depends on unknown tasks: {', '.join(unknown)}")
+        if task.pool not in pool_sizes:
+            raise ValueError(f"Task {task.key} uses unknown pool: {task.pool}")
+
+    waiting = {key: set(task.deps + task.after) for key, task in tasks.items()}
+    dependents = {}
+    for key, task in tasks.items():
+        for dep in task.deps + task.after:
+            dependents.setdefault(dep, []).append(key)
+    results = {}
+
+    def finish(key, success, reason):
+        """
+        记录任务结果，并返回可以开始的下游任务；依赖失败的下游任务直接记录为失败。
+        """
+        results[key] = (success, reason)
+        if on_finish:
+            on_finish(tasks[key], success, reason)
+        ready = []
+        for dependent in dependents.get(key, []):
+            if dependent in results:
+                continue
+            if not success and key in tasks[dependent].deps:
+                ready += finish(dependent, False, f"{key} failed")
+                continue
+            waiting[dependent].discard(key)
+            if not waiting[dependent]:
+                ready.append(dependent)
+        return ready
+
+    executors = {pool: concurrent.futures.ProcessPoolExecutor(max_workers=max(1, size))
+                 for pool, size in pool_sizes.items()}
+    running = {} # future -> key
+    try:
+        def submit(keys):
+            for key in keys:
+                if key not in results:
+                    task = tasks[key]
+                    running[executors[task.pool].submit(task.func, *task.args)] = key
+
+        # 按给定顺序提交，先列出的任务在各自的进程池中先运行
+        submit([key for key in tasks if not waiting[key]])
+        while running:
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                try:
+                    success, reason = future.result()
+                except Exception as e:
+                    print(f"Error: Task {key} raised an exception: {e}", file=sys.stderr)
+                    success, reason = False, f"Critical Error: {e}"
+                submit(finish(key, success, reason))
+    finally:
+        for executor in executors.values():
+            executor.shutdown(wait=not running, cancel_futures=True)
+
+    # 循环依赖中的任务永远不会就绪
+    for key in tasks:
+        if key not in results:
+            finish(key, False, "dependency cycle")
+    return results
@@ -0,0 +1,29 @@
+# framework/tests/conftest.py
+#
+# framework/ 下的脚本以模块名互相导入 (import config 等)，测试同样从 framework/ 导入。
+# 共享状态 (重试队列、熔断器、项目进度) 都写到每个测试自己的临时目录中。
+
+import os
+import sys
+import pytest
+
+FRAMEWORK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FRAMEWORK_DIR)
+
+import config
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """
+    把 config 中的缓存目录指向临时目录；子进程运行的脚本通过 D4J_CACHE_DIR 使用同一目录。
+    """
+    monkeypatch.setenv('D4J_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'SHARED_ISSUES_DIR', str(tmp_path / 'shared_issues'))
+    monkeypatch.setattr(config, 'ISSUE_INDEX_FILE', str(tmp_path / 'shared_issues' / 'issues.sqlite3'))
+    monkeypatch.setattr(config, 'REPOS_CACHE_DIR', str(tmp_path / 'repos'))
+    monkeypatch.setattr(config, 'HTTP_CACHE_DIR', str(tmp_path / 'http'))
+    monkeypatch.setattr(config, 'RATE_LIMIT_DIR', str(tmp_path / 'ratelimit'))
+    monkeypatch.setattr(config, 'CIRCUIT_DIR', str(tmp_path / 'circuit'))
+    monkeypatch.setattr(config, 'RETRY_DIR', str(tmp_path / 'retry'))
+    return tmp_path
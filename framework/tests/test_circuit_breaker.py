@@ -0,0 +1,76 @@
+# framework/tests/test_circuit_breaker.py
+
+import pytest
+import circuit_breaker
+import config
+
+HOST = 'api.example.com'
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(cache_dir, monkeypatch):
+    monkeypatch.setattr(config, 'CIRCUIT_THRESHOLD', 3)
+    monkeypatch.setattr(config, 'CIRCUIT_COOLDOWN', 60)
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, 'time', clock)
+    return clock
+
+def test_opens_after_threshold(clock):
+    assert not circuit_breaker.record_failure(HOST)
+    assert not circuit_breaker.record_failure(HOST)
+    circuit_breaker.check(HOST)
+    assert circuit_breaker.record_failure(HOST)
+
+    with pytest.raises(circuit_breaker.HostUnavailable) as e:
+        circuit_breaker.check(HOST)
+    assert e.value.open_until == 1060
+    # 熔断期间的失败不会延长冷却期
+    assert not circuit_breaker.record_failure(HOST)
+    clock.now = 1059
+    with pytest.raises(circuit_breaker.HostUnavailable):
+        circuit_breaker.check(HOST)
+
+def test_half_open_success_closes(clock):
+    for _ in range(3):
+        circuit_breaker.record_failure(HOST)
+    clock.now = 1060
+    circuit_breaker.check(HOST)
+    circuit_breaker.record_success(HOST)
+
+    # 恢复后重新从 0 计数，冷却期也恢复为初始值
+    assert not circuit_breaker.record_failure(HOST)
+    assert not circuit_breaker.record_failure(HOST)
+    assert circuit_breaker.record_failure(HOST)
+    with pytest.raises(circuit_breaker.HostUnavailable) as e:
+        circuit_breaker.check(HOST)
+    assert e.value.open_until == 1060 + 60
+
+def test_half_open_failure_reopens_with_doubled_cooldown(clock):
+    for _ in range(3):
+        circuit_breaker.record_failure(HOST)
+    for n in range(1, 7):
+        clock.now += 10000
+        circuit_breaker.check(HOST)
+        assert circuit_breaker.record_failure(HOST)
+        with pytest.raises(circuit_breaker.HostUnavailable) as e:
+            circuit_breaker.check(HOST)
+        assert e.value.open_until == clock.now + 60 * 2 ** min(n, 4)
+
+def test_retry_after_extends_cooldown(clock):
+    circuit_breaker.record_failure(HOST)
+    circuit_breaker.record_failure(HOST)
+    assert circuit_breaker.record_failure(HOST, retry_after=300)
+    with pytest.raises(circuit_breaker.HostUnavailable) as e:
+        circuit_breaker.check(HOST)
+    assert e.value.open_until == 1300
+
+def test_hosts_are_independent(clock):
+    for _ in range(3):
+        circuit_breaker.record_failure(HOST)
+    circuit_breaker.check('other.example.com')
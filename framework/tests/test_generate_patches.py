@@ -0,0 +1,90 @@
+# framework/tests/test_generate_patches.py
+
+import os
+import subprocess
+import pytest
+import config
+import generate_patches
+import git_backend
+
+MISSING = '1' * 40
+
+def git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='t', GIT_AUTHOR_EMAIL='t@example.com',
+               GIT_COMMITTER_NAME='t', GIT_COMMITTER_EMAIL='t@example.com')
+    return subprocess.run(['git', '-C', str(repo)] + list(args), check=True, env=env,
+                          capture_output=True, text=True).stdout
+
+@pytest.fixture(scope='module')
+def repo(tmp_path_factory):
+    """
+    5 个 commit 的仓库 (其中一个是重命名)，返回 (.git 目录, [commit, ...])。
+    """
+    work = tmp_path_factory.mktemp('patches') / 'work'
+    work.mkdir()
+    git(work, 'init', '-q')
+    (work / 'src').mkdir()
+    for n in range(5):
+        if n == 3:
+            git(work, 'mv', 'src/a.txt', 'src/b.txt')
+        else:
+            (work / 'src' / ('b.txt' if n > 3 else 'a.txt')).write_text(''.join(f"line {i}\n" for i in range(20 + n)))
+            (work / f"top{n}.txt").write_text(f"{n}\n")
+        git(work, 'add', '-A')
+        git(work, 'commit', '-q', '-m', f"change {n}")
+    commits = git(work, 'rev-list', '--reverse', 'HEAD').split()
+    return str(work / '.git'), commits
+
+def write_csv(csv_file, pairs):
+    with open(csv_file, 'w', encoding='utf-8') as f:
+        f.write(','.join(config.ACTIVE_BUGS_HEADER) + '\n')
+        for bug_id, (buggy, fixed) in enumerate(pairs, 1):
+            f.write(f"{bug_id},demo,{buggy},{fixed},X-{bug_id},u,b,f,c\n")
+
+def expected_patch(git_dir, buggy, fixed, path='.'):
+    return git(git_dir, 'diff', buggy, fixed, '--', path)
+
+def test_backend_exists_and_diff(repo):
+    git_dir, commits = repo
+    backend = git_backend.GitBackend(git_dir)
+    try:
+        assert backend.exists(commits[0])
+        assert not backend.exists(MISSING)
+        assert backend.diff(commits[2], commits[3]) == expected_patch(git_dir, commits[2], commits[3])
+        assert backend.diff(commits[3], commits[4], 'src') == expected_patch(git_dir, commits[3], commits[4], 'src')
+        assert backend.diff(MISSING, commits[1]) is None
+        # 常驻进程在多次查询间复用
+        assert backend.diff(commits[0], commits[1]) == expected_patch(git_dir, commits[0], commits[1])
+    finally:
+        backend.close()
+
+def test_missing_commit_does_not_stop_the_pass(repo, tmp_path):
+    git_dir, commits = repo
+    pairs = [(commits[0], commits[1]), (MISSING, commits[2]), (commits[2], commits[3]), (commits[3], commits[4])]
+    write_csv(tmp_path / 'active-bugs.csv', pairs)
+    done = []
+
+    ok = generate_patches.generate_patches(git_dir, str(tmp_path / 'active-bugs.csv'), str(tmp_path / 'patches'),
+                                           on_done=done.append)
+    assert not ok
+    assert sorted(done) == ['1', '3', '4']
+    assert not (tmp_path / 'patches' / '2.src.patch').exists()
+    for bug_id, (buggy, fixed) in enumerate(pairs, 1):
+        if bug_id != 2:
+            assert (tmp_path / 'patches' / f"{bug_id}.src.patch").read_text() == expected_patch(git_dir, buggy, fixed)
+
+def test_patches_after_a_crash_are_diffed_one_by_one(repo, tmp_path, monkeypatch, capsys):
+    git_dir, commits = repo
+    pairs = [(commits[0], commits[1]), (commits[1], commits[2]), (commits[2], commits[3])]
+    write_csv(tmp_path / 'active-bugs.csv', pairs)
+
+    # 在第一个 commit 之后插入一个不存在的父 commit，使单遍 diff-tree 中途退出 (最后输出的 patch 也视为不完整)
+    feed = generate_patches._feed_stdin
+    monkeypatch.setattr(generate_patches, '_feed_stdin',
+                        lambda stdin, pairs: feed(stdin, pairs[:1] + [(MISSING, commits[4])] + pairs[1:]))
+
+    ok = generate_patches.generate_patches(git_dir, str(tmp_path / 'active-bugs.csv'), str(tmp_path / 'patches'))
+    assert ok
+    assert 'Retrying 3 patches one at a time' in capsys.readouterr().out
+    for bug_id, (buggy, fixed) in enumerate(pairs, 1):
+        assert (tmp_path / 'patches' / f"{bug_id}.src.patch").read_text() == expected_patch(git_dir, buggy, fixed)
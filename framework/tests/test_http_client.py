@@ -0,0 +1,137 @@
+# framework/tests/test_http_client.py
+
+import http.server
+import os
+import subprocess
+import sys
+import threading
+import pytest
+import requests
+import config
+import http_client
+
+def test_run_summary_adds_up_all_processes(cache_dir, monkeypatch):
+    monkeypatch.setenv('D4J_RUN_ID', 'test-run')
+    http_client._count(hits=1, bytes_saved=2048)
+    # 工作进程与 download_issues.py 子进程继承 D4J_RUN_ID
+    for _ in range(2):
+        subprocess.run([sys.executable, '-c', 'import http_client; http_client._count(hits=2, misses=1, bytes_fetched=1024)'],
+                       cwd=config.SCRIPT_DIR, check=True)
+
+    assert http_client.run_summary() == (
+        "HTTP cache: 5 hits (304 Not Modified), 2 misses, 2.0 KiB not re-downloaded, 2.0 KiB fetched"
+    )
+    assert not os.path.exists(cache_dir / 'http' / 'test-run.stats')
+
+class Clock:
+    """
+    http_client 与替身服务器共用的时钟；sleep() 只把时间向前拨。
+    """
+    def __init__(self):
+        self.now = 1700000000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class GitHubStandIn(http.server.BaseHTTPRequestHandler):
+    """
+    模拟 GitHub API 的速率限制: 每个 token 每 60 秒 quota 次请求，超出时返回 403 与 X-RateLimit-Remaining: 0；
+    retry_after 中的 token 下一次请求收到一次 secondary rate limit (403 + Retry-After)。
+    """
+    def do_GET(self):
+        server = self.server
+        token = self.headers.get('Authorization', '').replace('token ', '')
+        with server.lock:
+            if server.clock.now >= server.reset:
+                server.remaining = dict(server.quota)
+                server.reset += 60
+            headers = {'X-RateLimit-Reset': str(int(server.reset))}
+            if token in server.retry_after:
+                status = 403
+                headers['Retry-After'] = str(server.retry_after.pop(token))
+            elif server.remaining[token] > 0:
+                status = 200
+                server.remaining[token] -= 1
+            else:
+                status = 403
+            headers['X-RateLimit-Remaining'] = str(server.remaining[token])
+            server.log.append((token, status))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(token)))
+        self.end_headers()
+        self.wfile.write(token.encode('ascii'))
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def github(cache_dir, monkeypatch):
+    clock = Clock()
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), GitHubStandIn)
+    server.clock = clock
+    server.lock = threading.Lock()
+    server.reset = clock.now + 60
+    server.quota = {}
+    server.remaining = {}
+    server.retry_after = {}
+    server.log = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host = f"127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(config, 'GITHUB_API_HOSTS', [host])
+    monkeypatch.setattr(config, 'GITHUB_TOKENS', ['A', 'B'])
+    monkeypatch.setattr(http_client, '_github_pool', None)
+    monkeypatch.setattr(http_client, 'time', clock)
+
+    def set_quota(**quota):
+        server.quota = dict(quota)
+        server.remaining = dict(quota)
+    server.set_quota = set_quota
+    server.uri = f"http://{host}/repos/example/demo/issues"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def get(server):
+    with requests.Session() as session:
+        response = http_client.get(session, server.uri)
+    return response.status_code, response.text
+
+def test_requests_move_to_the_token_with_remaining_quota(github):
+    github.set_quota(A=2, B=5)
+    assert [get(github) for _ in range(7)] == [(200, 'A'), (200, 'B'), (200, 'B'), (200, 'B'), (200, 'B'), (200, 'A'), (200, 'B')]
+    # 每个响应都更新了剩余额度，没有请求被拒绝
+    assert all(status == 200 for _, status in github.log)
+    assert github.clock.sleeps == []
+
+def test_rate_limited_token_is_switched(github):
+    github.set_quota(A=0, B=3)
+    assert get(github) == (200, 'B')
+    assert github.log == [('A', 403), ('B', 200)]
+    assert get(github) == (200, 'B')
+    assert github.log[-1] == ('B', 200)
+
+def test_secondary_rate_limit_waits_for_retry_after(github):
+    github.set_quota(A=10, B=1)
+    github.retry_after['A'] = 30
+    assert get(github) == (200, 'B')
+    assert github.log == [('A', 403), ('B', 200)]
+    # A 在 Retry-After 内不可用，B 也已耗尽: 等到 A 可用
+    assert get(github) == (200, 'A')
+    assert github.clock.sleeps == [30]
+
+def test_exhausted_pool_waits_until_reset(github):
+    github.set_quota(A=1, B=1)
+    assert get(github) == (200, 'A')
+    assert get(github) == (200, 'B')
+    assert get(github) == (200, 'A')
+    assert github.clock.sleeps == [60]
+    assert [status for _, status in github.log] == [200, 200, 200]
@@ -0,0 +1,34 @@
+# framework/tests/test_issue_index.py
+
+import config
+import issue_index
+
+def test_issues_files_in_one_directory_are_separate_trackers(tmp_path, capsys):
+    db_file = str(tmp_path / 'issues.sqlite3')
+    ia_file = str(tmp_path / 'ia.txt')
+    ib_file = str(tmp_path / 'ib.txt')
+    (tmp_path / 'ia.txt').write_text('A-1,https://issues.example.com/A-1\n')
+    (tmp_path / 'ib.txt').write_text('B-1,https://issues.example.com/B-1\nB-2,https://issues.example.com/B-2\n')
+
+    ia = issue_index.open_issues(ia_file, db_file)
+    ib = issue_index.open_issues(ib_file, db_file)
+    assert 'a-1' in ia and 'B-1' not in ia
+    assert ib.get('b-2') == 'https://issues.example.com/B-2' and len(ib) == 2
+    assert len(ia) == 1
+
+    # 两个文件的索引都保持最新，不会轮流重新导入
+    capsys.readouterr()
+    assert issue_index.ensure_indexed(ia_file, db_file)
+    assert issue_index.ensure_indexed(ib_file, db_file)
+    assert 'Indexing' not in capsys.readouterr().err
+
+def test_resolve_tracker(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SHARED_ISSUES_DIR', str(tmp_path))
+    tracker_dir = tmp_path / 'jira_CAY'
+    tracker_dir.mkdir()
+    (tracker_dir / 'issues.txt').write_text('CAY-1,u1\n')
+
+    expected = issue_index.tracker_key(str(tracker_dir / 'issues.txt'))
+    assert issue_index.resolve_tracker('jira_CAY') == expected
+    assert issue_index.resolve_tracker(str(tracker_dir)) == expected
+    assert issue_index.resolve_tracker(str(tracker_dir / 'issues.txt')) == expected
@@ -0,0 +1,53 @@
+# framework/tests/test_pipeline_state.py
+
+import pipeline_state
+
+def test_rollback_xref_restores_checkpoint(cache_dir):
+    state = pipeline_state.ProjectState(str(cache_dir / 'demo'))
+    csv_file = cache_dir / 'active-bugs.csv'
+    log_file = cache_dir / 'gitlog.txt'
+    csv_file.write_text('1,demo,a,b,X-1,u1,c\n')
+    log_file.write_text('commit a\n')
+    (cache_dir / 'gitlog.txt.head').write_text('a\n')
+
+    pipeline_state.checkpoint_xref(state, str(csv_file), str(log_file))
+    assert state.stage('xref')['status'] == 'running'
+    # 中断前追加了一部分输出
+    csv_file.write_text('1,demo,a,b,X-1,u1,c\n2,demo,b,c,X-2,u2,c\n3,de')
+    log_file.write_text('commit a\ncommit b\n')
+    (cache_dir / 'gitlog.txt.head').write_text('b\n')
+
+    pipeline_state.rollback_xref(state, str(csv_file))
+    assert csv_file.read_text() == '1,demo,a,b,X-1,u1,c\n'
+    assert log_file.read_text() == 'commit a\n'
+    assert (cache_dir / 'gitlog.txt.head').read_text() == 'a\n'
+    assert state.stage('xref')['status'] == 'failed'
+
+def test_rollback_xref_removes_new_files_and_bug_records(cache_dir):
+    state = pipeline_state.ProjectState(str(cache_dir / 'demo'))
+    csv_file = cache_dir / 'active-bugs.csv'
+    log_file = cache_dir / 'gitlog.txt'
+    state.mark_done('patches', '1')
+
+    # 新的 active-bugs.csv 会重新编号，旧的 patch 记录随之清除
+    pipeline_state.checkpoint_xref(state, str(csv_file), str(log_file))
+    assert state.done_bugs('patches') == set()
+    csv_file.write_text('1,demo,a,b,X-1,u1,c\n')
+    log_file.write_text('commit a\n')
+    (cache_dir / 'gitlog.txt.head').write_text('a\n')
+
+    pipeline_state.rollback_xref(state, str(csv_file))
+    assert not csv_file.exists()
+    assert not log_file.exists()
+    assert not (cache_dir / 'gitlog.txt.head').exists()
+
+def test_rollback_xref_keeps_finished_output(cache_dir):
+    state = pipeline_state.ProjectState(str(cache_dir / 'demo'))
+    csv_file = cache_dir / 'active-bugs.csv'
+    pipeline_state.checkpoint_xref(state, str(csv_file))
+    csv_file.write_text('1,demo,a,b,X-1,u1,c\n')
+    state.finish('xref')
+
+    pipeline_state.rollback_xref(state, str(csv_file))
+    assert csv_file.read_text() == '1,demo,a,b,X-1,u1,c\n'
+    assert state.is_done('xref')
@@ -0,0 +1,59 @@
+# framework/tests/test_repo_cache.py
+
+import os
+import subprocess
+import config
+import generate_patches
+import repo_cache
+
+def git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='t', GIT_AUTHOR_EMAIL='t@example.com',
+               GIT_COMMITTER_NAME='t', GIT_COMMITTER_EMAIL='t@example.com')
+    return subprocess.run(['git', '-C', str(repo)] + list(args), check=True, env=env,
+                          capture_output=True, text=True).stdout
+
+def test_normalize_repo_url_github_ignores_case():
+    for url in ('https://github.com/Apache/cayenne.git', 'git@GitHub.com:apache/cayenne',
+                'http://github.com/apache/Cayenne/'):
+        assert repo_cache.normalize_repo_url(url) == 'github.com/apache/cayenne'
+
+def test_normalize_repo_url_keeps_path_case_on_other_hosts():
+    assert repo_cache.normalize_repo_url('https://Git.Example.org/Team/Repo.git') == 'git.example.org/Team/Repo'
+    assert repo_cache.normalize_repo_url('git@git.example.org:team/repo') == 'git.example.org/team/repo'
+    assert (repo_cache.get_repo_cache_dir('https://git.example.org/Team/Repo')
+            != repo_cache.get_repo_cache_dir('https://git.example.org/team/repo'))
+
+def test_partial_clone_patches_match_full_clone(cache_dir, tmp_path, monkeypatch):
+    work = tmp_path / 'work'
+    work.mkdir()
+    git(work, 'init', '-q')
+    for n in range(6):
+        (work / f"f{n % 3}.txt").write_text(''.join(f"{n} {i}\n" for i in range(30)))
+        git(work, 'add', '-A')
+        git(work, 'commit', '-q', '-m', f"change {n}")
+    commits = git(work, 'rev-list', '--reverse', 'HEAD').split()
+    origin = tmp_path / 'origin.git'
+    git(tmp_path, 'clone', '-q', '--bare', str(work), str(origin))
+    git(origin, 'config', 'uploadpack.allowFilter', 'true')
+
+    monkeypatch.setattr(config, 'CLONE_FILTER', 'blob:none')
+    partial_dir = repo_cache.ensure_repo(f"file://{origin}")
+    assert repo_cache.is_partial_clone(partial_dir)
+    assert '?' in git(partial_dir, 'rev-list', '--objects', '--missing=print', '--all')
+    full_dir = tmp_path / 'full.git'
+    git(tmp_path, 'clone', '-q', '--bare', f"file://{origin}", str(full_dir))
+
+    csv_file = tmp_path / 'active-bugs.csv'
+    with open(csv_file, 'w', encoding='utf-8') as f:
+        f.write(','.join(config.ACTIVE_BUGS_HEADER) + '\n')
+        for bug_id in range(1, len(commits)):
+            f.write(f"{bug_id},demo,{commits[bug_id - 1]},{commits[bug_id]},X-{bug_id},u,b,f,c\n")
+
+    assert generate_patches.generate_patches(str(full_dir), str(csv_file), str(tmp_path / 'full'))
+    # blob 由 prefetch_blobs() 一次批量获取；禁止按需下载后 diff-tree 仍然成功
+    monkeypatch.setenv('GIT_NO_LAZY_FETCH', '1')
+    assert generate_patches.generate_patches(partial_dir, str(csv_file), str(tmp_path / 'partial'))
+    for bug_id in range(1, len(commits)):
+        patch = f"{bug_id}.src.patch"
+        assert (tmp_path / 'partial' / patch).read_bytes() == (tmp_path / 'full' / patch).read_bytes()
+        assert (tmp_path / 'partial' / patch).stat().st_size > 0
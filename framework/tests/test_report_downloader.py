@@ -0,0 +1,26 @@
+# framework/tests/test_report_downloader.py
+
+import http_client
+import report_downloader
+import retry_queue
+
+def test_failing_report_does_not_stop_the_others(cache_dir, monkeypatch):
+    def fetch(session, uri, save_to, headers=None, timeout=None):
+        if uri.endswith('/2'):
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+        if uri.endswith('/3'):
+            raise OSError('rename failed')
+        with open(save_to, 'w', encoding='utf-8') as f:
+            f.write(uri)
+        return None, False
+    monkeypatch.setattr(http_client, 'fetch', fetch)
+
+    jobs = [(str(n), f"https://reports.example.com/{n}", str(cache_dir / f"{n}.report")) for n in range(1, 6)]
+    done = []
+    failed = report_downloader.download_project_reports('demo', jobs, per_host=2, on_done=done.append)
+
+    assert sorted(done) == ['1', '4', '5']
+    assert sorted(job[0] for job in failed) == ['2', '3']
+    queued = {entry['item']: entry for entry in retry_queue.entries('report', 'demo')}
+    assert sorted(queued) == ['2', '3']
+    assert 'rename failed' in queued['3']['last_error']
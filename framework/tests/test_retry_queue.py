@@ -0,0 +1,53 @@
+# framework/tests/test_retry_queue.py
+
+import time
+import pytest
+import config
+import retry_queue
+
+@pytest.fixture(autouse=True)
+def backoff_config(cache_dir, monkeypatch):
+    monkeypatch.setattr(config, 'RETRY_BACKOFF', 60)
+    monkeypatch.setattr(config, 'RETRY_BACKOFF_MAX', 600)
+
+def test_backoff_doubles_up_to_max():
+    assert [retry_queue.backoff(n) for n in range(1, 7)] == [60, 120, 240, 480, 600, 600]
+    assert retry_queue.backoff(0) == 60
+
+def test_record_failures_counts_attempts():
+    data = {'report_url': 'u1', 'report_file': 'f1'}
+    retry_queue.record_failures('report', 'demo', [('1', 'timeout', data), ('2', 'HTTP 503', None)])
+    before = time.time()
+    retry_queue.record_failures('report', 'demo', [('1', 'HTTP 502', data)])
+
+    entries = {entry['item']: entry for entry in retry_queue.entries('report', 'demo')}
+    assert entries['1']['attempts'] == 2
+    assert entries['1']['last_error'] == 'HTTP 502'
+    assert entries['1']['data'] == data
+    assert entries['1']['next_attempt_at'] >= before + 120
+    assert entries['2']['attempts'] == 1
+    assert entries['2']['data'] == {}
+    assert set(retry_queue.deferred('report', 'demo')) == {'1', '2'}
+    assert retry_queue.entries('report', 'demo', due_only=True) == []
+    assert retry_queue.entries('patch') == []
+
+def test_record_failures_waits_for_not_before():
+    not_before = time.time() + 3600
+    retry_queue.record_failures('report', 'demo', [('1', 'circuit open', None, not_before)])
+    assert retry_queue.entries('report', 'demo')[0]['next_attempt_at'] == not_before
+
+def test_due_entries(monkeypatch):
+    monkeypatch.setattr(config, 'RETRY_BACKOFF', 0)
+    retry_queue.record_failure('stage', 'demo', 'xref', 'git failed', {'project_id': 'demo'})
+    assert [entry['item'] for entry in retry_queue.entries(due_only=True)] == ['xref']
+    assert retry_queue.deferred('stage', 'demo') == {}
+
+def test_resolve_removes_only_given_items():
+    retry_queue.record_failures('report', 'demo', [(item, 'timeout', None) for item in ('1', '2', '3')])
+    retry_queue.record_failure('patch', 'demo', '1', 'diff failed')
+    retry_queue.record_failure('report', 'other', '1', 'timeout')
+
+    retry_queue.resolve('report', 'demo', [1, 3, 4])
+    assert [entry['item'] for entry in retry_queue.entries('report', 'demo')] == ['2']
+    assert len(retry_queue.entries('patch', 'demo')) == 1
+    assert len(retry_queue.entries('report', 'other')) == 1
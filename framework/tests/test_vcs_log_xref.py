@@ -0,0 +1,68 @@
+# framework/tests/test_vcs_log_xref.py
+#
+# 同一仓库的 xref 结果不应取决于日志的读取方式: 单进程扫描缓存日志、多进程分块扫描、--rev 直接读取 git log 流。
+
+import os
+import subprocess
+import sys
+import pytest
+import config
+
+XREF_SCRIPT = os.path.join(config.SCRIPT_DIR, 'vcs_log_xref.py')
+REPO_URL = 'https://github.com/example/demo.git'
+
+def git(repo, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME='t', GIT_AUTHOR_EMAIL='t@example.com',
+               GIT_COMMITTER_NAME='t', GIT_COMMITTER_EMAIL='t@example.com')
+    return subprocess.run(['git', '-C', str(repo)] + list(args), check=True, env=env,
+                          capture_output=True, text=True).stdout
+
+@pytest.fixture(scope='module')
+def repo(tmp_path_factory):
+    """
+    带分支合并的小仓库: 部分 commit 引用 issues.txt 中的 DEMO-<n>，部分引用不存在的 issue 或不引用。
+    """
+    root = tmp_path_factory.mktemp('xref')
+    work = root / 'work'
+    work.mkdir()
+    git(work, 'init', '-q', '-b', 'main')
+    for n in range(1, 61):
+        if n == 30:
+            git(work, 'checkout', '-q', '-b', 'topic')
+        if n == 40:
+            git(work, 'checkout', '-q', 'main')
+        (work / f"f{n}.txt").write_text(f"{n}\n")
+        git(work, 'add', '-A')
+        message = f"Fix DEMO-{n}: change {n}\n\nDetails for DEMO-{n}.\n" if n % 3 else f"Refactor part {n} (see DEMO-{n + 1000})\n"
+        git(work, 'commit', '-q', '-m', message)
+    git(work, 'merge', '-q', '--no-ff', '-m', 'Merge topic for DEMO-2', 'topic')
+
+    issues_file = root / 'issues.txt'
+    issues_file.write_text(''.join(f"DEMO-{n},https://issues.example.com/DEMO-{n}\n" for n in range(1, 61)))
+    return {'root': root, 'git_dir': str(work / '.git'), 'issues_file': str(issues_file)}
+
+def run_xref(repo, output_file, *args, env=None):
+    cmd = [sys.executable, XREF_SCRIPT, '-e', r'(DEMO-\d+)', '-r', repo['git_dir'], '-i', repo['issues_file'],
+           '-f', str(output_file), '-ru', REPO_URL, '-pid', 'demo'] + list(args)
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True, env=dict(os.environ, **(env or {})))
+    return output_file.read_text(), result.stderr
+
+@pytest.mark.parametrize('log_options', [[], [f'--format={config.GITLOG_FORMAT}']], ids=['medium', 'parents'])
+def test_serial_parallel_and_streamed_xref_agree(repo, cache_dir, tmp_path, log_options):
+    log_file = tmp_path / 'gitlog.txt'
+    log_file.write_text(git(repo['git_dir'], 'log', '--reverse', *log_options, 'HEAD'))
+
+    serial, _ = run_xref(repo, tmp_path / 'serial.csv', '-l', str(log_file), '-j', '1')
+    parallel, parallel_log = run_xref(repo, tmp_path / 'parallel.csv', '-l', str(log_file), '-j', '3',
+                                     env={'D4J_XREF_PARALLEL_MIN_MB': '0'})
+    streamed, _ = run_xref(repo, tmp_path / 'streamed.csv', '--rev', 'HEAD')
+
+    rows = serial.splitlines()
+    # 引用已知 issue 的 40 个 commit，除去没有父 commit 的第一个 (DEMO-1)
+    assert len(rows) == 39
+    assert rows[0].startswith('1,demo,') and ',DEMO-2,' in rows[0]
+    assert 'chunks with 3 processes' in parallel_log
+    assert parallel == serial
+    assert streamed == serial
+    # issues.txt 索引在 D4J_CACHE_DIR 下，而不是 framework/cache
+    assert os.path.exists(cache_dir / 'shared_issues' / 'issues.sqlite3')
@@ -4,10 +4,19 @@
 import subprocess
 import os
 import sys
+import contextlib
+import time
 import requests  
 import requests.adapters 
+import http_client
 from urllib.parse import urlparse, urlunparse 
 
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
 # Read debug flag from environment variable
 DEBUG = os.environ.get('D4J_DEBUG', '0') == '1'
 
@@ -20,63 +29,71 @@ def get_http_session():
     global _session
     if _session is None:
         _session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(max_retries=5)
+        # 重试与退避由 http_client.request() 负责，以便熔断器 (circuit_breaker.py) 看到每次失败
+        adapter = requests.adapters.HTTPAdapter(max_retries=0)
         _session.mount('http://', adapter)
         _session.mount('https://', adapter)
         _session.headers.update({'User-Agent': 'Mozilla/5.0'})
     return _session
 
 
+def remap_report_uri(uri):
+    """
+    将已知 issue tracker 的页面 URL 转换为 API / 原始数据 URL。
+    返回 (api_uri, headers, label)，label 用于日志输出。
+    """
+    headers = {}
+    api_uri = uri
+
+    # check and convert known issue tracker URLs to API/raw data URLs
+    if 'issues.apache.org/jira/' in uri:
+        issue_key = uri.split('/')[-1].split('?')[0] # 移除可能的查询参数
+        api_uri = f"https://issues.apache.org/jira/si/jira.issueviews:issue-xml/{issue_key}/{issue_key}.xml"
+        label = "[JIRA] Remapped to XML view"
+
+    elif 'github.com/' in uri and '/issues/' in uri and 'api.github.com' not in uri:
+        label = "[Unknown] Attempting direct download"
+        parts = urlparse(uri).path.split('/')
+        if len(parts) >= 5:
+            org = parts[1]
+            repo = parts[2]
+            issue_num = parts[4]
+            api_uri = f"https://api.github.com/repos/{org}/{repo}/issues/{issue_num}"
+            label = "[GitHub] Remapped to API view"
+            # Authorization 由 http_client 的 GitHub token 池添加
+
+    elif 'bugzilla' in uri and 'show_bug.cgi?id=' in uri:
+        parsed_url = urlparse(uri)
+        api_uri = urlunparse(parsed_url._replace(query=f"ctype=xml&{parsed_url.query}"))
+        label = "[Bugzilla] Remapped to XML view"
+
+    elif 'sourceforge.net/p/' in uri and '/bugs/' in uri:
+        api_uri = uri.replace('/p/', '/rest/p/')
+        if not api_uri.endswith('/'):
+            api_uri += '/'
+        label = "[SourceForge] Remapped to REST API"
+
+    elif 'storage.googleapis.com/google-code-archive' in uri and uri.endswith('.json'):
+        label = "[Google Code] Using direct JSON URL"
+
+    else:
+        label = "[Unknown] Attempting direct download"
+
+    return api_uri, headers, label
+
 def download_report_data(uri, save_to):
     """
     从指定的 URI 下载报告数据并保存到本地文件。
     """
     session = get_http_session()
-    headers = {}
     api_uri = uri
     
     try:
-        # check and convert known issue tracker URLs to API/raw data URLs
-        if 'issues.apache.org/jira/' in uri:
-            issue_key = uri.split('/')[-1].split('?')[0] # 移除可能的查询参数
-            api_uri = f"https://issues.apache.org/jira/si/jira.issueviews:issue-xml/{issue_key}/{issue_key}.xml"
-            print(f"  -> [JIRA] Remapped to XML view", end="")
-
-        elif 'github.com/' in uri and '/issues/' in uri and 'api.github.com' not in uri:
-            parts = urlparse(uri).path.split('/')
-            if len(parts) >= 5:
-                org = parts[1]
-                repo = parts[2]
-                issue_num = parts[4]
-                api_uri = f"https://api.github.com/repos/{org}/{repo}/issues/{issue_num}"
-                print(f"  -> [GitHub] Remapped to API view", end="")
-                if os.environ.get('GH_TOKEN'):
-                    headers['Authorization'] = f"token {os.environ['GH_TOKEN']}"
-
-        elif 'bugzilla' in uri and 'show_bug.cgi?id=' in uri:
-            parsed_url = urlparse(uri)
-            api_uri = urlunparse(parsed_url._replace(query=f"ctype=xml&{parsed_url.query}"))
-            print(f"  -> [Bugzilla] Remapped to XML view", end="")
-
-        elif 'sourceforge.net/p/' in uri and '/bugs/' in uri:
-            api_uri = uri.replace('/p/', '/rest/p/')
-            if not api_uri.endswith('/'):
-                api_uri += '/'
-            print(f"  -> [SourceForge] Remapped to REST API", end="")
-        
-        elif 'storage.googleapis.com/google-code-archive' in uri and uri.endswith('.json'):
-            print(f"  -> [Google Code] Using direct JSON URL", end="")
-        
-        else:
-            print(f"  -> [Unknown] Attempting direct download", end="")
+        api_uri, headers, label = remap_report_uri(uri)
+        print(f"  -> {label}", end="")
 
-        
-        response = session.get(api_uri, headers=headers, timeout=20)
-        response.raise_for_status()
-        
-        with open(save_to, 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        print("OK", file=sys.stderr)
+        _, hit = http_client.fetch(session, api_uri, save_to, headers, timeout=20)
+        print("OK (not modified)" if hit else "OK", file=sys.stderr)
         return True
     except requests.exceptions.RequestException as e:
         print("FAIL", file=sys.stderr)
@@ -92,10 +109,11 @@ def download_report_data(uri, save_to):
         return False
 
 
-def exec_cmd(cmd_list, desc, output_file=None):
+def exec_cmd(cmd_list, desc, output_file=None, input_text=None):
     """
     (!!) cmd_list 现在必须是一个列表 (e.g., ['git', 'log'])
     (!!) 添加了 output_file 参数用于重定向 stdout
+    input_text 不为 None 时作为命令的标准输入 (e.g., `git fetch --stdin`)
     """
     
     print(f"{desc:.<75} ", end="", flush=True, file=sys.stderr)
@@ -115,6 +133,7 @@ def exec_cmd(cmd_list, desc, output_file=None):
                 result = subprocess.run(
                     cmd_list,
                     shell=False,
+                    input=input_text,
                     stdout=stdout_handle, 
                     stderr=subprocess.PIPE, 
                     text=True,
@@ -134,6 +153,7 @@ def exec_cmd(cmd_list, desc, output_file=None):
             result = subprocess.run(
                 cmd_list,
                 shell=False,
+                input=input_text,
                 capture_output=True, 
                 text=True,
                 encoding='utf-8',
@@ -172,6 +192,28 @@ def exec_cmd(cmd_list, desc, output_file=None):
             except OSError: pass
         return False, str(e)
 
+def parse_project_line(line):
+    """
+    解析项目列表 (example.txt) 中以 tab 分隔的一行，返回项目字典；格式错误时返回 None。
+    """
+    try:
+        parts = line.split('\t')
+        project = {
+            'project_id': parts[0],
+            'project_name': parts[1],
+            'repository_url': parts[2],
+            'issue_tracker_name': parts[3],
+            'issue_tracker_project_id': parts[4],
+            'bug_fix_regex': parts[5],
+            'sub_project_path': ".",
+        }
+    except IndexError:
+        return None
+
+    if len(parts) > 6 and parts[6].strip() and parts[6].strip() != ".":
+        project['sub_project_path'] = parts[6].strip()
+    return project
+
 def read_config_file(file_path, key_separator=','):
     """
     读取配置文件，返回键值对字典。
@@ -198,4 +240,68 @@ def read_config_file(file_path, key_separator=','):
         print(f"Cannot open config file ({file_path}): {e}", file=sys.stderr)
         return None
         
-    return config_data
\ No newline at end of file
+    return config_data
+
+@contextlib.contextmanager
+def file_lock(lock_path):
+    """
+    跨进程的排他文件锁 (阻塞直到获得锁)。
+    用于让多个工作进程对同一个共享缓存只执行一次耗时操作 (例如 clone)。
+    """
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a+') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass # LK_LOCK 最多重试 10 秒后失败，继续等待
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def get_run_id():
+    """
+    返回本次运行的标识。首次调用时写入环境变量 D4J_RUN_ID，
+    之后创建的工作进程 (multiprocessing.Pool) 与子进程继承同一个值。
+    """
+    return os.environ.setdefault('D4J_RUN_ID', f"{os.getpid()}-{int(time.time())}")
+
+def single_flight(lock_path, marker_path, action, token='done'):
+    """
+    跨进程的 single-flight: 对同一个共享缓存，只有一个进程执行 action()，其余进程等待并复用结果。
+    action() 成功 (返回 True) 后写入完成标记 marker_path，内容为 token；
+    标记内容已等于 token 时直接返回 True，无需加锁。token 使用 get_run_id() 时表示"本次运行只做一次"。
+    action() 失败时不写标记，下一个获得锁的进程会重试。返回是否成功。
+    """
+    def is_done():
+        try:
+            with open(marker_path, 'r', encoding='utf-8') as f:
+                return f.read().strip() == token
+        except IOError:
+            return False
+
+    if is_done():
+        return True
+
+    with file_lock(lock_path):
+        # 等待锁期间其他进程可能已完成
+        if is_done():
+            return True
+        if not action():
+            return False
+        marker_tmp = f"{marker_path}.tmp"
+        with open(marker_tmp, 'w', encoding='utf-8') as f:
+            f.write(token + '\n')
+        os.replace(marker_tmp, marker_path)
+
+    return True
@@ -2,52 +2,38 @@
 # framework/vcs_log_xref.py
 
 import argparse
+import contextlib
+import io
+import mmap
+import multiprocessing
 import sys
 import os
 import re
-import subprocess
 import csv 
-import utils
+import subprocess
+import tempfile
+import issue_index
 import config
+import git_backend
 
 def get_git_parent(commit_hash, repo_dir):
     """
     获取一个 commit 的父 commit。只支持单个父 commit。
+    通过常驻的 `git cat-file --batch` 进程查询 (git_backend)，不再为每个 commit 启动 git。
     """
     try:
-        # (!!) 更改为列表
-        cmd_list = [
-            'git',
-            f'--git-dir={repo_dir}', # (!!) 移除不必要的引号
-            'rev-list',
-            '--parents',
-            '-n', '1',
-            commit_hash
-        ]
-        
-        # (!!) 更改为 shell=False
-        result = subprocess.run(
-            cmd_list, 
-            shell=False, # (!!) 关键: 关闭 shell
-            capture_output=True, 
-            text=True, 
-            check=True, 
-            encoding='utf-8', 
-            errors='ignore'
-        )
-        parts = result.stdout.strip().split()
-        
-        if len(parts) > 1:
-            if len(parts) > 2:
-                return None
-            return parts[1] # 返回第一个父 commit
-        else:
-            return None # Root commit
-            
-    except subprocess.CalledProcessError as e:
+        parents = git_backend.get_backend(repo_dir).parents(commit_hash)
+    except (git_backend.GitProcessError, OSError) as e:
         print(f"Warning: Error getting parent for {commit_hash}: {e}", file=sys.stderr)
         return None
 
+    if parents is None:
+        print(f"Warning: Error getting parent for {commit_hash}: not a commit in {repo_dir}", file=sys.stderr)
+        return None
+    if len(parents) != 1:
+        return None # merge commit 或 root commit
+    return parents[0]
+
 # ... (construct_commit_url 和 construct_compare_url 无需更改) ...
 
 def construct_commit_url(repo_url, commit_hash):
@@ -91,122 +77,405 @@ def construct_compare_url(repo_url, buggy_hash, fixed_hash):
         return f"{base_url}/compare/{buggy_hash}...{fixed_hash}"
     return "NA"
 
-def main():
-    # ... (argparse, 1. Load issues.txt, 2. compile regex, 3. read log, 4. append results ... 都无需更改) ...
-    parser = argparse.ArgumentParser(description="Cross-reference VCS log with issue tracker data.")
-    parser.add_argument('-e', dest='regexp', required=True, help="Perl-compatible regex to match issue IDs")
-    parser.add_argument('-l', dest='log_file', required=True, help="Path to the commit log file (from git log)")
-    parser.add_argument('-r', dest='repo_dir', required=True, help="Path to the .git repository directory")
-    parser.add_argument('-i', dest='issues_file', required=True, help="Path to the issues.txt file (id,url)")
-    parser.add_argument('-f', dest='output_file', required=True, help="Output file for active-bugs.csv (will append)")
-    # added arguments
-    parser.add_argument('-ru', dest='repo_url', required=True, help="Public repository URL (e.g., https://github.com/org/repo.git)")
-    parser.add_argument('-pid', dest='project_id', required=True, help="Project ID (e.g., 'core' or '.')")
+def detect_log_format(f):
+    """
+    根据日志文件开头判断格式: 'medium' (git log 默认输出) 或 'parents' (config.GITLOG_FORMAT)。
+    读取后会将文件指针移回开头。
+    """
+    head = f.read(7)
+    f.seek(0)
+    return 'medium' if head == 'commit ' else 'parents'
 
-    args = parser.parse_args()
+def iter_medium_log(f):
+    """
+    解析 `git log` 默认 (medium) 格式的输出。
+    逐个返回 (commit_hash, None, commit_message)；parents 为 None 表示需要另行查询父 commit。
+    """
+    current_commit = None
+    commit_message_lines = []
+    for line in f:
+        if line.startswith('commit '):
+            if current_commit and commit_message_lines:
+                yield current_commit, None, "\n".join(commit_message_lines)
+            current_commit = line.split()[1].strip()
+            commit_message_lines = []
+        elif current_commit and line.startswith('    '):
+            commit_message_lines.append(line.strip())
 
-    # 1. Load issues.txt into memory
-    issues_db = utils.read_config_file(args.issues_file, key_separator=',')
-    if not issues_db:
-        print(f"Error: Could not read or issues file is empty: {args.issues_file}", file=sys.stderr)
-        sys.exit(1)
-        
-    issues_db_lower = {k.lower(): v for k, v in issues_db.items()}
+    # handle the last commit
+    if current_commit and commit_message_lines:
+        yield current_commit, None, "\n".join(commit_message_lines)
 
-    # 2. compile the regex
-    try:
-        pattern_str = args.regexp.strip('/ \t\n\r')
-        flags_str = ""
-        if '/' in pattern_str:
-            parts = pattern_str.rsplit('/', 1)
-            pattern_str = parts[0]
-            flags_str = parts[1]
-        
-        flags = 0
-        if 'm' in flags_str:
-            flags |= re.MULTILINE
-        if 'i' in flags_str:
-            flags |= re.IGNORECASE
-            
-        bug_regex = re.compile(pattern_str, flags)
-    except re.error as e:
-        print(f"Error: Invalid regex provided: {args.regexp}. Error: {e}", file=sys.stderr)
-        sys.exit(1)
+def iter_nul_records(f, chunk_size=1 << 16):
+    """
+    按 NUL 分隔符流式切分文件内容，不会一次性读入整个文件。
+    """
+    pending = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        records = pending.split('\0')
+        pending = records.pop()
+        yield from records
+    if pending.strip():
+        yield pending
 
-    # 3. read the log file and cross-reference
-    results = {}
-    version_id = 1
-    current_commit = None
-    commit_message_lines = []
+def iter_parents_log(f):
+    """
+    解析 `git log --format=config.GITLOG_FORMAT` 的输出 ("%H %P" 行 + 消息体，以 NUL 结尾)。
+    逐个返回 (commit_hash, [parent_hash, ...], commit_message)，父 commit 直接取自日志，无需再调用 git。
+    消息的规范化方式与 iter_medium_log 相同 (逐行 strip)，以保证正则匹配结果一致。
+    """
+    for record in iter_nul_records(f):
+        record = record.lstrip('\n')
+        if not record:
+            continue
+        header, _, body = record.partition('\n')
+        hashes = header.split()
+        if not hashes:
+            continue
+        body = body.rstrip('\n')
+        if not body:
+            continue
+        commit_message = "\n".join(line.strip() for line in body.split('\n'))
+        yield hashes[0], hashes[1:], commit_message
 
-    try:
-        with open(args.log_file, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                if line.startswith('commit '):
-                    if current_commit and commit_message_lines:
-                        commit_message = "\n".join(commit_message_lines)
-                        match = bug_regex.search(commit_message)
-                        
-                        if match and match.groups():
-                            bug_number = match.group(1) 
-                            if bug_number.lower() in issues_db_lower:
-                                parent = get_git_parent(current_commit, args.repo_dir)
-                                if parent: 
-                                    results[version_id] = {
-                                        'p': parent,
-                                        'c': current_commit,
-                                        'issue_id': bug_number,
-                                        'issue_url': issues_db_lower.get(bug_number.lower(), 'NA')
-                                    }
-                                    version_id += 1
-                                    
-                    current_commit = line.split()[1].strip()
-                    commit_message_lines = []
-                
-                elif current_commit and line.startswith('    '):
-                    commit_message_lines.append(line.strip())
-
-        # handle the last commit
-        if current_commit and commit_message_lines:
-            commit_message = "\n".join(commit_message_lines)
-            match = bug_regex.search(commit_message)
-            if match and match.groups():
-                bug_number = match.group(1)
-                if bug_number.lower() in issues_db_lower:
-                    parent = get_git_parent(current_commit, args.repo_dir)
-                    if parent:
-                        results[version_id] = {
-                            'p': parent,
-                            'c': current_commit,
-                            'issue_id': bug_number,
-                            'issue_url': issues_db_lower.get(bug_number.lower(), 'NA')
-                        }
-                        version_id += 1
+def iter_name_only_log(f):
+    """
+    解析 `git log --name-only --format=config.GITLOG_NAMES_FORMAT` 的输出。
+    每个 commit 由 NUL 分隔为 "头部+消息" 与 "文件列表" 两段，逐个返回
+    (commit_hash, [parent_hash, ...], commit_message, [changed_file, ...])。
+    """
+    records = iter_nul_records(f)
+    next(records, None) # 第一个 NUL 之前没有内容
+    for record in records:
+        files_chunk = next(records, '')
+        header, _, body = record.lstrip('\n').partition('\n')
+        hashes = header.split()
+        body = body.rstrip('\n')
+        if not hashes or not body:
+            continue
+        commit_message = "\n".join(line.strip() for line in body.split('\n'))
+        changed_files = [line for line in files_chunk.split('\n') if line]
+        yield hashes[0], hashes[1:], commit_message, changed_files
+
+class _TeeRaw(io.RawIOBase):
+    """
+    读取 git log 管道的同时把原始字节写入 tee 文件。
+    """
+    def __init__(self, raw, tee=None):
+        self.raw = raw
+        self.tee = tee
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self.raw.readinto(buffer)
+        if n and self.tee:
+            self.tee.write(memoryview(buffer)[:n])
+        return n
+
+@contextlib.contextmanager
+def open_git_log(repo_dir, revision, log_options, pathspec=None, tee_file=None):
+    """
+    启动 `git log --reverse <log_options> <revision> [-- <pathspec>]`，以文本流返回其输出，
+    xref 边读边处理，不需要先写出完整的日志文件。
+    tee_file 不为 None 时同时把日志写入 <tee_file>.tmp，git 成功结束后原子地重命名为 tee_file。
+    git 失败时抛出 IOError，调用者不应写出结果。
+    """
+    cmd_list = ['git', f'--git-dir={repo_dir}', 'log', '--reverse'] + log_options + [revision]
+    if pathspec:
+        cmd_list += ['--'] + pathspec
+
+    tee_tmp = f"{tee_file}.tmp" if tee_file else None
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd_list, stdout=subprocess.PIPE, stderr=stderr_file)
+        tee = open(tee_tmp, 'wb') if tee_tmp else None
+        try:
+            # 与读取日志文件时相同的解码方式 (open(..., errors='ignore'))
+            stream = io.TextIOWrapper(io.BufferedReader(_TeeRaw(proc.stdout, tee)), encoding='utf-8', errors='ignore')
+            yield stream
+            # 读完剩余输出 (tee 文件必须完整)，git 退出码决定日志是否完整
+            while stream.read(1 << 16):
+                pass
+            returncode = proc.wait()
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            if tee:
+                tee.close()
+                os.remove(tee_tmp)
+            raise
+        finally:
+            proc.stdout.close()
+
+        if tee:
+            tee.close()
+        if returncode != 0:
+            if tee:
+                os.remove(tee_tmp)
+            stderr_file.seek(0)
+            raise IOError(f"git log exited with {returncode}: {stderr_file.read().decode('utf-8', errors='ignore').strip()}")
+        if tee:
+            os.replace(tee_tmp, tee_file)
+
+def open_log(args, log_options, pathspec=None):
+    """
+    返回日志文本流: 指定 --rev 时直接读取 git log 管道 (-l 为可选的 tee 文件)，否则读取 -l 日志文件。
+    """
+    if args.revision:
+        return open_git_log(args.repo_dir, args.revision, log_options, pathspec, args.log_file)
+    return open(args.log_file, 'r', encoding='utf-8', errors='ignore')
+
+def touches_path(changed_files, sub_project_path):
+    """
+    判断 commit 修改的文件是否位于 sub_project_path 下 (与 `git log -- <path>` 的路径过滤一致)。
+    """
+    if sub_project_path in ('', '.', './'):
+        return bool(changed_files)
+    prefix = sub_project_path.strip('/')
+    return any(name == prefix or name.startswith(prefix + '/') for name in changed_files)
+
+def compile_bug_regex(regexp):
+    """
+    将 Perl 风格的 "/pattern/flags" 编译为 Python 正则；无效时抛出 re.error。
+    """
+    pattern_str = regexp.strip('/ \t\n\r')
+    flags_str = ""
+    if '/' in pattern_str:
+        parts = pattern_str.rsplit('/', 1)
+        pattern_str = parts[0]
+        flags_str = parts[1]
+
+    flags = 0
+    if 'm' in flags_str:
+        flags |= re.MULTILINE
+    if 'i' in flags_str:
+        flags |= re.IGNORECASE
+
+    return re.compile(pattern_str, flags)
+
+def load_issues(issues_file):
+    """
+    返回 issues.txt (id,url) 在共享索引中的视图 (issue_index.IssueIndex，按小写 id 查询，不整体读入内存)；
+    失败时返回 None。
+    """
+    issues_db_lower = issue_index.open_issues(issues_file)
+    if issues_db_lower is None:
+        print(f"Error: Could not read or issues file is empty: {issues_file}", file=sys.stderr)
+        return None
+    return issues_db_lower
+
+def extract_issue_keys(bug_regex, issues_db_lower, commit_message):
+    """
+    用 finditer 一遍扫描提交消息，返回其中引用、且存在于 issues 中的所有缺陷编号
+    (取第一个分组；按出现顺序，忽略大小写去重)。例如 "Fix CAY-123, CAY-456" 返回两个编号。
+    """
+    if not bug_regex.groups:
+        return []
+    keys = {}
+    for match in bug_regex.finditer(commit_message):
+        bug_number = match.group(1)
+        if not bug_number:
+            continue
+        key = bug_number.lower()
+        if key in issues_db_lower and key not in keys:
+            keys[key] = bug_number
+    return list(keys.values())
+
+def commit_parent(current_commit, parents, repo_dir):
+    """
+    返回 commit 的唯一父 commit；merge commit 与 root commit 返回 None。
+    parents 为 None 时 (medium 格式日志) 通过 get_git_parent 查询。
+    """
+    if parents is None:
+        return get_git_parent(current_commit, repo_dir)
+    return parents[0] if len(parents) == 1 else None
+
+def match_commit(bug_regex, issues_db_lower, current_commit, parents, commit_message, repo_dir):
+    """
+    返回 commit 的结果行列表: 消息引用的每个 issues 中的缺陷各一行 (同一对 buggy/fixed commit)。
+    没有引用或没有唯一父 commit 时返回空列表。
+    """
+    bug_numbers = extract_issue_keys(bug_regex, issues_db_lower, commit_message)
+    if not bug_numbers:
+        return []
+    parent = commit_parent(current_commit, parents, repo_dir)
+    if not parent:
+        return []
+    return [make_row(parent, current_commit, bug_number, issues_db_lower) for bug_number in bug_numbers]
+
+def make_row(parent, current_commit, bug_number, issues_db_lower):
+    return {
+        'p': parent,
+        'c': current_commit,
+        'issue_id': bug_number,
+        'issue_url': issues_db_lower.get(bug_number.lower(), 'NA')
+    }
 
+def scan_log(f, log_format, projects, repo_dir):
+    """
+    扫描日志流，返回每个项目按日志顺序匹配到的结果行 [[row, ...], ...]。
+    projects 为 [{'sub_project_path', 'bug_regex', 'issues_db_lower'}, ...]；
+    log_format 为 'names' (--name-only 日志) 时按 commit 修改的路径分发给各项目，否则只有一个项目。
+    """
+    matches = [[] for _ in projects]
+    if log_format == 'names':
+        for current_commit, parents, commit_message, changed_files in iter_name_only_log(f):
+            # 使用相同正则与 issues 的子项目共享同一次提取结果
+            extracted = {}
+            for i, project in enumerate(projects):
+                if not touches_path(changed_files, project['sub_project_path']):
+                    continue
+                matcher = (project['bug_regex'], id(project['issues_db_lower']))
+                if matcher not in extracted:
+                    extracted[matcher] = extract_issue_keys(project['bug_regex'], project['issues_db_lower'], commit_message)
+                if not extracted[matcher]:
+                    continue
+                parent = commit_parent(current_commit, parents, repo_dir)
+                if parent:
+                    matches[i].extend(make_row(parent, current_commit, bug_number, project['issues_db_lower'])
+                                      for bug_number in extracted[matcher])
+        return matches
+
+    commits = iter_parents_log(f) if log_format == 'parents' else iter_medium_log(f)
+    project = projects[0]
+    for current_commit, parents, commit_message in commits:
+        matches[0].extend(match_commit(project['bug_regex'], project['issues_db_lower'],
+                                       current_commit, parents, commit_message, repo_dir))
+    return matches
+
+# 各日志格式中 commit 记录的起始位置: medium 为行首的 "commit "，parents 为上一条记录的 NUL 之后，
+# names 为 "\0<hash>" (文件列表字段以换行开始，不会被误认)
+RECORD_START_RE = {
+    'medium': re.compile(rb'\ncommit '),
+    'parents': re.compile(rb'\0'),
+    'names': re.compile(rb'\0[0-9a-f]{40}'),
+}
+
+def split_log(mm, log_format, n_chunks):
+    """
+    把 mmap 的日志按 commit 记录边界切分为约 n_chunks 个字节区间 [(start, end), ...]。
+    """
+    size = len(mm)
+    record_start = RECORD_START_RE[log_format]
+    bounds = [0]
+    for i in range(1, n_chunks):
+        target = max(size * i // n_chunks, bounds[-1] + 1)
+        match = record_start.search(mm, target)
+        if not match:
+            break
+        # medium: 跳过换行；parents: 从 NUL 之后开始；names: 从 NUL 开始
+        start = match.start() if log_format == 'names' else match.start() + 1
+        if start > bounds[-1]:
+            bounds.append(start)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+_scan_state = {}
+
+def _init_scan(state):
+    _scan_state.update(state)
+
+def _scan_chunk(chunk):
+    start, end = chunk
+    with open(_scan_state['log_file'], 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode('utf-8', errors='ignore')
+    # newline=None: 与 open() 的文本模式相同的换行处理
+    return scan_log(io.StringIO(text, newline=None), _scan_state['log_format'],
+                    _scan_state['projects'], _scan_state['repo_dir'])
+
+def scan_log_file(log_file, log_format, projects, repo_dir, workers=None):
+    """
+    扫描日志文件，返回值与 scan_log() 相同。
+    文件不小于 config.XREF_PARALLEL_MIN_BYTES 且 workers > 1 时，mmap 后按 commit 记录边界切块，
+    在进程池中并行扫描，再按原始顺序合并，bug.id 编号与单进程扫描完全一致。
+    """
+    workers = workers or config.XREF_WORKERS
+    size = os.path.getsize(log_file)
+    if workers <= 1 or size == 0 or size < config.XREF_PARALLEL_MIN_BYTES:
+        with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+            return scan_log(f, log_format, projects, repo_dir)
+
+    with open(log_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # 每个进程多个块，平衡不同区段的匹配密度差异
+            chunks = split_log(mm, log_format, workers * 4)
+    print(f"Scanning {size / (1 << 20):.0f} MiB log in {len(chunks)} chunks with {workers} processes", file=sys.stderr)
+
+    state = {'log_file': log_file, 'log_format': log_format, 'projects': projects, 'repo_dir': repo_dir}
+    with multiprocessing.Pool(workers, initializer=_init_scan, initargs=(state,)) as pool:
+        results = pool.map(_scan_chunk, chunks)
+
+    matches = [[] for _ in projects]
+    for chunk_matches in results:
+        for i, rows in enumerate(chunk_matches):
+            matches[i].extend(rows)
+    return matches
+
+def next_bug_id(output_file):
+    """
+    返回追加到 output_file 时应使用的下一个 bug.id (已有最大编号 + 1；文件不存在或无数据行时为 1)。
+    """
+    max_id = 0
+    if not os.path.exists(output_file):
+        return 1
+    try:
+        with open(output_file, 'r', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header or config.BUGS_CSV_BUGID not in header:
+                return 1
+            idx_bug_id = header.index(config.BUGS_CSV_BUGID)
+            for row in reader:
+                if len(row) > idx_bug_id and row[idx_bug_id].isdigit():
+                    max_id = max(max_id, int(row[idx_bug_id]))
     except IOError as e:
-        print(f"Error reading log file {args.log_file}: {e}", file=sys.stderr)
-        sys.exit(1)
+        print(f"Warning: Could not read existing bugs from {output_file}: {e}", file=sys.stderr)
+    return max_id + 1
 
-    if not results:
-        print("Warning: No commit matching the regex was found.", file=sys.stderr)
+def last_logged_commit(log_file):
+    """
+    返回日志文件中最后一个 commit 的 hash (支持 medium 与 NUL 分隔的格式)；为空时返回 None。
+    用于没有 .head 记录的旧缓存日志的增量更新。
+    """
+    last_commit = None
+    with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+        if detect_log_format(f) == 'medium':
+            for line in f:
+                if line.startswith('commit '):
+                    last_commit = line.split()[1].strip()
+        else:
+            for record in iter_nul_records(f):
+                header = record.lstrip('\n').partition('\n')[0].split()
+                # --name-only 日志中文件列表字段不以 commit hash 开头
+                if header and re.fullmatch(r'[0-9a-f]{40}([0-9a-f]{24})?', header[0]):
+                    last_commit = header[0]
+    return last_commit
 
-    # 4. Append the results to the output_file (active-bugs.csv)
+def write_results(output_file, results, repo_url, project_id):
+    """
+    将结果追加写入 output_file (active-bugs.csv)。成功返回 True。
+    """
     try:
         # 'a' (append) mode, and use csv.writer to ensure correct formatting
-        with open(args.output_file, 'a', encoding='utf-8', newline='') as f:
+        with open(output_file, 'a', encoding='utf-8', newline='') as f:
             writer = csv.writer(f)
             for vid in sorted(results.keys()):
                 row = results[vid]
                 
-                project_id = args.project_id
                 buggy_hash = row['p']
                 fixed_hash = row['c']
                 issue_id = row['issue_id']
                 issue_url = row['issue_url']
                 
-                buggy_url = construct_commit_url(args.repo_url, buggy_hash)
-                fixed_url = construct_commit_url(args.repo_url, fixed_hash)
-                compare_url = construct_compare_url(args.repo_url, buggy_hash, fixed_hash)
+                buggy_url = construct_commit_url(repo_url, buggy_hash)
+                fixed_url = construct_commit_url(repo_url, fixed_hash)
+                compare_url = construct_compare_url(repo_url, buggy_hash, fixed_hash)
                 
                 writer.writerow([
                     vid,
@@ -220,8 +489,138 @@ def main():
                     compare_url
                 ])
     except IOError as e:
-        print(f"Error writing to output file {args.output_file}: {e}", file=sys.stderr)
+        print(f"Error writing to output file {output_file}: {e}", file=sys.stderr)
+        return False
+    return True
+
+def xref_single(args):
+    # 1. Load issues.txt into memory
+    issues_db_lower = load_issues(args.issues_file)
+    if issues_db_lower is None:
+        sys.exit(1)
+
+    # 2. compile the regex
+    try:
+        bug_regex = compile_bug_regex(args.regexp)
+    except re.error as e:
+        print(f"Error: Invalid regex provided: {args.regexp}. Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # 3. read the log (file or git pipe) and cross-reference
+    project = {'sub_project_path': None, 'bug_regex': bug_regex, 'issues_db_lower': issues_db_lower}
+    try:
+        if args.revision:
+            pathspec = [args.sub_project_path] if args.sub_project_path else None
+            with open_log(args, [f'--format={config.GITLOG_FORMAT}'], pathspec) as f:
+                matches = scan_log(f, 'parents', [project], args.repo_dir)
+        else:
+            log_format = args.log_format
+            if log_format == 'auto':
+                with open(args.log_file, 'r', encoding='utf-8', errors='ignore') as f:
+                    log_format = detect_log_format(f)
+            matches = scan_log_file(args.log_file, log_format, [project], args.repo_dir, args.workers)
+    except IOError as e:
+        print(f"Error reading log {args.revision or args.log_file}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # 追加到已有的 active-bugs.csv 时 (增量更新)，bug.id 接着已有编号继续
+    version_id = next_bug_id(args.output_file)
+    results = {}
+    for row in matches[0]:
+        results[version_id] = row
+        version_id += 1
+
+    if not results:
+        print("Warning: No commit matching the regex was found.", file=sys.stderr)
+
+    # 4. Append the results to the output_file (active-bugs.csv)
+    if not write_results(args.output_file, results, args.repo_url, args.project_id):
+        sys.exit(1)
+
+def xref_multi(args):
+    """
+    多项目模式: 一次扫描整个仓库的 --name-only 日志，把每个 commit 分发给它所修改路径对应的
+    所有子项目，并在同一遍中应用各子项目的正则与 issues。N 个子项目只需遍历一次日志。
+    """
+    projects = []
+    issues_cache = {} # 共享同一 issues.txt 的子项目只加载一次
+    for project_id, sub_project_path, regexp, issues_file, output_file in args.projects:
+        if issues_file not in issues_cache:
+            issues_cache[issues_file] = load_issues(issues_file)
+        if issues_cache[issues_file] is None:
+            sys.exit(1)
+        try:
+            bug_regex = compile_bug_regex(regexp)
+        except re.error as e:
+            print(f"Error: Invalid regex provided for {project_id}: {regexp}. Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        projects.append({
+            'project_id': project_id,
+            'sub_project_path': sub_project_path,
+            'bug_regex': bug_regex,
+            'issues_db_lower': issues_cache[issues_file],
+            'output_file': output_file,
+            'next_id': next_bug_id(output_file),
+            'results': {},
+        })
+
+    try:
+        if args.revision:
+            with open_log(args, ['--name-only', '--no-renames', f'--format={config.GITLOG_NAMES_FORMAT}']) as f:
+                matches = scan_log(f, 'names', projects, args.repo_dir)
+        else:
+            matches = scan_log_file(args.log_file, 'names', projects, args.repo_dir, args.workers)
+    except IOError as e:
+        print(f"Error reading log {args.revision or args.log_file}: {e}", file=sys.stderr)
         sys.exit(1)
 
+    for project, rows in zip(projects, matches):
+        for row in rows:
+            project['results'][project['next_id']] = row
+            project['next_id'] += 1
+
+    for project in projects:
+        if not project['results']:
+            print(f"Warning: No commit matching the regex was found for {project['project_id']}.", file=sys.stderr)
+        if not write_results(project['output_file'], project['results'], args.repo_url, project['project_id']):
+            sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-reference VCS log with issue tracker data.")
+    parser.add_argument('-e', dest='regexp', help="Perl-compatible regex to match issue IDs")
+    parser.add_argument('-l', dest='log_file', help="Path to the commit log file (from git log); with --rev, optional file to tee the streamed log into")
+    parser.add_argument('-r', dest='repo_dir', required=True, help="Path to the .git repository directory")
+    parser.add_argument('-i', dest='issues_file', help="Path to the issues.txt file (id,url)")
+    parser.add_argument('-f', dest='output_file', help="Output file for active-bugs.csv (will append)")
+    # added arguments
+    parser.add_argument('-ru', dest='repo_url', required=True, help="Public repository URL (e.g., https://github.com/org/repo.git)")
+    parser.add_argument('-pid', dest='project_id', help="Project ID (e.g., 'core' or '.')")
+    parser.add_argument('-m', dest='log_format', choices=['auto', 'medium', 'parents'], default='auto',
+                        help="Log format: 'medium' (plain git log), 'parents' (--format=config.GITLOG_FORMAT) or 'auto'")
+    parser.add_argument('-p', dest='projects', nargs=5, action='append',
+                        metavar=('PROJECT_ID', 'SUB_PROJECT_PATH', 'REGEXP', 'ISSUES_FILE', 'OUTPUT_FILE'),
+                        help="Multi-project mode (repeatable): -l must be a --name-only log "
+                             "(--format=config.GITLOG_NAMES_FORMAT); replaces -e/-i/-f/-pid")
+    parser.add_argument('--rev', dest='revision',
+                        help="Stream `git log --reverse <REV>` from -r instead of reading -l (e.g., HEAD or OLD..HEAD)")
+    parser.add_argument('-j', dest='workers', type=int, default=config.XREF_WORKERS,
+                        help="Processes for scanning large cached log files (see D4J_XREF_PARALLEL_MIN_MB)")
+    parser.add_argument('--path', dest='sub_project_path',
+                        help="With --rev in single-project mode: restrict the log to this path (git log -- <path>)")
+
+    args = parser.parse_args()
+
+    if not args.log_file and not args.revision:
+        parser.error("one of -l or --rev is required")
+
+    if args.projects:
+        xref_multi(args)
+    else:
+        missing = [opt for opt, val in (('-e', args.regexp), ('-i', args.issues_file),
+                                        ('-f', args.output_file), ('-pid', args.project_id)) if val is None]
+        if missing:
+            parser.error(f"the following arguments are required: {', '.join(missing)}")
+        xref_single(args)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()